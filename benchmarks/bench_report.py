@@ -0,0 +1,216 @@
+# bench_report.py
+"""
+Runs the real DailyGeneralReport flows headlessly against the local
+stand-ins in benchmarks/fakes.py and reports wall time, API calls and
+peak memory per scale.
+
+    python -m benchmarks.bench_report --accounts 10 100 1000 --sheet-rows 1000 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import DEFAULTS, serve  # noqa: E402
+from utils.metrics import METRICS  # noqa: E402
+
+META_SHEET = 'bench meta'
+RINGBA_SHEET = 'bench ringba'
+TOKENS = ['bench-token-1', 'bench-token-2', 'bench-token-3', 'bench-token-4']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def configure_env(port, args):
+    """Point the cog at the stand-ins; must run before the cog module is imported."""
+    base = f"http://127.0.0.1:{port}"
+    os.environ.update({
+        'META_GRAPH_URL': base,
+        'RINGBA_API_URL': f"{base}/ringba/v2",
+        'RINGBA_ACCOUNT_ID': 'RA-bench',
+        'RINGBA_API_TOKEN': 'bench',
+        'GOOGLE_API_ENDPOINT': base,
+        'GOOGLE_TOKEN_FILE': 'token.json',
+        'SPREADSHEET_ID': 'bench-spreadsheet',
+        'SCRIPT_ID': 'bench-script',
+        'META_SHEET_NAME': META_SHEET,
+        'RINGBA_SHEET_NAME': RINGBA_SHEET,
+        'META_RANGE_NAME': f"{META_SHEET}!A1",
+        'RINGBA_RANGE_NAME': f"{RINGBA_SHEET}!A1",
+        'META_FETCH_MODE': args.meta_mode,
+        'SHEETS_WRITE_MODE': args.write_mode,
+        'META_POLL_MIN_SECONDS': str(args.min_poll),
+        'METRICS_PORT': '0',
+        'ADMIN_USER_IDS': '',
+        'DAILY_REPORT_TIME': '',
+        # A zero-sized response cache evicts on write, so every run hits the stand-ins
+        'CACHE_MAX_MB': os.environ.get('CACHE_MAX_MB', '512') if args.cache else '0',
+    })
+    for i, token in enumerate(TOKENS, start=1):
+        os.environ[f"LI{i}_TOKEN"] = token
+
+
+def get_json(url, method='GET'):
+    request = urllib.request.Request(url, method=method, data=b'' if method == 'POST' else None)
+    with urllib.request.urlopen(request, timeout=600) as resp:
+        return json.loads(resp.read())
+
+
+def wait_for(url, timeout=600):
+    """Wait for the stand-in process; seeding a 1M-row sheet takes a moment."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return get_json(url)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def account_groups(count):
+    """Spread `count` ad accounts over three tokens, like the BM lists."""
+    accounts = [f"act_{100000 + i}" for i in range(count)]
+    return [(accounts[i::3], TOKENS[[0, 2, 3][i]]) for i in range(3)]
+
+
+async def bench_scale(report, port, accounts, sheet_rows, args):
+    base = f"http://127.0.0.1:{port}"
+    config = {
+        'latency': args.latency, 'jitter': args.jitter, 'job_seconds': args.job_seconds,
+        'page_size': args.page_size, 'rows_per_account': args.rows_per_account,
+        'ringba_records': args.ringba_records, 'sheet_rows': sheet_rows,
+        'rows_per_day': args.rows_per_day,
+        'rate_limit': args.rate_limit, 'rate_window': args.rate_window,
+    }
+    server = multiprocessing.Process(
+        target=serve, args=(port, [META_SHEET, RINGBA_SHEET], config), daemon=True
+    )
+    server.start()
+    workdir = tempfile.mkdtemp(prefix='admatchr-bench-')
+    cwd = os.getcwd()
+    results = []
+    try:
+        await asyncio.to_thread(wait_for, f"{base}/_stats")
+        os.chdir(workdir)
+        with open('token.json', 'w') as f:
+            json.dump({
+                'token': 'bench', 'refresh_token': 'bench', 'client_id': 'bench',
+                'client_secret': 'bench', 'expiry': '2099-01-01T00:00:00Z',
+            }, f)
+
+        cog = report.DailyGeneralReport(None)
+        groups = account_groups(accounts)
+        cog.meta_groups = lambda: groups
+        day = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        try:
+            for i in range(args.runs):
+                get_json(f"{base}/_reset", method='POST')
+                METRICS.reset()
+                if tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+                start = time.perf_counter()
+                run = await cog.run_queue.submit(day, 'bench')
+                wall = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+                stats = get_json(f"{base}/_stats")
+                results.append({
+                    'accounts': accounts, 'sheet_rows': sheet_rows,
+                    'run': 'cold' if i == 0 else 'warm', 'wall_s': round(wall, 3),
+                    'api_calls': sum(stats['calls'].values()), 'calls': stats['calls'],
+                    'peak_mb': round(peak / 1024 ** 2, 1) if peak is not None else None,
+                    'meta_rows': run.sheet_rows_meta, 'ringba_rows': run.sheet_rows_ringba,
+                    'sheets_after': stats['sheet_rows'],
+                    'stage_seconds': {k: round(v, 3) for k, v in METRICS.stage_totals().items()},
+                })
+        finally:
+            await cog.cog_unload()
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+        server.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_table(results):
+    header = f"{'accounts':>8} {'sheet rows':>10} {'run':>5} {'wall s':>8} {'calls':>6} {'peak MB':>8}  calls by endpoint"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        by_endpoint = ', '.join(f"{k}={v}" for k, v in sorted(r['calls'].items()))
+        peak = f"{r['peak_mb']:>8}" if r['peak_mb'] is not None else f"{'-':>8}"
+        print(f"{r['accounts']:>8} {r['sheet_rows']:>10} {r['run']:>5} {r['wall_s']:>8} "
+              f"{r['api_calls']:>6} {peak}  {by_endpoint}")
+    print()
+    print("Seconds per stage (summed over concurrent spans):")
+    for r in results:
+        slowest = sorted(r['stage_seconds'].items(), key=lambda kv: -kv[1])[:6]
+        print(f"{r['accounts']:>8} {r['sheet_rows']:>10} {r['run']:>5}  "
+              + ', '.join(f"{k}={v}" for k, v in slowest))
+
+
+async def main(args):
+    port = free_port()
+    configure_env(port, args)
+    import cogs.daily_general_report as report
+
+    if not args.no_memory:
+        tracemalloc.start()
+    results = []
+    for accounts in args.accounts:
+        for sheet_rows in args.sheet_rows:
+            print(f"Benchmarking {accounts} accounts, {sheet_rows} sheet rows...")
+            results.extend(await bench_scale(report, port, accounts, sheet_rows, args))
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--accounts', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--sheet-rows', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--runs', type=int, default=2, help="runs per scale; the first is cold")
+    parser.add_argument('--latency', type=float, default=DEFAULTS['latency'])
+    parser.add_argument('--jitter', type=float, default=DEFAULTS['jitter'])
+    parser.add_argument('--job-seconds', type=float, default=DEFAULTS['job_seconds'])
+    parser.add_argument('--page-size', type=int, default=DEFAULTS['page_size'])
+    parser.add_argument('--rows-per-account', type=int, default=DEFAULTS['rows_per_account'])
+    parser.add_argument('--ringba-records', type=int, default=DEFAULTS['ringba_records'])
+    parser.add_argument('--rows-per-day', type=int, default=DEFAULTS['rows_per_day'])
+    parser.add_argument('--rate-limit', type=int, default=DEFAULTS['rate_limit'],
+                        help="Graph calls per token and window before the stand-in throttles")
+    parser.add_argument('--rate-window', type=float, default=DEFAULTS['rate_window'])
+    parser.add_argument('--meta-mode', choices=['batch', 'async'], default='batch')
+    parser.add_argument('--write-mode', choices=['upsert', 'append'], default='upsert')
+    parser.add_argument('--min-poll', type=float, default=0.2)
+    parser.add_argument('--cache', action='store_true',
+                        help="keep the response cache between runs of a scale")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip tracemalloc, which slows Python-heavy stages down")
+    parser.add_argument('--json', help="also write results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
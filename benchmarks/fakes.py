@@ -0,0 +1,385 @@
+# fakes.py
+"""
+Local stand-ins for the Graph insights API, Ringba /insights, Sheets and
+Apps Script, served from one aiohttp app so a report run can be benchmarked
+without credentials.
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import zlib
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from aiohttp import web
+
+DEFAULTS = {
+    'latency': 0.02,           # seconds added to every request
+    'jitter': 0.01,            # extra uniform random latency
+    'job_seconds': 2.0,        # time for a Graph async job to complete
+    'page_size': 500,          # max rows per Graph page
+    'rows_per_account': 5,     # adsets per ad account and day
+    'ringba_records': 2000,    # Ringba groups per day
+    'sheet_rows': 1000,        # rows pre-filled into each sheet
+    'rows_per_day': 1000,      # pre-filled rows per date partition
+    'rate_limit': 0,           # Graph calls per token and rate_window before throttling (0: no limit)
+    'rate_window': 10.0,       # seconds
+    'seed': 7,
+}
+
+RINGBA_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+GRAPH_PATH = re.compile(r"^/v\d+\.\d+/.+")
+THROTTLED = {'error': {
+    'message': 'User request limit reached', 'type': 'OAuthException',
+    'code': 17, 'error_subcode': 2446079,
+}}
+CELL_RE = re.compile(r"^([A-Z]+)(\d*)$")
+
+
+def parse_range(a1):
+    """(sheet, first_row, last_row or None, column_a_only) for 'name'!A1:Z9 style ranges."""
+    sheet, _, cells = a1.rpartition('!')
+    if sheet.startswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    start, _, end = cells.partition(':')
+    first = CELL_RE.match(start)
+    last = CELL_RE.match(end or start)
+    return (
+        sheet,
+        int(first.group(2) or 1),
+        int(last.group(2)) if last.group(2) else None,
+        first.group(1) == 'A' and last.group(1) == 'A',
+    )
+
+
+def column_index(letters):
+    """A -> 0, Z -> 25, AA -> 26."""
+    index = 0
+    for c in letters:
+        index = index * 26 + ord(c) - 64
+    return index - 1
+
+
+class FakeBackend:
+    """State and handlers shared by every stand-in API."""
+
+    def __init__(self, **config):
+        self.config = dict(DEFAULTS, **config)
+        self.random = random.Random(self.config['seed'])
+        self.calls = Counter()
+        self.jobs = {}
+        self.sheets = {}
+        self.sheet_ids = {}
+        self.graph_calls = {}
+
+    def seed_sheet(self, title, width=11, today=None):
+        """Fill a sheet with `sheet_rows` rows spread over past dates, oldest first."""
+        today = today or datetime.now().date()
+        total = self.config['sheet_rows']
+        per_day = max(1, self.config['rows_per_day'])
+        days = math.ceil(total / per_day)
+        rows = [tuple(['date_start'] + [f"col{i}" for i in range(1, width)])]
+        for d in range(days, 0, -1):
+            day = (today - timedelta(days=d + 1)).strftime('%Y-%m-%d')
+            # A small pool of distinct rows per day keeps 1M-row sheets cheap to hold
+            pool = [tuple([day] + [f"v{j}_{i}" for i in range(1, width)]) for j in range(50)]
+            count = min(per_day, total - (len(rows) - 1))
+            rows.extend(pool[i % len(pool)] for i in range(count))
+        self.sheets[title] = rows
+        self.sheet_ids[title] = len(self.sheet_ids) + 1
+
+    async def delay(self):
+        await asyncio.sleep(self.config['latency'] + self.random.random() * self.config['jitter'])
+
+    def app(self):
+        app = web.Application(client_max_size=1024 ** 3, middlewares=[self.graph_rate_limit])
+        app.router.add_get('/_stats', self.stats)
+        app.router.add_post('/_reset', self.reset)
+        # Graph API (any version prefix)
+        app.router.add_post(r'/{version:v\d+\.\d+}/', self.graph_batch)
+        app.router.add_post(r'/{version:v\d+\.\d+}/{account}/insights', self.graph_submit)
+        app.router.add_get(r'/{version:v\d+\.\d+}/{node}/insights', self.graph_result)
+        app.router.add_get(r'/{version:v\d+\.\d+}/{node}', self.graph_job)
+        app.router.add_get(r'/{version:v\d+\.\d+}/{node}/', self.graph_job)
+        # Ringba
+        app.router.add_post('/ringba/v2/{account}/insights', self.ringba_insights)
+        # Sheets and Apps Script share the Google api_endpoint
+        app.router.add_get('/v4/spreadsheets/{sid}', self.sheets_get)
+        app.router.add_post('/v4/spreadsheets/{sid}:batchUpdate', self.sheets_batch_update)
+        app.router.add_get('/v4/spreadsheets/{sid}/values:batchGet', self.values_batch_get)
+        app.router.add_post('/v4/spreadsheets/{sid}/values:batchUpdate', self.values_batch_update)
+        app.router.add_get('/v4/spreadsheets/{sid}/values/{range}', self.values_get)
+        app.router.add_post('/v4/spreadsheets/{sid}/values/{range}:append', self.values_append)
+        app.router.add_post('/v1/scripts/{script}:run', self.script_run)
+        return app
+
+    # ======================================
+    #  Control
+    # ======================================
+    async def stats(self, request):
+        return web.json_response({
+            'calls': dict(self.calls),
+            'sheet_rows': {title: len(rows) for title, rows in self.sheets.items()},
+        })
+
+    async def reset(self, request):
+        self.calls.clear()
+        self.graph_calls.clear()
+        return web.json_response({})
+
+    # ======================================
+    #  Graph API
+    # ======================================
+    def graph_usage(self, token):
+        """Count one Graph call for a token; percent of its budget used in the current window."""
+        now = time.monotonic()
+        window = self.graph_calls.setdefault(token, deque())
+        while window and window[0] <= now - self.config['rate_window']:
+            window.popleft()
+        window.append(now)
+        return 100.0 * len(window) / self.config['rate_limit']
+
+    def usage_headers(self, percent):
+        """Usage headers shaped like Meta's x-business-use-case-usage."""
+        used = min(100, round(percent))
+        return {'x-business-use-case-usage': json.dumps({'bench-business': [{
+            'type': 'ads_insights', 'call_count': used, 'total_cputime': used // 2,
+            'total_time': used // 2, 'estimated_time_to_regain_access': 0,
+        }]})}
+
+    @web.middleware
+    async def graph_rate_limit(self, request, handler):
+        """Throttle single Graph calls past `rate_limit`; batch items are counted in graph_batch."""
+        if not self.config['rate_limit'] or not GRAPH_PATH.match(request.path):
+            return await handler(request)
+        percent = self.graph_usage(request.query.get('access_token', ''))
+        if percent > 100:
+            await self.delay()
+            self.calls['graph_throttled'] += 1
+            return web.json_response(THROTTLED, status=400, headers=self.usage_headers(percent))
+        response = await handler(request)
+        response.headers.update(self.usage_headers(percent))
+        return response
+
+    def insights_rows(self, account_id, since, until):
+        rows = []
+        day = datetime.strptime(since, '%Y-%m-%d')
+        last = datetime.strptime(until, '%Y-%m-%d')
+        while day <= last:
+            d = day.strftime('%Y-%m-%d')
+            for i in range(self.config['rows_per_account']):
+                spend = round(10 + zlib.crc32(f'{account_id}-{i}'.encode()) % 9000 / 100, 2)
+                rows.append({
+                    'spend': str(spend), 'cpm': '12.5', 'cpc': '0.8',
+                    'adset_name': f"Adset {account_id[-4:]}-{i}",
+                    'cost_per_inline_link_click': '0.91', 'inline_link_click_ctr': '1.7',
+                    'inline_link_clicks': str(int(spend)), 'account_name': f"Account {account_id}",
+                    'video_avg_time_watched_actions': [{'action_type': 'video_view', 'value': '4'}],
+                    'date_start': d, 'date_stop': d,
+                })
+            day += timedelta(days=1)
+        return rows
+
+    def time_range(self, params):
+        tr = json.loads(params.get('time_range', '{}')) if params.get('time_range') else {}
+        today = datetime.now().strftime('%Y-%m-%d')
+        return tr.get('since', today), tr.get('until', today)
+
+    def page(self, request_url, rows, after, limit):
+        """One Graph page with cursor paging, like the real API."""
+        limit = min(limit, self.config['page_size'])
+        chunk = rows[after:after + limit]
+        body = {'data': chunk}
+        if after + limit < len(rows):
+            parts = urlsplit(request_url)
+            query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            query.update({'after': str(after + limit), 'limit': str(limit)})
+            body['paging'] = {
+                'cursors': {'after': str(after + limit)},
+                'next': f"{parts.scheme}://{parts.netloc}{parts.path}?{urlencode(query)}",
+            }
+        return body
+
+    async def graph_batch(self, request):
+        await self.delay()
+        self.calls['graph_batch'] += 1
+        form = await request.post()
+        token = request.query.get('access_token') or form.get('access_token', '')
+        responses = []
+        for item in json.loads(form['batch']):
+            headers = []
+            if self.config['rate_limit']:
+                percent = self.graph_usage(token)
+                headers = [{'name': k, 'value': v} for k, v in self.usage_headers(percent).items()]
+                if percent > 100:
+                    self.calls['graph_throttled'] += 1
+                    responses.append({'code': 400, 'headers': headers, 'body': json.dumps(THROTTLED)})
+                    continue
+            parts = urlsplit(item['relative_url'])
+            path = re.sub(r'^/?v\d+\.\d+/', '', parts.path.lstrip('/'))
+            params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            account_id = path.split('/')[0]
+            rows = self.insights_rows(account_id, *self.time_range(params))
+            base = f"{request.scheme}://{request.host}/{request.match_info['version']}/{account_id}/insights"
+            url = f"{base}?{urlencode({'time_range': params.get('time_range', '')})}"
+            body = self.page(url, rows, 0, int(params.get('limit', 25)))
+            responses.append({'code': 200, 'headers': headers, 'body': json.dumps(body)})
+        return web.json_response(responses)
+
+    async def graph_submit(self, request):
+        await self.delay()
+        self.calls['graph_submit'] += 1
+        params = dict(request.query)
+        params.update(await request.post())
+        job_id = str(len(self.jobs) + 100000)
+        since, until = self.time_range(params)
+        self.jobs[job_id] = {
+            'account': request.match_info['account'], 'since': since, 'until': until,
+            'started': time.monotonic(),
+        }
+        return web.json_response({'report_run_id': job_id})
+
+    async def graph_job(self, request):
+        await self.delay()
+        self.calls['graph_poll'] += 1
+        job = self.jobs.get(request.match_info['node'])
+        if job is None:
+            return web.json_response({'error': {'message': 'Unknown node', 'code': 100}}, status=400)
+        elapsed = time.monotonic() - job['started']
+        done = elapsed >= self.config['job_seconds']
+        percent = 100 if done else int(elapsed / self.config['job_seconds'] * 100)
+        return web.json_response({
+            'id': request.match_info['node'], 'account_id': job['account'],
+            'async_status': 'Job Completed' if done else 'Job Running',
+            'async_percent_completion': percent,
+        })
+
+    async def graph_result(self, request):
+        await self.delay()
+        self.calls['graph_result'] += 1
+        node = request.match_info['node']
+        if node in self.jobs:
+            job = self.jobs[node]
+            rows = self.insights_rows(job['account'], job['since'], job['until'])
+        else:
+            # Next page of a synchronous account insights request
+            rows = self.insights_rows(node, *self.time_range(request.query))
+        after = int(request.query.get('after', 0))
+        return web.json_response(self.page(str(request.url), rows, after, int(request.query.get('limit', 25))))
+
+    # ======================================
+    #  Ringba
+    # ======================================
+    async def ringba_insights(self, request):
+        await self.delay()
+        self.calls['ringba_insights'] += 1
+        body = await request.json()
+        start = datetime.strptime(body['reportStart'], RINGBA_TIME_FORMAT)
+        end = datetime.strptime(body['reportEnd'], RINGBA_TIME_FORMAT)
+        # Groups are spread evenly over the day, so shorter windows return fewer
+        share = ((end - start).total_seconds() + 1) / 86400
+        total = self.config['ringba_records']
+        first = int(total * ((start - start.replace(hour=0, minute=0, second=0)).total_seconds() / 86400))
+        count = min(math.ceil(total * share), body.get('maxResultsPerGroup', 1000))
+        records = [{
+            'campaignName': f"Campaign {i % 20}", 'tag:User:sub5': f"Adset {i:04d}",
+            'publisherName': f"Publisher {i % 7}",
+            'callCount': 3, 'liveCallCount': 0, 'endedCalls': 3, 'connectedCallCount': 2,
+            'payoutCount': 1, 'convertedCalls': 1, 'nonConnectedCallCount': 1,
+            'duplicateCalls': 0, 'blockedCalls': 0, 'incompleteCalls': 0,
+            'earningsPerCallGross': 12.3456, 'conversionAmount': 37.04, 'payoutAmount': 20,
+            'profitGross': 17.04, 'profitMarginGross': 46.0, 'convertedPercent': 33.3,
+            'callLengthInSeconds': '00:04:10', 'avgHandleTime': '00:02:05', 'totalCost': 20,
+        } for i in range(first, first + count)]
+        return web.json_response({'isSuccessful': True, 'report': {'records': records}})
+
+    # ======================================
+    #  Sheets and Apps Script
+    # ======================================
+    def read(self, a1):
+        sheet, first, last, column_a = parse_range(a1)
+        rows = self.sheets.get(sheet, [])
+        last = len(rows) if last is None else min(last, len(rows))
+        selected = rows[first - 1:last]
+        values = [[r[0]] for r in selected] if column_a else [list(r) for r in selected]
+        return {'range': a1, 'majorDimension': 'ROWS', 'values': values}
+
+    async def sheets_get(self, request):
+        await self.delay()
+        self.calls['sheets_get'] += 1
+        return web.json_response({'sheets': [
+            {'properties': {'sheetId': sid, 'title': title}} for title, sid in self.sheet_ids.items()
+        ]})
+
+    async def values_get(self, request):
+        await self.delay()
+        self.calls['values_get'] += 1
+        return web.json_response(self.read(request.match_info['range']))
+
+    async def values_batch_get(self, request):
+        await self.delay()
+        self.calls['values_batch_get'] += 1
+        return web.json_response({'valueRanges': [self.read(r) for r in request.query.getall('ranges')]})
+
+    async def values_append(self, request):
+        await self.delay()
+        self.calls['values_append'] += 1
+        sheet, _, _, _ = parse_range(request.match_info['range'])
+        values = (await request.json()).get('values', [])
+        self.sheets.setdefault(sheet, []).extend(tuple(str(v) for v in r) for r in values)
+        return web.json_response({'updates': {'updatedRows': len(values)}})
+
+    async def values_batch_update(self, request):
+        await self.delay()
+        self.calls['values_batch_update'] += 1
+        updated = 0
+        for value_range in (await request.json()).get('data', []):
+            sheet, first, _, _ = parse_range(value_range['range'])
+            column = CELL_RE.match(value_range['range'].rpartition('!')[2].partition(':')[0]).group(1)
+            start = column_index(column)
+            rows = self.sheets[sheet]
+            for offset, values in enumerate(value_range.get('values', [])):
+                cells = list(rows[first - 1 + offset])
+                cells.extend([''] * (start + len(values) - len(cells)))
+                cells[start:start + len(values)] = [str(v) for v in values]
+                rows[first - 1 + offset] = tuple(cells)
+                updated += len(values)
+        return web.json_response({'totalUpdatedCells': updated})
+
+    async def sheets_batch_update(self, request):
+        await self.delay()
+        self.calls['sheets_batch_update'] += 1
+        titles = {sid: title for title, sid in self.sheet_ids.items()}
+        for req in (await request.json()).get('requests', []):
+            if 'deleteDimension' in req:
+                rng = req['deleteDimension']['range']
+                del self.sheets[titles[rng['sheetId']]][rng['startIndex']:rng['endIndex']]
+            elif 'appendCells' in req:
+                cells = req['appendCells']
+                self.sheets[titles[cells['sheetId']]].extend(
+                    tuple(c.get('userEnteredValue', {}).get('stringValue', '') for c in row['values'])
+                    for row in cells['rows']
+                )
+        return web.json_response({'replies': []})
+
+    async def script_run(self, request):
+        await self.delay()
+        self.calls['script_run'] += 1
+        body = await request.json()
+        day, sheet = body['parameters']
+        rows = self.sheets.get(sheet, [])
+        kept = [r for r in rows if r[0] != day]
+        self.sheets[sheet] = kept
+        return web.json_response({'done': True, 'response': {'result': len(rows) - len(kept)}})
+
+
+def serve(port, sheet_titles, config):
+    """Process entry point: seed the sheets and serve until killed."""
+    backend = FakeBackend(**config)
+    for title in sheet_titles:
+        backend.seed_sheet(title)
+    web.run_app(backend.app(), host='127.0.0.1', port=port, print=None)
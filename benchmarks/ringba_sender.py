@@ -0,0 +1,93 @@
+# ringba_sender.py
+"""
+Stand-in for Ringba's call webhooks: replays a day of calls against the
+bot's receiver as per-call events, one when the call comes in and one
+when it ends with its outcome, posted in shuffled batches.
+
+Each group gets the three calls behind a record of the Ringba /insights
+stand-in in benchmarks.fakes (two connected, one converted), under the
+same campaign, sub5 and publisher names.
+
+    python -m benchmarks.ringba_sender --url http://127.0.0.1:9109/ringba/calls --groups 200
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+
+# (connected, converted, seconds, revenue, payout, cost) of each call in a group
+GROUP_CALLS = (
+    (True, True, 125, 37.04, 20, 20),
+    (True, False, 125, 0, 0, 0),
+    (False, False, 0, 0, 0, 0),
+)
+
+
+def day_events(day, groups):
+    """Start and end events of every call of `groups` groups on a report day (05:00Z to 04:59:59Z)."""
+    opens = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(hours=5)
+    starts, ends = [], []
+    for i in range(groups):
+        key = {
+            'campaignName': f"Campaign {i % 20}", 'tag:User:sub5': f"Adset {i:04d}",
+            'publisherName': f"Publisher {i % 7}",
+        }
+        for n, (connected, converted, seconds, revenue, payout, cost) in enumerate(GROUP_CALLS):
+            call_id = f"CA{day.replace('-', '')}{i:05d}{n}"
+            at = opens + timedelta(seconds=(i * len(GROUP_CALLS) + n) * 86400 // (groups * len(GROUP_CALLS)))
+            starts.append(dict(key, callId=call_id, callDt=int(at.timestamp() * 1000)))
+            ends.append({
+                'callId': call_id, 'ended': True, 'connected': connected, 'converted': converted,
+                'callLengthInSeconds': seconds, 'conversionAmount': revenue,
+                'payoutAmount': payout, 'totalCost': cost,
+            })
+    return starts, ends
+
+
+async def send(session, url, batch, token, pixel):
+    headers = {'X-Webhook-Token': token} if token else {}
+    if not pixel:
+        async with session.post(url, json=batch, headers=headers) as resp:
+            resp.raise_for_status()
+        return
+    for event in batch:
+        params = {k: str(v).lower() if isinstance(v, bool) else str(v) for k, v in event.items()}
+        async with session.get(url, params=params, headers=headers) as resp:
+            resp.raise_for_status()
+
+
+async def main(args):
+    starts, ends = day_events(args.day, args.groups)
+    rng = random.Random(args.seed)
+    rng.shuffle(starts)
+    rng.shuffle(ends)
+    began = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        # Every start goes out before the ends, as calls come in before they finish
+        for events in (starts, ends):
+            batches = [events[i:i + args.batch] for i in range(0, len(events), args.batch)]
+            await asyncio.gather(*(send(session, args.url, b, args.token, args.pixel) for b in batches))
+    elapsed = time.perf_counter() - began
+    revenue = sum(call[3] for call in GROUP_CALLS) * args.groups
+    sent = len(starts) + len(ends)
+    print(f"Sent {sent} events for {len(starts)} calls on {args.day} in {elapsed:.2f}s "
+          f"({sent / elapsed:.0f} events/s); revenue {revenue:.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--url', default="http://127.0.0.1:9109/ringba/calls")
+    parser.add_argument('--token', help="shared secret, as RINGBA_WEBHOOK_TOKEN")
+    parser.add_argument('--day', default=(datetime.now(timezone.utc) - timedelta(hours=5)).strftime("%Y-%m-%d"))
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=50, help="events per POST")
+    parser.add_argument('--pixel', action='store_true', help="send each event as a GET pixel instead")
+    parser.add_argument('--seed', type=int, default=7)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
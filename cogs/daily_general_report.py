@@ -2,31 +2,50 @@
 #  Imports
 # ======================================
 import os
+import io
 import csv
-import random
-import time
 import json
-import hashlib
-import unicodedata
 import asyncio
+from contextlib import aclosing
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
-import aiohttp
-from facebook_business.adobjects.adaccount import AdAccount
-from facebook_business.api import FacebookAdsApi
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 # Local modules
 # from users_access_token import API_ACCESS_TOKENS
+from utils.account_registry import GRAPH_URL, AccountRegistry
 from utils.ad_account_ids import BM1, BM3, BM4
 from utils.body_requests import generate_ringba_insights
+from utils.google_clients import GoogleClientManager
+from utils.history_store import HistorySink, HistoryStore
+from utils.intraday import (
+    META_KEY_COLUMNS, RINGBA_KEY_COLUMNS, IntradayWriter, SnapshotStore, as_cells
+)
+from utils.job_queue import JobQueue, wait_for_jobs
+from utils.matcher import MATCHED_COLUMNS, MatchEngine
+from utils.meta_session import MetaSessionPool
+from utils.meta_settings import (
+    BUSINESS_MANAGERS, LI1_TOKEN, LI2_TOKEN, LI3_TOKEN, LI4_TOKEN, META_FETCH_MODE, META_GRAPH_URL,
+    META_INSIGHTS_FIELDS, META_JOB_MAX_ATTEMPTS, META_MAX_JOBS_PER_TOKEN, META_PAGE_SIZE,
+    META_POLL_MAX_SECONDS, META_POLL_MIN_SECONDS, META_POOL_SIZE, META_RATE_MAX_CALLS,
+    META_RATE_TARGET_PCT, META_THROTTLE_RETRIES
+)
+from utils.metrics import METRICS, MetricsServer
+from utils.response_cache import ResponseCache
+from utils.ringba_calls import CallColumns
+from utils.ringba_client import TIME_FORMAT, RingbaClient, to_number
+from utils.ringba_live import CallAggregator, RingbaWebhookServer
+from utils.row_index import RowIndex
+from utils.rollups import DIMENSIONS, GRAINS, RollupSink, RollupStore
+from utils.run_manifest import RunManifest, backoff_delay, meta_unit
+from utils.row_transform import META_SCHEMA, RINGBA_SCHEMA, clean_string
+from utils.run_queue import RunQueue
+from utils.sheet_upsert import SheetUpserter
+from utils.sinks import BufferedSink, CsvSink, JsonlSink, SinkFanout, SqliteSink
+from utils.streaming import iterate_in_thread
 
 # ======================================
 #  Constants
@@ -41,6 +60,16 @@ APPLICATION_ID    = os.getenv("APPLICATION_ID")
 # Ringba API credentials
 RINGBA_ACCOUNT_ID = os.getenv("RINGBA_ACCOUNT_ID")
 RINGBA_API_TOKEN  = os.getenv("RINGBA_API_TOKEN")
+RINGBA_API_URL    = os.getenv("RINGBA_API_URL", "https://api.ringba.com/v2")
+RINGBA_WINDOWS    = int(os.getenv("RINGBA_WINDOWS", "1"))  # concurrent sub-windows per day; 1 = one request
+
+# Live Ringba call events, aggregated as they arrive; port 0 leaves the receiver off
+RINGBA_WEBHOOK_HOST     = os.getenv("RINGBA_WEBHOOK_HOST", "127.0.0.1")
+RINGBA_WEBHOOK_PORT     = int(os.getenv("RINGBA_WEBHOOK_PORT", "0"))
+RINGBA_WEBHOOK_PATH     = os.getenv("RINGBA_WEBHOOK_PATH", "/ringba/calls")
+RINGBA_WEBHOOK_TOKEN    = os.getenv("RINGBA_WEBHOOK_TOKEN")  # shared secret events must carry
+RINGBA_LIVE_FOLDER      = os.getenv("RINGBA_LIVE_FOLDER", "ringba_live")
+RINGBA_FLUSH_SECONDS    = float(os.getenv("RINGBA_FLUSH_SECONDS", "60"))
 
 # Google Apps Script and Sheets configuration
 SCOPES                  = [
@@ -51,29 +80,78 @@ SPREADSHEET_ID          = os.getenv("SPREADSHEET_ID")
 SCRIPT_ID               = os.getenv("SCRIPT_ID")
 GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "credentials.json")
 GOOGLE_TOKEN_FILE       = os.getenv("GOOGLE_TOKEN_FILE", "token.json")
+GOOGLE_MAX_WORKERS      = int(os.getenv("GOOGLE_MAX_WORKERS", "4"))
+GOOGLE_API_ENDPOINT     = os.getenv("GOOGLE_API_ENDPOINT")  # overrides Sheets/Apps Script host
 
 # File system settings
 INSIGHTS_FOLDER         = os.getenv("INSIGHTS_FOLDER", "insights")
 RINGBA_INSIGHTS_FOLDER  = os.getenv("RINGBA_INSIGHTS_FOLDER", "ringba_insights")
+ROW_INDEX_PATH          = os.getenv("ROW_INDEX_PATH", "sheet_row_index.sqlite3")
+BACKFILL_FOLDER         = os.getenv("BACKFILL_FOLDER", "backfills")
+MATCHED_FOLDER          = os.getenv("MATCHED_FOLDER", "matched")
+HISTORY_FOLDER          = os.getenv("HISTORY_FOLDER", "history")
+CACHE_FOLDER            = os.getenv("CACHE_FOLDER", "cache")
+CACHE_MAX_MB            = int(os.getenv("CACHE_MAX_MB", "512"))
+BACKFILL_CONCURRENCY    = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+REPORT_CONCURRENCY      = int(os.getenv("REPORT_CONCURRENCY", "2"))  # dates running at once
+INTRADAY_FOLDER         = os.getenv("INTRADAY_FOLDER", "intraday")
+RUNS_FOLDER             = os.getenv("RUNS_FOLDER", "runs")  # per-day run manifests and unit payloads
+UNIT_RETRIES            = int(os.getenv("UNIT_RETRIES", "3"))  # retries of a failed account or Ringba fetch
+UNIT_RETRY_BASE_SECONDS = float(os.getenv("UNIT_RETRY_BASE_SECONDS", "2"))
+UNIT_RETRY_MAX_SECONDS  = float(os.getenv("UNIT_RETRY_MAX_SECONDS", "60"))
+
+# "local" fetches in this process; "queue" leaves fetching to fetch_worker.py processes
+FETCH_BACKEND           = os.getenv("FETCH_BACKEND", "local")
+JOB_QUEUE_PATH          = os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3")
+JOB_MAX_ATTEMPTS        = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # worker attempts per queued unit
+JOB_POLL_SECONDS        = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+JOB_WAIT_SECONDS        = float(os.getenv("JOB_WAIT_SECONDS", "3600"))  # give up on units no worker finished
+JOB_REUSE_SECONDS       = float(os.getenv("JOB_REUSE_SECONDS", "900"))  # past days' finished units a rerun picks up
+
+# Built-in daily run: DAILY_REPORT_TIME is "HH:MM" in DAILY_REPORT_TZ; unset disables it
+DAILY_REPORT_TIME       = os.getenv("DAILY_REPORT_TIME")
+DAILY_REPORT_TZ         = os.getenv("DAILY_REPORT_TZ", "UTC")
+DAILY_REPORT_DAYS_AGO   = int(os.getenv("DAILY_REPORT_DAYS_AGO", "1"))
+INTRADAY_MINUTES        = float(os.getenv("INTRADAY_MINUTES", "0"))  # 0 disables the loop
+INTRADAY_HOURS          = os.getenv("INTRADAY_HOURS", "0-23")  # local hours (DAILY_REPORT_TZ) it runs in
+METRICS_HOST            = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT            = int(os.getenv("METRICS_PORT", "9108"))  # 0 disables /metrics
+ADMIN_USER_IDS          = [u for u in os.getenv("ADMIN_USER_IDS", "274730726174490624,836235560107769867").split(",") if u]
 
 # Google Sheets ranges and sheets
 RANGE_NAME_META         = os.getenv("META_RANGE_NAME", "test meta!A1")
 RANGE_NAME_RINGBA       = os.getenv("RINGBA_RANGE_NAME", "test ringba!A1")
 META_SHEET_NAME         = os.getenv("META_SHEET_NAME", "test meta")
 RINGBA_SHEET_NAME       = os.getenv("RINGBA_SHEET_NAME", "test ringba")
+# "upsert" replaces a date's rows with one batchUpdate; "append" uses the Apps Script cleanup
+SHEETS_WRITE_MODE       = os.getenv("SHEETS_WRITE_MODE", "upsert")
 
-# Facebook Business API tokens (loaded from .env)
-LI1_TOKEN = os.getenv("LI1_TOKEN")
-LI2_TOKEN = os.getenv("LI2_TOKEN")
-LI3_TOKEN = os.getenv("LI3_TOKEN")
-LI4_TOKEN = os.getenv("LI4_TOKEN")
+# Report outputs: any of csv, history, sheets, sqlite, jsonl, partner
+OUTPUT_SINKS            = os.getenv("OUTPUT_SINKS", "csv,history,sheets,rollups").split(",")
+SINK_BATCH_SIZE         = int(os.getenv("SINK_BATCH_SIZE", "500"))  # rows per batch
+SINK_QUEUE_SIZE         = int(os.getenv("SINK_QUEUE_SIZE", "8"))  # batches a sink may lag behind
+SHEETS_BATCH_ROWS       = int(os.getenv("SHEETS_BATCH_ROWS", "5000"))  # rows per Sheets write
+ANALYTICS_DB_PATH       = os.getenv("ANALYTICS_DB_PATH", "analytics.sqlite3")
+JSONL_FOLDER            = os.getenv("JSONL_FOLDER", "jsonl")
+ROLLUP_DB_PATH          = os.getenv("ROLLUP_DB_PATH", "rollups.sqlite3")
+ROLLUP_MAX_LINES        = int(os.getenv("ROLLUP_MAX_LINES", "20"))  # table lines shown before attaching a CSV
+PARTNER_SPREADSHEET_ID  = os.getenv("PARTNER_SPREADSHEET_ID")  # unset disables the partner sink
+PARTNER_ROW_INDEX_PATH  = os.getenv("PARTNER_ROW_INDEX_PATH", "partner_row_index.sqlite3")
+PARTNER_META_SHEET      = os.getenv("PARTNER_META_SHEET", META_SHEET_NAME)
+PARTNER_RINGBA_SHEET    = os.getenv("PARTNER_RINGBA_SHEET", RINGBA_SHEET_NAME)
 
+# Facebook Business API tokens (loaded from .env, see utils/meta_settings.py)
 # List them in order so we can index into it
 ACCESS_TOKENS = [LI1_TOKEN, LI2_TOKEN, LI3_TOKEN, LI4_TOKEN]
 
-# Random identifier for temporary files
-random_number = random.randint(100000, 999999)
+ACCOUNT_REGISTRY_PATH   = os.getenv("ACCOUNT_REGISTRY_PATH", "ad_accounts.json")
+ACCOUNT_REFRESH_HOURS   = float(os.getenv("ACCOUNT_REFRESH_HOURS", "6"))  # 0 disables discovery
+EXCLUDED_ACCOUNTS       = os.getenv(
+    "EXCLUDED_ACCOUNTS", "act_1079103783395840,act_418878090721644"
+).split(",")
 
+# Meta fetching (fields, async jobs, paging, rate control) is set in utils/meta_settings.py
+META_STREAM_PAGES       = int(os.getenv("META_STREAM_PAGES", "4"))  # fetched pages waiting for the sinks
 
 class DailyGeneralReport(commands.Cog):
     """
@@ -83,22 +161,252 @@ class DailyGeneralReport(commands.Cog):
 
     def __init__(self, client: commands.Bot):
         self.client = client
-        self.hash_set = set()  # store hashes of existing rows
-        self.new_values_meta = []
-        self.new_values_ringba = []
+        self.row_index = RowIndex(ROW_INDEX_PATH)  # fingerprints of rows already in Sheets
+        self.sheet_upserter = SheetUpserter(self.row_index)
+        self.sheet_locks = {}
+        self.day_locks = {}  # a day's report run and its retries take turns
+        # The partner spreadsheet keeps its own row index, since sheet names may repeat
+        self.partner_index = RowIndex(PARTNER_ROW_INDEX_PATH) if PARTNER_SPREADSHEET_ID else None
+        self.partner_upserter = SheetUpserter(self.partner_index) if self.partner_index else None
+        self.intraday = SnapshotStore(INTRADAY_FOLDER)  # last rows written per sheet and day
+        self.intraday_writer = IntradayWriter(self.row_index, self.sheet_upserter)
+        self.intraday_lock = asyncio.Lock()
+        self.history = HistoryStore(HISTORY_FOLDER)
+        self.rollups = RollupStore(ROLLUP_DB_PATH)  # week and month totals of the daily reports
+        self.cache = ResponseCache(CACHE_FOLDER, max_bytes=CACHE_MAX_MB * 1024 * 1024)
+        # Running Ringba totals from call events, when the webhook receiver is on
+        self.ringba_live = CallAggregator(RINGBA_LIVE_FOLDER) if RINGBA_WEBHOOK_PORT else None
+        self.ringba_webhook = RingbaWebhookServer(
+            self.ringba_live, RINGBA_WEBHOOK_HOST, RINGBA_WEBHOOK_PORT,
+            RINGBA_WEBHOOK_PATH, RINGBA_WEBHOOK_TOKEN
+        ) if self.ringba_live else None
+        self.ringba = RingbaClient(
+            RINGBA_ACCOUNT_ID, RINGBA_API_TOKEN,
+            windows=RINGBA_WINDOWS, base_url=RINGBA_API_URL
+        )
+        self.google = GoogleClientManager(
+            GOOGLE_TOKEN_FILE, GOOGLE_CREDENTIALS_FILE, SCOPES,
+            max_workers=GOOGLE_MAX_WORKERS, api_endpoint=GOOGLE_API_ENDPOINT
+        )
+        self.meta_sessions = MetaSessionPool(
+            pool_size=META_POOL_SIZE, graph_url=META_GRAPH_URL,
+            rate_options={'target': META_RATE_TARGET_PCT, 'max_limit': META_RATE_MAX_CALLS},
+            max_throttle_retries=META_THROTTLE_RETRIES
+        )
+        # Fetch units shared with the worker processes, when they do the fetching
+        self.jobs = JobQueue(JOB_QUEUE_PATH) if FETCH_BACKEND == 'queue' else None
+        self.run_queue = RunQueue(self.run_report, limit=REPORT_CONCURRENCY)
+        self.accounts = AccountRegistry(ACCOUNT_REGISTRY_PATH, BUSINESS_MANAGERS, EXCLUDED_ACCOUNTS)
+        # Until the first discovery, fall back to the checked-in account lists
+        self.accounts.load(seed={"BM1": BM1, "BM3": BM3, "BM4": BM4})
+        self.metrics_server = MetricsServer(METRICS, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+
+    async def cog_load(self):
+        """
+        Start the metrics endpoint, account discovery and, when configured,
+        the Ringba webhook receiver and the daily and intraday runs.
+        """
+        if ACCOUNT_REFRESH_HOURS:
+            self.refresh_accounts.change_interval(hours=ACCOUNT_REFRESH_HOURS)
+            self.refresh_accounts.start()
+        if self.metrics_server:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                print(f"Metrics endpoint not started: {e}")
+        if self.ringba_webhook:
+            await asyncio.to_thread(self.ringba_live.load)
+            try:
+                await self.ringba_webhook.start()
+            except OSError as e:
+                print(f"Ringba webhook receiver not started: {e}")
+            self.flush_ringba_live.change_interval(seconds=RINGBA_FLUSH_SECONDS)
+            self.flush_ringba_live.start()
+        if DAILY_REPORT_TIME:
+            hour, minute = (int(p) for p in DAILY_REPORT_TIME.split(':'))
+            at = datetime.now(ZoneInfo(DAILY_REPORT_TZ)).replace(hour=hour, minute=minute).timetz()
+            self.daily_report.change_interval(time=at.replace(second=0, microsecond=0))
+            self.daily_report.start()
+        if INTRADAY_MINUTES:
+            self.intraday_refresh.change_interval(minutes=INTRADAY_MINUTES)
+            self.intraday_refresh.start()
+
+    async def cog_unload(self):
+        """Stop the daily run and release pooled API connections."""
+        self.daily_report.cancel()
+        self.intraday_refresh.cancel()
+        self.refresh_accounts.cancel()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.ringba_webhook:
+            self.flush_ringba_live.cancel()
+            await self.ringba_webhook.stop()
+            await asyncio.to_thread(self.ringba_live.flush)
+        await self.ringba.close()
+        self.meta_sessions.close()
+        self.row_index.close()
+        if self.partner_index:
+            self.partner_index.close()
+        self.rollups.close()
+        if self.jobs:
+            self.jobs.close()
+        self.cache.close()
+        self.google.close()
 
     # ======================================
     #  Generic Methods
     # ======================================
-    async def fetch_insights(self, since, until, access_token, adaccounts):
-        """Fetch insights in a background thread."""
-        try:
-            return await asyncio.to_thread(
-                self.get_insights, since, until, access_token, adaccounts
+    async def fetch_insights(self, since, until, groups, time_increment=None):
+        """Fetch Meta insights for every (accounts, token) group concurrently."""
+        results = await self.fetch_account_results(since, until, groups, time_increment)
+        insights_data = []
+        for account_id, rows in results.items():
+            insights_data.extend(self.get_insights(account_id, rows))
+        return insights_data
+
+    async def fetch_account_results(self, since, until, groups, time_increment=None, use_cache=True, errors=None):
+        """
+        Raw Meta insights results per account id; accounts that failed are
+        left out, with their last error in `errors` when a dict is given.
+        """
+        errors = {} if errors is None else errors
+        params = {
+            'time_range': {'since': since, 'until': until},
+            'filtering': [], 'level': 'adset', 'breakdowns': []
+        }
+        if time_increment:
+            params['time_increment'] = time_increment
+        cache_body = {'fields': META_INSIGHTS_FIELDS, 'params': params}
+        pending = [(acct, token) for accounts, token in groups for acct in accounts]
+
+        # Settled days are served from the response cache
+        results = {}
+        if use_cache:
+            results = await asyncio.to_thread(self.cached_meta, pending, since, until, cache_body)
+        pending = [(acct, token) for acct, token in pending if acct not in results]
+        cached = set(results)
+
+        if self.jobs is not None:
+            async for account_id, rows, error in self.queued_meta(pending, params):
+                if rows is None:
+                    print(f"Meta queued fetch error for {account_id}: {error}")
+                    errors[account_id] = str(error)
+                else:
+                    results[account_id] = rows
+            pending = []
+        elif META_FETCH_MODE == 'batch':
+            # Only the accounts the cache missed, regrouped by token
+            by_token = {}
+            for acct, token in pending:
+                by_token.setdefault(token, []).append(acct)
+            batches = await asyncio.gather(*(
+                asyncio.to_thread(
+                    self.meta_sessions.get(token).fetch_insights_batch,
+                    accounts, META_INSIGHTS_FIELDS, params
+                )
+                for token, accounts in by_token.items()
+            ), return_exceptions=True)
+            for accounts, batch in zip(by_token.values(), batches):
+                if isinstance(batch, Exception):
+                    print(f"Meta batch error: {batch}")
+                    errors.update(dict.fromkeys(accounts, str(batch)))
+                    continue
+                fetched, batch_errors = batch
+                results.update(fetched)
+                for account_id, error in batch_errors.items():
+                    print(f"Meta batch error for {account_id}: {error}")
+                    errors[account_id] = str(error)
+            # Anything the batch path could not fetch falls back to async jobs
+            pending = [(acct, token) for acct, token in pending if acct not in results]
+
+        if pending:
+            # Deferred: only the async job fallback needs the job machinery
+            from utils.meta_jobs import MetaJobScheduler
+
+            scheduler = MetaJobScheduler(
+                META_INSIGHTS_FIELDS, params,
+                api_for_token=self.meta_sessions.api,
+                max_in_flight=META_MAX_JOBS_PER_TOKEN,
+                min_poll=META_POLL_MIN_SECONDS,
+                max_poll=META_POLL_MAX_SECONDS,
+                max_attempts=META_JOB_MAX_ATTEMPTS,
             )
-        except Exception as e:
-            print(f"Error fetching insights: {e}")
-            return []
+            for job in await scheduler.run(pending):
+                if job.results is not None:
+                    results[job.account_id] = job.results
+                else:
+                    errors[job.account_id] = str(job.error)
+        for account_id in results:
+            errors.pop(account_id, None)
+
+        if use_cache:
+            fetched = {acct: rows for acct, rows in results.items() if acct not in cached}
+            await asyncio.to_thread(self.store_meta, fetched, since, until, cache_body)
+        return results
+
+    def cached_meta(self, accounts, since, until, body):
+        """Cached Meta results per account for this request."""
+        hits = {}
+        for account_id, _ in accounts:
+            payload = self.cache.get('meta', account_id, since, until, body)
+            if payload is not None:
+                hits[account_id] = payload
+        return hits
+
+    def store_meta(self, results, since, until, body):
+        for account_id, rows in results.items():
+            self.cache.put('meta', account_id, since, until, body, rows)
+
+    async def queued_meta(self, accounts, params):
+        """
+        Enqueue one fetch unit per (account_id, token) for the worker
+        processes and yield (account_id, rows, error) as each finishes;
+        rows is None for a unit that failed.
+        """
+        labels = {token: label for label, token in BUSINESS_MANAGERS.items()}
+        payloads = [
+            {'account_id': account_id, 'business_manager': labels.get(token),
+             'fields': META_INSIGHTS_FIELDS, 'params': params}
+            for account_id, token in accounts
+        ]
+        # Only results for past days may be reused; today's keep changing
+        settled = params['time_range']['until'] < datetime.now(ZoneInfo(DAILY_REPORT_TZ)).strftime("%Y-%m-%d")
+        ids = await asyncio.to_thread(
+            self.jobs.enqueue_many, 'meta_insights', payloads, JOB_MAX_ATTEMPTS,
+            JOB_REUSE_SECONDS if settled else 0
+        )
+        account_of = {job_id: account_id for job_id, (account_id, _) in zip(ids, accounts)}
+        jobs = wait_for_jobs(self.jobs, list(account_of), JOB_POLL_SECONDS, JOB_WAIT_SECONDS)
+        async with aclosing(jobs):
+            async for job_id, status, error in jobs:
+                rows = await asyncio.to_thread(self.jobs.result, job_id) if status == 'done' else None
+                yield account_of[job_id], rows, error
+
+    async def queued_ringba(self, start, end):
+        """Enqueue a Ringba fetch as one unit per window for the worker processes and merge the results."""
+        payloads = [
+            {'start': ws.strftime(TIME_FORMAT), 'end': we.strftime(TIME_FORMAT)}
+            for ws, we in self.ringba.window_bounds(start, end)
+        ]
+        settled = datetime.strptime(end, TIME_FORMAT) < datetime.now(ZoneInfo("UTC")).replace(tzinfo=None)
+        ids = await asyncio.to_thread(
+            self.jobs.enqueue_many, 'ringba_window', payloads, JOB_MAX_ATTEMPTS,
+            JOB_REUSE_SECONDS if settled else 0
+        )
+        parts = {}
+        jobs = wait_for_jobs(self.jobs, ids, JOB_POLL_SECONDS, JOB_WAIT_SECONDS)
+        async with aclosing(jobs):
+            async for job_id, status, error in jobs:
+                if status != 'done':
+                    print(f"Ringba window job {job_id} failed: {error}")
+                    return {'isSuccessful': False, 'message': error}
+                parts[job_id] = await asyncio.to_thread(self.jobs.result, job_id)
+        return self.ringba.combine([parts[job_id] for job_id in ids])
+
+    def meta_groups(self):
+        """Ad accounts grouped by the token that fetches them, from the account registry."""
+        self.accounts.reload_if_changed()
+        return self.accounts.groups()
 
     async def send_private_message(self, user_id: str, message: str):
         """Send a direct message to a user by ID."""
@@ -111,269 +419,903 @@ class DailyGeneralReport(commands.Cog):
     # ======================================
     #  External Clients
     # ======================================
-    def get_insights(self, since, until, access_token, adaccounts):
-        """Retrieve adset insights from Meta API asynchronously."""
-        fields = [
-            'spend', 'cpm', 'cpc', 'adset_name',
-            'cost_per_inline_link_click', 'inline_link_click_ctr',
-            'inline_link_clicks', 'account_name',
-            'video_avg_time_watched_actions'
-        ]
+    def get_insights(self, account_id, results):
+        """Convert one account's Meta insights results into report rows."""
         insights_data = []
+        publisher = self.accounts.publisher(account_id)
+        for item in results:
+            avg_playtime = ''
+            video_stats = item.get('video_avg_time_watched_actions', [])
+            if video_stats:
+                avg_playtime = video_stats[0].get('value', '')
 
-        for account_id in adaccounts:
-            print(f"Processing Meta account ID: {account_id}")
-            params = {
-                'time_range': {'since': since, 'until': until},
-                'filtering': [], 'level': 'adset', 'breakdowns': []
-            }
-            try:
-                FacebookAdsApi.init(access_token=access_token)
-                job = AdAccount(account_id).get_insights_async(fields=fields, params=params)
-                async_job = job.api_get()
-                while async_job['async_status'] != 'Job Completed':
-                    async_job = job.api_get()
-                results = job.get_result()
-
-                for item in results:
-                    publisher = (
-                        'BM1' if account_id in BM1 else
-                        'BM3' if account_id in BM3 else
-                        'BM4' if account_id in BM4 else ''
-                    )
-                    avg_playtime = ''
-                    video_stats = item.get('video_avg_time_watched_actions', [])
-                    if video_stats:
-                        avg_playtime = video_stats[0].get('value', '')
-
-                    insights_data.append({
-                        'date_start': item['date_start'],
-                        'date_stop': item['date_stop'],
-                        'account_name': item['account_name'],
-                        'publisher': publisher,
-                        'adset_name': item['adset_name'],
-                        'cpc_link': item.get('cost_per_inline_link_click', ''),
-                        'ctr_link': item.get('inline_link_click_ctr', ''),
-                        'inline_link_click': item.get('inline_link_clicks', ''),
-                        'cpm': item.get('cpm', ''),
-                        'spend': item['spend'],
-                        'avg_playtime': avg_playtime,
-                    })
-            except Exception as e:
-                print(f"Meta API error for {account_id}: {e}")
-
+            insights_data.append({
+                'date_start': item['date_start'],
+                'date_stop': item['date_stop'],
+                'account_name': item['account_name'],
+                'publisher': publisher,
+                'adset_name': item['adset_name'],
+                'cpc_link': item.get('cost_per_inline_link_click', ''),
+                'ctr_link': item.get('inline_link_click_ctr', ''),
+                'inline_link_click': item.get('inline_link_clicks', ''),
+                'cpm': item.get('cpm', ''),
+                'spend': item['spend'],
+                'avg_playtime': avg_playtime,
+            })
         return insights_data
 
     async def run_apps_script(self, sheet_name, date_start):
         """Execute Google Apps Script function to delete rows by date."""
-        creds = None
-        if os.path.exists(GOOGLE_TOKEN_FILE):
-            creds = Credentials.from_authorized_user_file(GOOGLE_TOKEN_FILE, SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                await asyncio.to_thread(creds.refresh, Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(GOOGLE_CREDENTIALS_FILE, SCOPES)
-                creds = await asyncio.to_thread(flow.run_local_server, port=0)
-            with open(GOOGLE_TOKEN_FILE, 'w') as f:
-                f.write(creds.to_json())
-
         try:
-            service = build('script', 'v1', credentials=creds)
             request = {"function": "deleteRowsByDate", "parameters": [date_start, sheet_name]}
-            response = await asyncio.to_thread(
-                service.scripts().run(body=request, scriptId=SCRIPT_ID).execute
-            )
+            with METRICS.span('apps_script_cleanup', sheet=sheet_name):
+                response = await self.google.execute(
+                    'script', lambda service: service.scripts().run(body=request, scriptId=SCRIPT_ID)
+                )
             print("Apps Script executed successfully", response)
             return response
         except Exception as e:
             print(f"Apps Script error: {e}")
             return None
 
-    async def post_ringba_insights(self, session, body):
-        """Send insights request to Ringba API and save JSON response."""
-        url = f"https://api.ringba.com/v2/{RINGBA_ACCOUNT_ID}/insights"
-        headers = {"Authorization": f"Token {RINGBA_API_TOKEN}"}
-        async with session.post(url, json=body, headers=headers) as resp:
-            data = await resp.json()
-            with open('response.json', 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-            print("Ringba response JSON saved")
-            return data
+    async def post_ringba_insights(self, start, end):
+        """Fetch Ringba insights for a window and save the merged JSON response."""
+        with METRICS.span('ringba_fetch'):
+            if self.jobs is not None:
+                data = await self.queued_ringba(start, end)
+            else:
+                data = await self.ringba.fetch_insights(start, end)
+        await asyncio.to_thread(self.save_json, data, 'response.json')
+        print("Ringba response JSON saved")
+        return data
+
+    def save_json(self, data, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+
+    async def fetch_ringba(self, since, use_cache=True):
+        """Request the Ringba insights report for one day (05:00Z to 04:59:59Z)."""
+        tomorrow = datetime.strptime(since, "%Y-%m-%d") + timedelta(days=1)
+        start = f"{since}T05:00:00Z"
+        end = tomorrow.strftime("%Y-%m-%dT04:59:59Z")
+        if not use_cache:
+            return await self.post_ringba_insights(start, end)
+        body = generate_ringba_insights(start_date=start, end_date=end)
+        cached = await asyncio.to_thread(
+            self.cache.get, 'ringba', RINGBA_ACCOUNT_ID, since, since, body
+        )
+        if cached is not None:
+            print(f"Ringba insights for {since} served from cache")
+            return cached
+        data = await self.post_ringba_insights(start, end)
+        if data.get('isSuccessful'):
+            await asyncio.to_thread(
+                self.cache.put, 'ringba', RINGBA_ACCOUNT_ID, since, since, body, data
+            )
+        return data
 
     # ======================================
     #  Utilities
     # ======================================
-    def clean_string(self, text):
-        """Remove accents and replace spaces with underscores."""
-        return ''.join(c for c in unicodedata.normalize('NFD', text)
-                       if unicodedata.category(c) != 'Mn').replace(' ', '_')
+    def report_sinks(self, source, day):
+        """The OUTPUT_SINKS for one source and day, in the order configured."""
+        if source == 'meta':
+            csv_path = os.path.join(INSIGHTS_FOLDER, f"general_report_{day}.csv")
+            sheet_name, range_name, partner_sheet = META_SHEET_NAME, RANGE_NAME_META, PARTNER_META_SHEET
+        else:
+            csv_path = os.path.join(RINGBA_INSIGHTS_FOLDER, f"ringba_insights_report_{day}.csv")
+            sheet_name, range_name, partner_sheet = RINGBA_SHEET_NAME, RANGE_NAME_RINGBA, PARTNER_RINGBA_SHEET
+        factories = {
+            'csv': lambda: CsvSink('csv', csv_path),
+            'history': lambda: HistorySink('history', self.history, source, day),
+            'sheets': lambda: BufferedSink(
+                'sheets', lambda header, rows, first: self.update_sheet(
+                    [header] + [as_cells(r) for r in rows], sheet_name, range_name, replace=first
+                ), batch_size=SHEETS_BATCH_ROWS
+            ),
+            'sqlite': lambda: SqliteSink('sqlite', ANALYTICS_DB_PATH, f"{source}_insights", day),
+            'jsonl': lambda: JsonlSink('jsonl', os.path.join(JSONL_FOLDER, f"{source}_{day}.jsonl")),
+            'rollups': lambda: RollupSink('rollups', self.rollups, source, day),
+        }
+        if self.partner_upserter:
+            factories['partner'] = lambda: BufferedSink(
+                'partner', lambda header, rows, first: self.update_partner_sheet(
+                    [header] + [as_cells(r) for r in rows], partner_sheet, replace=first
+                ), batch_size=SHEETS_BATCH_ROWS
+            )
+        return [factories[name]() for name in OUTPUT_SINKS if name in factories]
 
-    def time_to_seconds(self, time_str):
-        """Convert HH:MM:SS to total seconds."""
+    async def publish_report(self, source, day, records):
+        """
+        Publish a day's report rows to every sink once. `records` is a list,
+        or an async iterable of record pages that are published as they
+        arrive. Returns {sink name: result or exception}.
+        """
+        schema = META_SCHEMA if source == 'meta' else RINGBA_SCHEMA
+        fanout = SinkFanout(
+            self.report_sinks(source, day), schema.header,
+            batch_size=SINK_BATCH_SIZE, queue_size=SINK_QUEUE_SIZE
+        )
+        fanout.start()
+        count = 0
         try:
-            t = datetime.strptime(time_str, '%H:%M:%S')
-            return t.hour * 3600 + t.minute * 60 + t.second
-        except ValueError:
-            return 0
-
-    def truncate(self, number, decimals=0):
-        """Truncate float to specified decimals."""
-        factor = 10 ** decimals
-        return int(number * factor) / factor
-
-    def save_insights_to_csv_meta(self, data, since, file_name="general_report.csv"):
-        """Save Meta insights to CSV file."""
-        os.makedirs(INSIGHTS_FOLDER, exist_ok=True)
-        path = os.path.join(INSIGHTS_FOLDER, file_name)
-        if not data:
-            print("No Meta data to save.")
-            return None
-        cols = ['date_start','date_stop','account_name','publisher','adset_name',
-                'cpc_link','ctr_link','inline_link_click','cpm','spend','avg_playtime']
-        with open(path, 'w', newline='', encoding='utf-8') as csvf:
-            w = csv.writer(csvf)
-            w.writerow(cols)
-            for row in data:
-                row['adset_name'] = self.clean_string(row['adset_name'])
-                w.writerow([row.get(c, '-no value-') for c in cols])
-        print(f"Meta CSV generated at {path}")
-        return path
+            if hasattr(records, '__aiter__'):
+                async for page in records:
+                    await fanout.publish(schema.rows(page, since=day))
+                    count += len(page)
+            else:
+                await fanout.publish(schema.rows(records, since=day))
+                count = len(records)
+        except BaseException:
+            await fanout.abort()
+            raise
+        results = await fanout.finish()
+        METRICS.inc('rows', count, stage='publish', source=source)
+        return results
 
-    def save_insights_to_csv_ringba(self, response_json, since, file_name="ringba_insights_report.csv"):
-        """Save Ringba insights records to CSV."""
-        os.makedirs(RINGBA_INSIGHTS_FOLDER, exist_ok=True)
-        path = os.path.join(RINGBA_INSIGHTS_FOLDER, file_name)
-        records = response_json.get('report', {}).get('records', [])
-        if not records:
-            print("No Ringba records to save.")
-            return None
-        cols = ["date_start","date_stop","callCount","liveCallCount","endedCalls","connectedCallCount",
-                "payoutCount","convertedCalls","nonConnectedCallCount","duplicateCalls",
-                "blockedCalls","incompleteCalls","earningsPerCallGross","conversionAmount",
-                "payoutAmount","profitGross","profitMarginGross","convertedPercent",
-                "callLengthInSeconds","avgHandleTime","totalCost","publisherName",
-                "tag:User:sub5","campaignName"]
-        with open(path, 'w', newline='', encoding='utf-8') as csvf:
-            w = csv.writer(csvf)
-            w.writerow(cols)
-            for rec in records:
-                rec['callLengthInSeconds'] = self.time_to_seconds(rec.get('callLengthInSeconds', '00:00:00'))
-                rec['avgHandleTime'] = self.time_to_seconds(rec.get('avgHandleTime', '00:00:00'))
-                rec['earningsPerCallGross'] = self.truncate(float(rec.get('earningsPerCallGross',0)),3)
-                rec['tag:User:sub5'] = self.clean_string(rec.get('tag:User:sub5',''))
-                rec['date_start'] = since
-                rec['date_stop'] = since
-                w.writerow([rec.get(col, '-no value-') for col in cols])
-        print(f"Ringba CSV generated at {path}")
-        return path
+    def report_messages(self, label, count, path, results):
+        """Run summary lines for one published report."""
+        if not count:
+            return [f"No {label} insights to save."]
+        written = [name for name, result in results.items() if not isinstance(result, Exception)]
+        messages = [f"{label} insights saved to {path}." if path
+                    else f"{label} insights written to {', '.join(written) or 'no outputs'}."]
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                messages.append(f"{label} {name} output failed: {result}")
+        return messages
 
-    async def get_existing_data(self, service):
-        """Fetch existing rows from Google Sheets."""
-        res = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME_META+':Z'
-        ).execute()
-        return set(tuple(r) for r in res.get('values', []))
+    async def get_new_rows(self, sheet_name, rows):
+        """Return CSV rows not yet in the sheet, checked against the local row index."""
+        with METRICS.span('sheet_read', sheet=sheet_name):
+            await self.google.call(
+                'sheets', lambda service: self.row_index.sync(service, SPREADSHEET_ID, sheet_name)
+            )
+        with METRICS.span('dedup', sheet=sheet_name):
+            return await asyncio.to_thread(self.row_index.filter_new, sheet_name, rows)
+
+    async def upsert_sheet(self, sheet_name, rows, spreadsheet_id=SPREADSHEET_ID, upserter=None, replace=True):
+        """Replace the CSV's date partitions in the sheet with one batchUpdate, or add to them."""
+        header, data = rows[0], rows[1:]
+        upserter = upserter or self.sheet_upserter
+        with METRICS.span('sheet_upsert', sheet=sheet_name):
+            await self.google.call(
+                'sheets', lambda service: upserter.upsert(
+                    service, spreadsheet_id, sheet_name, header, data, replace
+                )
+            )
+        METRICS.inc('rows', len(data), stage='sheet_write', sheet=sheet_name)
+        return data
 
-    async def get_existing_data_ringba(self, service):
-        """Fetch existing Ringba rows from Google Sheets."""
-        res = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME_RINGBA+':Z'
-        ).execute()
-        return set(tuple(r) for r in res.get('values', []))
+    async def append_sheet(self, sheet_name, range_name, rows):
+        """Append the CSV rows the sheet does not have yet."""
+        new_rows = await self.get_new_rows(sheet_name, rows)
+        if new_rows:
+            with METRICS.span('sheet_append', sheet=sheet_name):
+                await self.google.execute('sheets', lambda service: service.spreadsheets().values().append(
+                    spreadsheetId=SPREADSHEET_ID, range=range_name,
+                    valueInputOption='RAW', insertDataOption='INSERT_ROWS', body={'values': new_rows}
+                ))
+            self.row_index.record_append(sheet_name, new_rows)
+            METRICS.inc('rows', len(new_rows), stage='sheet_write', sheet=sheet_name)
+        return new_rows
 
     # ======================================
     #  Flows
     # ======================================
-    async def update_google_sheets(self, file_path):
-        """Append new Meta CSV rows to Google Sheets."""
-        creds = None
-        if os.path.exists(GOOGLE_TOKEN_FILE):
-            creds = Credentials.from_authorized_user_file(GOOGLE_TOKEN_FILE, SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
+    async def update_sheet(self, rows, sheet_name, range_name, replace=True):
+        """
+        Write report rows (header first) to their sheet; returns the data
+        rows written. Upserts replace the rows' days unless `replace` is
+        False, for the later batches of one report.
+        """
+        if len(rows) < 2:
+            return []
+        # Writes shift row positions, so one sheet takes one write at a time
+        async with self.sheet_locks.setdefault(sheet_name, asyncio.Lock()):
+            # The intraday snapshots of these days no longer describe the sheet
+            for day in {row[0] for row in rows[1:] if row}:
+                await asyncio.to_thread(self.intraday.invalidate, sheet_name, day)
+            if SHEETS_WRITE_MODE == 'upsert':
+                written = await self.upsert_sheet(sheet_name, rows, replace=replace)
             else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    GOOGLE_CREDENTIALS_FILE, SCOPES
-                )
-                creds = flow.run_local_server(port=0)
-            with open(GOOGLE_TOKEN_FILE, 'w') as f:
-                f.write(creds.to_json())
+                written = await self.append_sheet(sheet_name, range_name, rows)
+        print(f"Wrote {len(written)} rows to '{sheet_name}'.")
+        return written
 
-        try:
-            service = build('sheets', 'v4', credentials=creds)
-            existing = await self.get_existing_data(service)
-            new_rows = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                for r in reader:
-                    if tuple(r) not in existing:
-                        new_rows.append(r)
-            if new_rows:
-                service.spreadsheets().values().append(
-                    spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME_META,
-                    valueInputOption='RAW', insertDataOption='INSERT_ROWS', body={'values': new_rows}
-                ).execute()
-                print(f"Appended {len(new_rows)} new Meta rows.")
-                self.new_values_meta = new_rows
-        except HttpError as e:
-            print(f"Error updating Meta sheets: {e}")
-
-    async def update_google_sheets_ringba(self, file_path):
-        """Append new Ringba CSV rows to Google Sheets."""
-        creds = None
-        if os.path.exists(GOOGLE_TOKEN_FILE):
-            creds = Credentials.from_authorized_user_file(GOOGLE_TOKEN_FILE, SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    GOOGLE_CREDENTIALS_FILE, SCOPES
-                )
-                creds = flow.run_local_server(port=0)
-            with open(GOOGLE_TOKEN_FILE, 'w') as f:
-                f.write(creds.to_json())
+    async def update_partner_sheet(self, rows, sheet_name, replace=True):
+        """Replace the rows' days in the partner spreadsheet, which is always upserted."""
+        async with self.sheet_locks.setdefault(('partner', sheet_name), asyncio.Lock()):
+            written = await self.upsert_sheet(
+                sheet_name, rows, PARTNER_SPREADSHEET_ID, self.partner_upserter, replace
+            )
+        print(f"Wrote {len(written)} rows to partner sheet '{sheet_name}'.")
+        return written
+
+    async def stream_meta_pages(self, day, groups, errors):
+        """
+        Yield (account_id, raw rows) per insights result page for one day of
+        every account in `groups`, as pages arrive. Cached accounts come
+        first; batch requests (or async jobs, per META_FETCH_MODE) fetch the
+        rest, and accounts the batch path could not start fall back to async
+        jobs; with the queue backend the fetch workers fetch them and each
+        account's rows are paged out once its unit is done. At most
+        META_STREAM_PAGES pages wait for the consumer.
+        Accounts that failed are left in `errors`.
+        """
+        params = {
+            'time_range': {'since': day, 'until': day},
+            'filtering': [], 'level': 'adset', 'breakdowns': []
+        }
+        cache_body = {'fields': META_INSIGHTS_FIELDS, 'params': params}
+        pages = asyncio.Queue(maxsize=META_STREAM_PAGES)
+        started, done, collected = set(), set(), {}
+
+        async def emit(account_id, rows):
+            started.add(account_id)
+            collected.setdefault(account_id, []).extend(rows)
+            await pages.put((account_id, rows))
+
+        async def finish(account_id):
+            done.add(account_id)
+            errors.pop(account_id, None)
+            # An account is cached whole, once its last page is out
+            rows = collected.pop(account_id, [])
+            await asyncio.to_thread(self.cache.put, 'meta', account_id, day, day, cache_body, rows)
+
+        def fail(account_id, error):
+            collected.pop(account_id, None)
+            errors[account_id] = error
+
+        async def batch_group(accounts, token):
+            session = self.meta_sessions.get(token)
+            events = iterate_in_thread(
+                lambda: session.iter_insights_batch(
+                    accounts, META_INSIGHTS_FIELDS, params, page_size=META_PAGE_SIZE
+                ),
+                queue_size=META_STREAM_PAGES
+            )
+            async with aclosing(events):
+                async for kind, account_id, value in events:
+                    if kind == 'rows':
+                        await emit(account_id, value)
+                    elif kind == 'done':
+                        await finish(account_id)
+                    else:
+                        print(f"Meta batch error for {account_id}: {value}")
+                        fail(account_id, value)
 
+        async def produce():
+            pending = []
+            try:
+                for accounts, token in groups:
+                    for account_id in accounts:
+                        cached = await asyncio.to_thread(
+                            self.cache.get, 'meta', account_id, day, day, cache_body
+                        )
+                        if cached is None:
+                            pending.append((account_id, token))
+                            continue
+                        done.add(account_id)
+                        for i in range(0, len(cached), META_PAGE_SIZE):
+                            await pages.put((account_id, cached[i:i + META_PAGE_SIZE]))
+
+                if self.jobs is not None:
+                    async for account_id, rows, error in self.queued_meta(pending, params):
+                        if rows is None:
+                            print(f"Meta queued fetch error for {account_id}: {error}")
+                            fail(account_id, str(error))
+                            continue
+                        for i in range(0, len(rows), META_PAGE_SIZE):
+                            await emit(account_id, rows[i:i + META_PAGE_SIZE])
+                        await finish(account_id)
+                    pending = []
+                elif META_FETCH_MODE == 'batch':
+                    by_token = {}
+                    for account_id, token in pending:
+                        by_token.setdefault(token, []).append(account_id)
+                    outcomes = await asyncio.gather(*(
+                        batch_group(accounts, token) for token, accounts in by_token.items()
+                    ), return_exceptions=True)
+                    for accounts, outcome in zip(by_token.values(), outcomes):
+                        if isinstance(outcome, Exception):
+                            print(f"Meta batch error: {outcome}")
+                            for account_id in accounts:
+                                if account_id not in done:
+                                    collected.pop(account_id, None)
+                                    errors.setdefault(account_id, str(outcome))
+                    # Accounts with pages already out cannot start over
+                    pending = [(a, t) for a, t in pending if a not in done and a not in started]
+
+                if pending:
+                    # Deferred: only the async job fallback needs the job machinery
+                    from utils.meta_jobs import MetaJobScheduler
+
+                    async def on_page(job, rows):
+                        await emit(job.account_id, rows)
+
+                    scheduler = MetaJobScheduler(
+                        META_INSIGHTS_FIELDS, params,
+                        api_for_token=self.meta_sessions.api,
+                        max_in_flight=META_MAX_JOBS_PER_TOKEN,
+                        min_poll=META_POLL_MIN_SECONDS,
+                        max_poll=META_POLL_MAX_SECONDS,
+                        max_attempts=META_JOB_MAX_ATTEMPTS,
+                        on_page=on_page, page_size=META_PAGE_SIZE,
+                    )
+                    for job in await scheduler.run(pending):
+                        if job.error:
+                            fail(job.account_id, str(job.error))
+                        else:
+                            await finish(job.account_id)
+            except Exception as e:
+                print(f"Meta streaming fetch for {day} failed: {e}")
+                for accounts, _ in groups:
+                    for account_id in accounts:
+                        if account_id not in done:
+                            errors.setdefault(account_id, str(e))
+            await pages.put(None)
+
+        producer = asyncio.create_task(produce())
         try:
-            service = build('sheets', 'v4', credentials=creds)
-            existing = await self.get_existing_data_ringba(service)
-            new_rows = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                for r in reader:
-                    if tuple(r) not in existing:
-                        new_rows.append(r)
-            if new_rows:
-                service.spreadsheets().values().append(
-                    spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME_RINGBA,
-                    valueInputOption='RAW', insertDataOption='INSERT_ROWS', body={'values': new_rows}
-                ).execute()
-                print(f"Appended {len(new_rows)} new Ringba rows.")
-                self.new_values_ringba = new_rows
-        except HttpError as e:
-            print(f"Error updating Ringba sheets: {e}")
-
-    async def ringba_insights(self, interaction: discord.Interaction, since: str, defer_response=True):
-        """Execute the Ringba insights flow and notify user."""
-        if defer_response:
-            await interaction.response.defer(ephemeral=True)
-        tomorrow = datetime.strptime(since, "%Y-%m-%d") + timedelta(days=1)
-        start = f"{since}T05:00:00Z"
-        end = tomorrow.strftime("%Y-%m-%dT04:59:59Z")
-        body = generate_ringba_insights(start_date=start, end_date=end)
-        async with aiohttp.ClientSession() as session:
-            data = await self.post_ringba_insights(session, body)
+            while (item := await pages.get()) is not None:
+                yield item
+        finally:
+            if not producer.done():
+                producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def meta_unit_pages(self, manifest, day, groups, outcome):
+        """
+        Report rows of every account in `groups` for one day, page by page as
+        they are fetched, with each account kept as a manifest unit. Accounts
+        that fail before their first page are refetched on their own with
+        jittered exponential backoff; those that fail midway are only marked
+        failed, since their first pages are already out. `outcome` gets the
+        'fetched' and 'failed' account ids and the number of 'rows'.
+        """
+        fetched, errors, broken = set(), {}, {}
+        outcome.update(fetched=[], failed=[], rows=0)
+        pending = [(list(accounts), token) for accounts, token in groups if accounts]
+        retries = self.unit_retries()
+        for attempt in range(retries + 1):
+            if attempt:
+                delay = backoff_delay(attempt, UNIT_RETRY_BASE_SECONDS, UNIT_RETRY_MAX_SECONDS)
+                count = sum(len(accounts) for accounts, _ in pending)
+                print(f"Retrying {count} Meta accounts for {day} in {delay:.1f}s "
+                      f"(attempt {attempt + 1}/{retries + 1})")
+                METRICS.inc('retries', count, api='meta_unit')
+                await asyncio.sleep(delay)
+            round_errors, writers = {}, {}
+            try:
+                pages = self.stream_meta_pages(day, pending, round_errors)
+                async with aclosing(pages):
+                    async for account_id, rows in pages:
+                        if account_id in broken:
+                            continue
+                        try:
+                            records = self.get_insights(account_id, rows)
+                        except Exception as e:
+                            # Malformed results would fail the same way again, so they are not retried
+                            print(f"Meta insights conversion failed for {account_id}: {e}")
+                            broken[account_id] = f"conversion failed: {e}"
+                            continue
+                        if account_id not in writers:
+                            writers[account_id] = await asyncio.to_thread(
+                                manifest.open_payload, meta_unit(account_id)
+                            )
+                        await asyncio.to_thread(writers[account_id].write, records)
+                        outcome['rows'] += len(records)
+                        yield records
+            except BaseException:
+                for writer in writers.values():
+                    await asyncio.to_thread(writer.discard)
+                raise
+
+            for accounts, _ in pending:
+                for account_id in accounts:
+                    writer = writers.get(account_id)
+                    if account_id in round_errors or account_id in broken:
+                        if writer:
+                            await asyncio.to_thread(writer.discard)
+                    elif writer:
+                        await asyncio.to_thread(writer.commit)
+                        fetched.add(account_id)
+                    else:
+                        await asyncio.to_thread(manifest.record_success, meta_unit(account_id), [])
+                        fetched.add(account_id)
+            errors.update(round_errors)
+            errors.update(broken)
+            pending = [
+                ([a for a in accounts if a in round_errors and a not in writers and a not in broken], token)
+                for accounts, token in pending
+            ]
+            pending = [(accounts, token) for accounts, token in pending if accounts]
+            if not pending:
+                break
+
+        outcome['fetched'] = sorted(fetched)
+        outcome['failed'] = sorted(a for accounts, _ in groups for a in accounts if a not in fetched)
+        for account_id in outcome['failed']:
+            manifest.record_failure(meta_unit(account_id), errors.get(account_id, 'no results'))
+        await asyncio.to_thread(manifest.save)
+
+    def unit_retries(self):
+        """Retries of a failed unit here; queued units were already retried by the workers."""
+        return 0 if self.jobs is not None else UNIT_RETRIES
+
+    async def fetch_ringba_unit(self, manifest, day):
+        """Fetch the day's Ringba report with jittered exponential backoff; returns its records or None."""
+        error = None
+        retries = self.unit_retries()
+        for attempt in range(retries + 1):
+            if attempt:
+                delay = backoff_delay(attempt, UNIT_RETRY_BASE_SECONDS, UNIT_RETRY_MAX_SECONDS)
+                print(f"Retrying Ringba for {day} in {delay:.1f}s (attempt {attempt + 1}/{retries + 1})")
+                METRICS.inc('retries', api='ringba_unit')
+                await asyncio.sleep(delay)
+            try:
+                data = await self.fetch_ringba(day)
+            except Exception as e:
+                print(f"Ringba fetch for {day} failed: {e}")
+                error = e
+                continue
             if data.get('isSuccessful'):
-                path = self.save_insights_to_csv_ringba(data, since)
-                if path:
-                    await self.update_google_sheets_ringba(path)
-                    await interaction.followup.send(f"Ringba insights saved to {path}.", ephemeral=True)
+                records = data.get('report', {}).get('records', [])
+                await asyncio.to_thread(manifest.record_success, 'ringba', records)
+                await asyncio.to_thread(manifest.save)
+                return records
+            error = "Ringba API request unsuccessful"
+        manifest.record_failure('ringba', error)
+        await asyncio.to_thread(manifest.save)
+        return None
+
+    def reconcile_ringba(self, day, records):
+        """Summary of how the day's live call aggregates compare with the pulled report."""
+        diff = self.ringba_live.reconcile(day, records)
+        METRICS.inc('ringba_live_missed_calls', max(0, diff['pulled_calls'] - diff['live_calls']))
+        return (
+            f"Ringba live: {diff['live_calls']} of {diff['pulled_calls']} calls and "
+            f"${diff['live_revenue']:,.2f} of ${diff['pulled_revenue']:,.2f} revenue seen as events; "
+            f"{len(diff['missing_groups'])} groups only in the pull, {len(diff['extra_groups'])} only live."
+        )
+
+    async def manifest_pages(self, manifest, prefix):
+        """Rows of every unit of a source that succeeded, one unit at a time from the manifest's payloads."""
+        for unit in manifest.succeeded(prefix):
+            rows = await asyncio.to_thread(manifest.payload, unit)
+            if rows:
+                yield rows
+
+    async def meta_insights(self, run):
+        """Execute the Meta insights flow for one run."""
+        since = run.since
+        outcome = {}
+        # Pages go to the sinks while the remaining accounts are still being fetched
+        with METRICS.span('publish', source='meta'):
+            results = await self.publish_report(
+                'meta', since, self.meta_unit_pages(run.manifest, since, self.meta_groups(), outcome)
+            )
+        failed = outcome['failed']
+        if failed:
+            run.messages.append(
+                f"Meta: {len(failed)} of {len(failed) + len(outcome['fetched'])} accounts failed "
+                f"({', '.join(failed)}); run /retry-failed {since} to fetch only those."
+            )
+        run.meta_path = results.get('csv') if isinstance(results.get('csv'), str) else None
+        run.sheet_rows_meta = results.get('sheets') if isinstance(results.get('sheets'), int) else 0
+        run.messages.extend(self.report_messages('Meta', outcome['rows'], run.meta_path, results))
+
+    async def ringba_insights(self, run):
+        """Execute the Ringba insights flow for one run."""
+        since = run.since
+        records = await self.fetch_ringba_unit(run.manifest, since)
+        if records is None:
+            run.messages.append(f"Ringba API request unsuccessful; run /retry-failed {since} to retry it.")
+            return
+        if self.ringba_live is not None:
+            run.messages.append(self.reconcile_ringba(since, records))
+        with METRICS.span('publish', source='ringba'):
+            results = await self.publish_report('ringba', since, records)
+        run.ringba_path = results.get('csv') if isinstance(results.get('csv'), str) else None
+        run.sheet_rows_ringba = results.get('sheets') if isinstance(results.get('sheets'), int) else 0
+        run.messages.extend(self.report_messages('Ringba', len(records), run.ringba_path, results))
+
+    async def run_report(self, run):
+        """Full daily report for one date; called by the run queue."""
+        async with self.day_locks.setdefault(run.since, asyncio.Lock()):
+            # A full run refetches every unit, so it starts a fresh manifest
+            run.manifest = RunManifest(RUNS_FOLDER, run.since, fresh=True)
+            with METRICS.span('report_run'):
+                await self.report_stages(run)
+
+    async def retry_failed(self, day):
+        """Refetch only the units of a day's last run that failed and republish the merged day."""
+        async with self.day_locks.setdefault(day, asyncio.Lock()):
+            manifest = await asyncio.to_thread(RunManifest, RUNS_FOLDER, day)
+            if not manifest.units:
+                return [f"No run manifest for {day}; run /daily-general-report {day} first."]
+            messages = []
+            failed = {u.split(':', 1)[1] for u in manifest.failed('meta:')}
+            if failed:
+                groups = [([a for a in accounts if a in failed], token) for accounts, token in self.meta_groups()]
+                groups = [(accounts, token) for accounts, token in groups if accounts]
+                outcome = {}
+                with METRICS.span('meta_fetch', mode='retry'):
+                    # Only the payloads are kept here; the day is republished from all of them below
+                    async for _ in self.meta_unit_pages(manifest, day, groups, outcome):
+                        pass
+                still_failed = outcome['failed']
+                unknown = failed - {a for accounts, _ in groups for a in accounts}
+                messages.append(
+                    f"Meta: {len(outcome['fetched'])} of {len(failed)} failed accounts recovered"
+                    + (f", still failing: {', '.join(still_failed + sorted(unknown))}."
+                       if still_failed or unknown else ".")
+                )
+                if outcome['fetched']:
+                    with METRICS.span('publish', source='meta'):
+                        results = await self.publish_report('meta', day, self.manifest_pages(manifest, 'meta:'))
+                    path = results.get('csv') if isinstance(results.get('csv'), str) else None
+                    rows = sum(manifest.units[u]['rows'] for u in manifest.succeeded('meta:'))
+                    messages.extend(self.report_messages('Meta', rows, path, results))
+            if 'ringba' in manifest.failed():
+                records = await self.fetch_ringba_unit(manifest, day)
+                if records is None:
+                    messages.append("Ringba: still failing.")
                 else:
-                    await interaction.followup.send("Failed to save Ringba CSV.", ephemeral=True)
+                    with METRICS.span('publish', source='ringba'):
+                        results = await self.publish_report('ringba', day, records)
+                    path = results.get('csv') if isinstance(results.get('csv'), str) else None
+                    messages.extend(self.report_messages('Ringba', len(records), path, results))
+            if not messages:
+                ok = sum(ok for ok, _ in manifest.summary().values())
+                messages.append(f"Nothing failed on {day} ({ok} units succeeded).")
+            return messages
+
+    async def report_stages(self, run):
+        since = run.since
+        # Clean up existing rows on both sheets (upsert mode replaces them in place)
+        if SHEETS_WRITE_MODE != 'upsert':
+            meta_clean, ringba_clean = await asyncio.gather(
+                self.run_apps_script(META_SHEET_NAME, since),
+                self.run_apps_script(RINGBA_SHEET_NAME, since)
+            )
+            if not (meta_clean and ringba_clean):
+                run.messages.append("Cleanup script failed.")
+                return
+            self.row_index.drop_partition(META_SHEET_NAME, since)
+            self.row_index.drop_partition(RINGBA_SHEET_NAME, since)
+
+        # Both flows publish to their sinks while the other one is still fetching
+        await asyncio.gather(self.meta_insights(run), self.ringba_insights(run))
+
+        # Notify admins
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for uid in ADMIN_USER_IDS:
+            await self.send_private_message(
+                uid,
+                f"{timestamp} - {', '.join(run.requesters)} ran report for {since}. "
+                f"Meta rows: {run.sheet_rows_meta}, Ringba rows: {run.sheet_rows_ringba}"
+            )
+
+    async def account_spend(self, day, groups):
+        """Spend so far per ad account; one small account-level batch per token."""
+        params = {'time_range': {'since': day, 'until': day}, 'level': 'account'}
+        batches = await asyncio.gather(*(
+            asyncio.to_thread(
+                self.meta_sessions.get(token).fetch_insights_batch,
+                list(accounts), ['account_id', 'spend'], params
+            )
+            for accounts, token in groups
+        ), return_exceptions=True)
+        spend = {}
+        for batch in batches:
+            if isinstance(batch, Exception):
+                print(f"Meta spend check error: {batch}")
+                continue
+            for account_id, rows in batch[0].items():
+                # No row means no delivery yet today
+                spend[account_id] = rows[0].get('spend', '0') if rows else '0'
+        return spend
+
+    async def write_intraday(self, sheet_name, header, rows, key_columns, **extra):
+        """Diff a day's rows against its snapshot and write only what moved."""
+        day = rows[0][0]
+        async with self.sheet_locks.setdefault(sheet_name, asyncio.Lock()):
+            snapshot = await asyncio.to_thread(self.intraday.get, sheet_name, day)
+            previous = snapshot['rows'] if snapshot else None
+            if previous == rows:
+                stats = {'mode': 'unchanged', 'changed_rows': 0, 'changed_cells': 0, 'new_rows': 0}
             else:
-                await interaction.followup.send("Ringba API request unsuccessful.", ephemeral=True)
+                with METRICS.span('intraday_write', sheet=sheet_name):
+                    ordered, stats = await self.google.call(
+                        'sheets', lambda service: self.intraday_writer.apply(
+                            service, SPREADSHEET_ID, sheet_name, header, previous, rows, key_columns
+                        )
+                    )
+                METRICS.inc('rows', stats['changed_rows'] + stats['new_rows'],
+                            stage='intraday_write', sheet=sheet_name)
+                rows = ordered
+            await asyncio.to_thread(self.intraday.put, sheet_name, day, rows, **extra)
+        return stats
+
+    async def intraday_meta(self, day):
+        """
+        Refresh one day of Meta rows. Account spend is the change signal:
+        only accounts whose spend moved since the last refresh are fetched
+        at adset level, the rest reuse their snapshot rows.
+        """
+        groups = self.meta_groups()
+        snapshot = await asyncio.to_thread(self.intraday.get, META_SHEET_NAME, day) or {}
+        old_spend = snapshot.get('spend', {})
+        old_rows = snapshot.get('rows_by_account', {})
+        with METRICS.span('intraday_precheck'):
+            spend = await self.account_spend(day, groups)
+
+        changed = [
+            ([a for a in accounts if a not in old_rows or a not in spend or spend[a] != old_spend.get(a)], token)
+            for accounts, token in groups
+        ]
+        changed = [(accounts, token) for accounts, token in changed if accounts]
+        results = {}
+        if changed:
+            with METRICS.span('meta_fetch', mode='intraday'):
+                results = await self.fetch_account_results(day, day, changed, use_cache=False)
+
+        rows_by_account, spend_seen = {}, {}
+        for accounts, _ in groups:
+            for account_id in accounts:
+                if account_id in results:
+                    records = self.get_insights(account_id, results[account_id])
+                    rows_by_account[account_id] = [as_cells(r) for r in META_SCHEMA.rows(records, since=day)]
+                    spend_seen[account_id] = spend.get(account_id)
+                elif account_id in old_rows:
+                    # Unchanged, or the fetch failed and the next refresh retries it
+                    rows_by_account[account_id] = old_rows[account_id]
+                    spend_seen[account_id] = old_spend.get(account_id)
+        rows = [row for account_rows in rows_by_account.values() for row in account_rows]
+        if not rows:
+            return {'mode': 'empty', 'fetched_accounts': len(results)}
+        stats = await self.write_intraday(
+            META_SHEET_NAME, META_SCHEMA.header, rows, META_KEY_COLUMNS,
+            rows_by_account=rows_by_account, spend=spend_seen
+        )
+        return dict(stats, fetched_accounts=len(results))
+
+    async def intraday_ringba(self, day):
+        """
+        Refresh one day of Ringba rows: from the live call aggregates when
+        the webhook receiver has calls for the day, otherwise with one
+        insights request. Live totals with fewer calls than the rows last
+        written (events not arriving, or lost with a restart) are not
+        trusted either, so they never blank or shrink the day's rows.
+        """
+        records = self.ringba_live.records(day) if self.ringba_live is not None else []
+        calls = sum(r['callCount'] for r in records)
+        if records:
+            snapshot = await asyncio.to_thread(self.intraday.get, RINGBA_SHEET_NAME, day) or {}
+            if calls < snapshot.get('calls', 0):
+                print(f"Live Ringba totals for {day} are behind the sheet; pulling the report instead.")
+                records = []
+        if not records:
+            data = await self.fetch_ringba(day, use_cache=False)
+            if not data.get('isSuccessful'):
+                return {'mode': 'failed'}
+            records = data.get('report', {}).get('records', [])
+            calls = int(sum(to_number(r.get('callCount')) for r in records))
+        rows = [as_cells(r) for r in RINGBA_SCHEMA.rows(records, since=day)]
+        if not rows:
+            return {'mode': 'empty'}
+        return await self.write_intraday(
+            RINGBA_SHEET_NAME, RINGBA_SCHEMA.header, rows, RINGBA_KEY_COLUMNS, calls=calls
+        )
+
+    async def run_intraday(self, day=None):
+        """Intraday refresh of one day (today by default); returns stats per source."""
+        day = day or datetime.now(ZoneInfo(DAILY_REPORT_TZ)).strftime("%Y-%m-%d")
+        async with self.intraday_lock:
+            with METRICS.span('intraday_run'):
+                meta, ringba = await asyncio.gather(
+                    self.intraday_meta(day), self.intraday_ringba(day), return_exceptions=True
+                )
+        for source, result in (('Meta', meta), ('Ringba', ringba)):
+            if isinstance(result, Exception):
+                print(f"Intraday {source} refresh for {day} failed: {result}")
+        return day, meta, ringba
+
+    def checkpoint_path(self, start, end):
+        return os.path.join(BACKFILL_FOLDER, f"backfill_{start}_{end}.json")
+
+    def load_checkpoint(self, start, end):
+        """Days already written by an earlier run of the same backfill."""
+        path = self.checkpoint_path(start, end)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'meta': [], 'ringba': []}
+
+    def save_checkpoint(self, start, end, checkpoint):
+        os.makedirs(BACKFILL_FOLDER, exist_ok=True)
+        path = self.checkpoint_path(start, end)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    async def pending_days(self, days, sheet_name, done, force=False):
+        """Days not yet checkpointed and, unless forced, not already present in the sheet."""
+        if force:
+            return [d for d in days if d not in done]
+        await self.google.call(
+            'sheets', lambda service: self.row_index.sync(service, SPREADSHEET_ID, sheet_name)
+        )
+        present = self.row_index.partition_counts(sheet_name)
+        return [d for d in days if d not in done and d not in present]
+
+    async def run_backfill(self, start, end, force=False):
+        """Run the Meta and Ringba flows for every day in [start, end]; returns written day counts."""
+        first = datetime.strptime(start, "%Y-%m-%d")
+        last = datetime.strptime(end, "%Y-%m-%d")
+        days = [(first + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((last - first).days + 1)]
+        checkpoint = self.load_checkpoint(start, end)
+        meta_days = await self.pending_days(days, META_SHEET_NAME, checkpoint['meta'], force)
+        ringba_days = await self.pending_days(days, RINGBA_SHEET_NAME, checkpoint['ringba'], force)
+        budget = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+        def mark_done(source, day):
+            checkpoint[source].append(day)
+            self.save_checkpoint(start, end, checkpoint)
+
+        async def meta_day(day, accounts, errors):
+            async with budget:
+                rows = [row for account_rows in accounts.values() for row in account_rows]
+                results = await self.publish_report('meta', day, rows)
+                if errors:
+                    # The day is in the sheet but incomplete; /retry-failed refetches the missing accounts
+                    await asyncio.to_thread(self.record_backfill_units, day, accounts, errors)
+                    return
+                # A day with a failed output is retried by the next run of the backfill
+                if not any(isinstance(r, Exception) for r in results.values()):
+                    mark_done('meta', day)
+
+        async def meta_flow():
+            if not meta_days:
+                return
+            # One multi-day request, split back into days (and accounts) by date_start
+            groups = self.meta_groups()
+            errors = {}
+            results = await self.fetch_account_results(
+                min(meta_days), max(meta_days), groups, time_increment=1, errors=errors
+            )
+            for account_id in errors:
+                print(f"Meta backfill failed for {account_id}: {errors[account_id]}")
+            by_day = {day: {account_id: [] for account_id in results} for day in meta_days}
+            for account_id, rows in results.items():
+                for row in self.get_insights(account_id, rows):
+                    if row['date_start'] in by_day:
+                        by_day[row['date_start']][account_id].append(row)
+            await asyncio.gather(*(meta_day(d, by_day[d], errors) for d in meta_days))
+
+        async def ringba_day(day):
+            async with budget:
+                data = await self.fetch_ringba(day)
+                if not data.get('isSuccessful'):
+                    print(f"Ringba API request unsuccessful for {day}.")
+                    return
+                records = data.get('report', {}).get('records', [])
+                results = await self.publish_report('ringba', day, records)
+                if not any(isinstance(r, Exception) for r in results.values()):
+                    mark_done('ringba', day)
+
+        await asyncio.gather(meta_flow(), *(ringba_day(d) for d in ringba_days))
+        # A finished backfill needs no checkpoint; an interrupted one resumes from it
+        if set(meta_days) <= set(checkpoint['meta']) and set(ringba_days) <= set(checkpoint['ringba']):
+            path = self.checkpoint_path(start, end)
+            if os.path.exists(path):
+                os.remove(path)
+        return len(days), len(meta_days), len(ringba_days), checkpoint
+
+    def record_backfill_units(self, day, accounts, errors):
+        """Keep a backfilled day's Meta accounts in its run manifest, so /retry-failed can complete the day."""
+        manifest = RunManifest(RUNS_FOLDER, day)
+        for account_id, rows in accounts.items():
+            manifest.record_success(meta_unit(account_id), rows)
+        for account_id, error in errors.items():
+            manifest.record_failure(meta_unit(account_id), error)
+        manifest.save()
+
+    async def ingest_ringba_calls(self, since, export_path=None):
+        """Stream one day's call-level Ringba logs, or a call-level CSV export, into typed columns."""
+        calls = CallColumns(normalize_sub5=clean_string)
+        if export_path:
+            await asyncio.to_thread(calls.extend_csv, export_path)
+            return calls
+        tomorrow = datetime.strptime(since, "%Y-%m-%d") + timedelta(days=1)
+        async for records in self.ringba.iter_call_logs(
+            f"{since}T05:00:00Z", tomorrow.strftime("%Y-%m-%dT04:59:59Z")
+        ):
+            calls.extend_records(records)
+        return calls
+
+    def save_call_rollups(self, calls, since, by, file_name):
+        """Write call-level rollups for the given dimensions to CSV."""
+        rows = calls.aggregate(by)
+        if not rows:
+            print("No Ringba calls to save.")
+            return None
+        os.makedirs(RINGBA_INSIGHTS_FOLDER, exist_ok=True)
+        path = os.path.join(RINGBA_INSIGHTS_FOLDER, file_name)
+        cols = ['date_start'] + list(rows[0].keys())
+        with open(path, 'w', newline='', encoding='utf-8') as csvf:
+            w = csv.writer(csvf)
+            w.writerow(cols)
+            for row in rows:
+                w.writerow([since] + list(row.values()))
+        print(f"Ringba call rollup CSV generated at {path}")
+        return path
+
+    def iter_report_rows(self, source, folder, base_name, days):
+        """Yield report rows for the given days from history, falling back to saved CSVs."""
+        shared = os.path.join(folder, f"{base_name}.csv")
+        pending = set(days)
+        for day in sorted(days):
+            if self.history.has_partition(source, day):
+                pending.discard(day)
+                yield from self.history.iter_rows(source, day, day)
+                continue
+            path = os.path.join(folder, f"{base_name}_{day}.csv")
+            if os.path.exists(path):
+                pending.discard(day)
+                with open(path, 'r', encoding='utf-8') as f:
+                    yield from csv.DictReader(f)
+        if pending and os.path.exists(shared):
+            with open(shared, 'r', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row['date_start'] in pending:
+                        yield row
+
+    def rebuild_rollups(self, since, until):
+        """Re-apply every day in [since, until] from history or saved CSVs; returns days applied."""
+        first = datetime.strptime(since, "%Y-%m-%d")
+        last = datetime.strptime(until, "%Y-%m-%d")
+        applied = 0
+        for i in range((last - first).days + 1):
+            day = (first + timedelta(days=i)).strftime("%Y-%m-%d")
+            for source, folder, base_name in (
+                ('meta', INSIGHTS_FOLDER, "general_report"),
+                ('ringba', RINGBA_INSIGHTS_FOLDER, "ringba_insights_report"),
+            ):
+                rows = list(self.iter_report_rows(source, folder, base_name, [day]))
+                if rows:
+                    self.rollups.apply(source, day, rows)
+                    applied += 1
+        return applied
+
+    def run_match(self, since, until):
+        """Join Meta adsets to Ringba sub5 tags for a date range and save the results."""
+        first = datetime.strptime(since, "%Y-%m-%d")
+        last = datetime.strptime(until, "%Y-%m-%d")
+        days = [(first + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((last - first).days + 1)]
+        engine = MatchEngine()
+        engine.add_meta(self.iter_report_rows('meta', INSIGHTS_FOLDER, "general_report", days))
+        engine.add_ringba(self.iter_report_rows(
+            'ringba', RINGBA_INSIGHTS_FOLDER, "ringba_insights_report", days
+        ))
+        matched, unmatched_meta, unmatched_ringba = engine.results()
+
+        os.makedirs(MATCHED_FOLDER, exist_ok=True)
+        path = os.path.join(MATCHED_FOLDER, f"matched_{since}_{until}.csv")
+        with open(path, 'w', newline='', encoding='utf-8') as csvf:
+            w = csv.DictWriter(csvf, fieldnames=MATCHED_COLUMNS)
+            w.writeheader()
+            w.writerows(matched)
+        unmatched_path = os.path.join(MATCHED_FOLDER, f"unmatched_{since}_{until}.csv")
+        with open(unmatched_path, 'w', newline='', encoding='utf-8') as csvf:
+            w = csv.writer(csvf)
+            w.writerow(['source', 'date_start', 'key'])
+            w.writerows(('meta',) + k for k in unmatched_meta)
+            w.writerows(('ringba',) + k for k in unmatched_ringba)
+        print(f"Matched CSV generated at {path}")
+        return path, len(matched), len(unmatched_meta), len(unmatched_ringba)
 
     # ======================================
     #  Commands
@@ -386,49 +1328,236 @@ class DailyGeneralReport(commands.Cog):
     async def general_report(self, interaction: discord.Interaction, since: str):
         """Slash command handler to trigger insights report."""
         await interaction.response.defer(ephemeral=True)
-        until = since
+        # Requests for a date that is already running share that run
+        run = await self.run_queue.submit(since, interaction.user.name)
+        for message in run.messages:
+            await interaction.followup.send(message, ephemeral=True)
 
-        # Clean up existing rows on both sheets
-        meta_clean, ringba_clean = await asyncio.gather(
-            self.run_apps_script(META_SHEET_NAME, since),
-            self.run_apps_script(RINGBA_SHEET_NAME, since)
-        )
-        if not (meta_clean and ringba_clean):
-            await interaction.followup.send("Cleanup script failed.", ephemeral=True)
+    @discord.app_commands.command(
+        name="retry-failed",
+        description="Refetch only the accounts and sources that failed in a day's last report run."
+    )
+    @discord.app_commands.describe(date="Date in YYYY-MM-DD format")
+    async def retry_failed_command(self, interaction: discord.Interaction, date: str):
+        """Slash command handler for a selective retry."""
+        await interaction.response.defer(ephemeral=True)
+        for message in await self.retry_failed(date):
+            await interaction.followup.send(message, ephemeral=True)
+
+    @discord.app_commands.command(
+        name="stats",
+        description="Show p50/p95 timings per report stage and API counters."
+    )
+    async def stats(self, interaction: discord.Interaction):
+        """Slash command handler summarizing recent stage timings."""
+        summary = METRICS.stage_summary()
+        if not summary:
+            await interaction.response.send_message("No report stages recorded yet.", ephemeral=True)
             return
+        lines = [f"{'stage':<22}{'n':>6}{'p50 s':>10}{'p95 s':>10}"]
+        for stage, (count, (p50, p95)) in summary.items():
+            lines.append(f"{stage:<22}{count:>6}{p50:>10.2f}{p95:>10.2f}")
+        lines.append("")
+        for name, value in METRICS.counter_totals().items():
+            lines.append(f"{name:<22}{value:>16,}")
+        labels = {token: label for label, token in BUSINESS_MANAGERS.items()}
+        for token, (limit, interval, usage, in_flight) in self.meta_sessions.rate_states().items():
+            usage = f"{usage:.0f}%" if usage is not None else "-"
+            lines.append(f"{'meta rate ' + labels.get(token, '?'):<22}"
+                         f"limit {limit}, every {interval:.2f}s, usage {usage}, in flight {in_flight}")
+        if self.jobs:
+            counts = await asyncio.to_thread(self.jobs.counts)
+            lines.append(f"{'job queue':<22}" + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())))
+        await interaction.response.send_message("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
 
-        # Fetch Meta insights
-        # Pair each BM list with its corresponding token from the .env
-        groups = [
-            (BM1, ACCESS_TOKENS[0]),
-            (BM3, ACCESS_TOKENS[2]),
-            (BM4, ACCESS_TOKENS[3]),
-        ]
+    @tasks.loop(hours=24)
+    async def daily_report(self):
+        """Built-in scheduled run for DAILY_REPORT_DAYS_AGO days back."""
+        day = datetime.now(ZoneInfo(DAILY_REPORT_TZ)).date() - timedelta(days=DAILY_REPORT_DAYS_AGO)
+        try:
+            run = await self.run_queue.submit(day.strftime("%Y-%m-%d"), "scheduler")
+            print(f"Scheduled report for {day}: {' '.join(run.messages)}")
+        except Exception as e:
+            print(f"Scheduled report for {day} failed: {e}")
+
+    @tasks.loop(hours=6)
+    async def refresh_accounts(self):
+        """Scheduled ad account discovery for every business manager token."""
+        from facebook_business.api import FacebookAdsApi
+
+        try:
+            await self.accounts.refresh(META_GRAPH_URL or GRAPH_URL, FacebookAdsApi.API_VERSION)
+        except Exception as e:
+            print(f"Account discovery failed: {e}")
 
-        tasks = []
-        for accounts, token in groups:
-            for acct in accounts:
-                tasks.append(self.fetch_insights(since, until, token, [acct]))
-        all_meta = []
-        for sub in await asyncio.gather(*tasks):
-            all_meta.extend(sub)
+    @tasks.loop(minutes=15)
+    async def intraday_refresh(self):
+        """Scheduled intraday refresh of today, within INTRADAY_HOURS."""
+        first, last = (int(h) for h in INTRADAY_HOURS.split('-'))
+        if not first <= datetime.now(ZoneInfo(DAILY_REPORT_TZ)).hour <= last:
+            return
+        try:
+            day, meta, ringba = await self.run_intraday()
+            print(f"Intraday refresh for {day}: Meta {meta}, Ringba {ringba}")
+        except Exception as e:
+            print(f"Intraday refresh failed: {e}")
 
-        # Save and update Meta
-        csv_meta = self.save_insights_to_csv_meta(all_meta, since)
-        await self.update_google_sheets(csv_meta)
-        await interaction.followup.send(f"Meta insights saved to {csv_meta}.", ephemeral=True)
+    @tasks.loop(seconds=60)
+    async def flush_ringba_live(self):
+        """Scheduled flush of the live Ringba aggregates to RINGBA_LIVE_FOLDER."""
+        try:
+            await asyncio.to_thread(self.ringba_live.flush)
+        except OSError as e:
+            print(f"Ringba live flush failed: {e}")
 
-        # Run Ringba flow
-        await self.ringba_insights(interaction, since, defer_response=False)
+    @daily_report.before_loop
+    async def before_daily_report(self):
+        await self.client.wait_until_ready()
 
-        # Notify admins
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        for uid in ['274730726174490624', '836235560107769867']:
-            await self.send_private_message(
-                uid,
-                f"{timestamp} - {interaction.user.name} ran report for {since}. "
-                f"Meta rows: {len(self.new_values_meta)}, Ringba rows: {len(self.new_values_ringba)}"
+    @refresh_accounts.before_loop
+    async def before_refresh_accounts(self):
+        await self.client.wait_until_ready()
+
+    @intraday_refresh.before_loop
+    async def before_intraday_refresh(self):
+        await self.client.wait_until_ready()
+
+    @discord.app_commands.command(
+        name="intraday-refresh",
+        description="Refresh today's rows in place, writing only changed cells and new rows."
+    )
+    @discord.app_commands.describe(day="Date in YYYY-MM-DD format (defaults to today)")
+    async def intraday(self, interaction: discord.Interaction, day: str = None):
+        """Slash command handler for an on-demand intraday refresh."""
+        await interaction.response.defer(ephemeral=True)
+        day, meta, ringba = await self.run_intraday(day)
+        lines = [f"Intraday refresh for {day}:"]
+        for source, result in (('Meta', meta), ('Ringba', ringba)):
+            if isinstance(result, Exception):
+                lines.append(f"{source}: failed ({result}).")
+            else:
+                lines.append(f"{source}: " + ', '.join(f"{k} {v}" for k, v in result.items()) + ".")
+        await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+    @discord.app_commands.command(
+        name="backfill",
+        description="Re-run Meta and Ringba reports for every day in a date range."
+    )
+    @discord.app_commands.describe(
+        start="First date in YYYY-MM-DD format",
+        end="Last date in YYYY-MM-DD format",
+        force="Also re-run days that already have rows in the sheets"
+    )
+    async def backfill(self, interaction: discord.Interaction, start: str, end: str, force: bool = False):
+        """Slash command handler to backfill a date range."""
+        await interaction.response.defer(ephemeral=True)
+        total, meta_days, ringba_days, checkpoint = await self.run_backfill(start, end, force)
+        await interaction.followup.send(
+            f"Backfill {start} → {end}: {total} days, Meta ran for {meta_days}, "
+            f"Ringba ran for {ringba_days}. Completed so far: Meta {len(checkpoint['meta'])}, "
+            f"Ringba {len(checkpoint['ringba'])}.",
+            ephemeral=True
+        )
+
+    @discord.app_commands.command(
+        name="ringba-calls",
+        description="Build campaign, publisher and sub5 rollups from call-level Ringba logs."
+    )
+    @discord.app_commands.describe(
+        since="Date in YYYY-MM-DD format",
+        export="Call-level CSV export to roll up instead of pulling the call logs"
+    )
+    async def ringba_calls(self, interaction: discord.Interaction, since: str,
+                           export: discord.Attachment = None):
+        """Slash command handler for call-level Ringba rollups."""
+        await interaction.response.defer(ephemeral=True)
+        export_path = None
+        if export is not None:
+            os.makedirs(RINGBA_INSIGHTS_FOLDER, exist_ok=True)
+            export_path = os.path.join(RINGBA_INSIGHTS_FOLDER, f"ringba_calls_export_{since}.csv")
+            await export.save(export_path)
+        calls = await self.ingest_ringba_calls(since, export_path)
+        paths = []
+        for by in (('campaign',), ('publisher',), ('sub5',), ('hour',), ('campaign', 'sub5', 'publisher')):
+            path = await asyncio.to_thread(
+                self.save_call_rollups, calls, since, by, f"ringba_calls_{'_'.join(by)}_{since}.csv"
             )
+            if path:
+                paths.append(path)
+        await interaction.followup.send(
+            f"Ingested {len(calls)} Ringba calls for {since}. Rollups: {', '.join(paths) or 'none'}.",
+            ephemeral=True
+        )
+
+    @discord.app_commands.command(
+        name="match-report",
+        description="Match Meta adsets to Ringba sub5 tags with CPA, ROAS and profit."
+    )
+    @discord.app_commands.describe(
+        since="First date in YYYY-MM-DD format",
+        until="Last date in YYYY-MM-DD format (defaults to since)"
+    )
+    async def match_report(self, interaction: discord.Interaction, since: str, until: str = None):
+        """Slash command handler for the adset to sub5 match."""
+        await interaction.response.defer(ephemeral=True)
+        path, matched, unmatched_meta, unmatched_ringba = await asyncio.to_thread(
+            self.run_match, since, until or since
+        )
+        await interaction.followup.send(
+            f"Matched {matched} adset-days, saved to {path}. "
+            f"Unmatched: {unmatched_meta} Meta, {unmatched_ringba} Ringba.",
+            ephemeral=True
+        )
+
+    @discord.app_commands.command(
+        name="rollup",
+        description="Weekly or monthly spend versus revenue by publisher, account, adset or campaign."
+    )
+    @discord.app_commands.describe(
+        grain="Week or month buckets",
+        by="Dimension to group by",
+        since="First date in YYYY-MM-DD format",
+        until="Last date in YYYY-MM-DD format (defaults to since)",
+        key="Only this publisher, account, adset or campaign",
+        rebuild="Re-apply the range's days from local history first"
+    )
+    @discord.app_commands.choices(
+        grain=[discord.app_commands.Choice(name=g, value=g) for g in GRAINS],
+        by=[discord.app_commands.Choice(name=d, value=d) for d in DIMENSIONS]
+    )
+    async def rollup(self, interaction: discord.Interaction, grain: str, by: str, since: str,
+                     until: str = None, key: str = None, rebuild: bool = False):
+        """Slash command handler answering range queries from the rollup tables."""
+        await interaction.response.defer(ephemeral=True)
+        until = until or since
+        if rebuild:
+            await asyncio.to_thread(self.rebuild_rollups, since, until)
+        rows = await asyncio.to_thread(self.rollups.query, grain, by, since, until, key)
+        if not rows:
+            await interaction.followup.send(f"No {grain} rollups by {by} for {since} → {until}.", ephemeral=True)
+            return
+        lines = [f"{grain:<11}{by:<26}{'spend':>10}{'revenue':>10}{'profit':>10}{'roas':>8}{'calls':>7}"]
+        for row in rows[:ROLLUP_MAX_LINES]:
+            roas = f"{row['roas']:.2f}" if row['roas'] != '' else '-'
+            # Single-source dimensions have no profit
+            profit = f"{row['profit']:,.2f}" if row['profit'] != '' else '-'
+            lines.append(f"{row['bucket']:<11}{row['key'][:25] or '(none)':<26}{row['spend']:>10,.2f}"
+                         f"{row['revenue']:>10,.2f}{profit:>10}{roas:>8}{row['calls']:>7,}")
+        message = "```\n" + "\n".join(lines) + "\n```"
+        if len(rows) <= ROLLUP_MAX_LINES:
+            await interaction.followup.send(message, ephemeral=True)
+            return
+        # The full result goes along as a CSV
+        buffer = io.StringIO()
+        w = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+        await interaction.followup.send(
+            message + f"{len(rows) - ROLLUP_MAX_LINES} more rows in the attached CSV.",
+            file=discord.File(io.BytesIO(buffer.getvalue().encode('utf-8')),
+                              filename=f"rollup_{grain}_{by}_{since}_{until}.csv"),
+            ephemeral=True
+        )
 
 async def setup(client: commands.Bot):
     """Add this cog to the bot."""
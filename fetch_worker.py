@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+from contextlib import aclosing
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from utils.job_queue import JobQueue
+from utils.meta_session import MAX_BATCH_SIZE, MetaSessionPool
+from utils.meta_settings import (
+    BUSINESS_MANAGERS, META_FETCH_MODE, META_GRAPH_URL, META_JOB_MAX_ATTEMPTS, META_MAX_JOBS_PER_TOKEN,
+    META_PAGE_SIZE, META_POLL_MAX_SECONDS, META_POLL_MIN_SECONDS, META_POOL_SIZE, META_RATE_MAX_CALLS,
+    META_RATE_TARGET_PCT, META_THROTTLE_RETRIES
+)
+from utils.ringba_client import TIME_FORMAT, RingbaClient
+from utils.run_manifest import backoff_delay
+from utils.streaming import iterate_in_thread
+
+load_dotenv()
+
+RINGBA_ACCOUNT_ID       = os.getenv("RINGBA_ACCOUNT_ID")
+RINGBA_API_TOKEN        = os.getenv("RINGBA_API_TOKEN")
+RINGBA_API_URL          = os.getenv("RINGBA_API_URL", "https://api.ringba.com/v2")
+
+JOB_QUEUE_PATH          = os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3")
+JOB_LEASE_SECONDS       = float(os.getenv("JOB_LEASE_SECONDS", "120"))  # renewed while a unit is worked on
+JOB_POLL_SECONDS        = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+JOB_KEEP_HOURS          = float(os.getenv("JOB_KEEP_HOURS", "24"))  # finished jobs kept for the bot to read
+UNIT_RETRY_BASE_SECONDS = float(os.getenv("UNIT_RETRY_BASE_SECONDS", "2"))
+UNIT_RETRY_MAX_SECONDS  = float(os.getenv("UNIT_RETRY_MAX_SECONDS", "60"))
+WORKER_PROCESSES        = int(os.getenv("WORKER_PROCESSES", "2"))
+WORKER_BATCH_SIZE       = int(os.getenv("WORKER_BATCH_SIZE", str(MAX_BATCH_SIZE)))  # units claimed at once
+
+JOB_KINDS = ('meta_insights', 'ringba_window')
+
+
+class FetchWorker:
+    """
+    Claims fetch units from the job queue and writes their results back.
+
+    Meta units claimed together are fetched through one Graph batch per
+    token and date range, and each unit is completed as soon as its last
+    page arrives; a unit on its second attempt or later goes through an
+    async report job instead, as the bot falls back to when batching fails.
+    Ringba units are fetched window by window. Leases are renewed while
+    the claimed units are in progress.
+    """
+
+    def __init__(self, queue, worker_id):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.meta_sessions = MetaSessionPool(
+            pool_size=META_POOL_SIZE, graph_url=META_GRAPH_URL,
+            rate_options={'target': META_RATE_TARGET_PCT, 'max_limit': META_RATE_MAX_CALLS},
+            max_throttle_retries=META_THROTTLE_RETRIES
+        )
+        self.ringba = RingbaClient(RINGBA_ACCOUNT_ID, RINGBA_API_TOKEN, base_url=RINGBA_API_URL)
+
+    async def run(self, idle_exit=None):
+        """Work until stopped, or until no unit was ready for `idle_exit` seconds."""
+        last_work = time.monotonic()
+        last_purge = 0.0
+        try:
+            while True:
+                jobs = await asyncio.to_thread(
+                    self.queue.claim, self.worker_id, JOB_KINDS, WORKER_BATCH_SIZE, JOB_LEASE_SECONDS
+                )
+                if not jobs:
+                    if idle_exit is not None and time.monotonic() - last_work >= idle_exit:
+                        break
+                    if time.monotonic() - last_purge >= 3600:
+                        last_purge = time.monotonic()
+                        await asyncio.to_thread(self.queue.purge, JOB_KEEP_HOURS * 3600)
+                    await asyncio.sleep(JOB_POLL_SECONDS)
+                    continue
+                print(f"{self.worker_id}: claimed {len(jobs)} units")
+                heartbeat = asyncio.create_task(self.keep_leases([job_id for job_id, *_ in jobs]))
+                try:
+                    await asyncio.gather(
+                        self.run_meta([job for job in jobs if job[1] == 'meta_insights']),
+                        self.run_ringba([job for job in jobs if job[1] == 'ringba_window']),
+                    )
+                finally:
+                    heartbeat.cancel()
+                last_work = time.monotonic()
+        finally:
+            await self.ringba.close()
+            self.meta_sessions.close()
+
+    async def keep_leases(self, ids):
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            await asyncio.to_thread(self.queue.extend, ids, self.worker_id, JOB_LEASE_SECONDS)
+
+    async def complete(self, job_id, result):
+        if not await asyncio.to_thread(self.queue.complete, job_id, self.worker_id, result):
+            print(f"{self.worker_id}: lease on job {job_id} was lost; result dropped")
+
+    async def fail(self, job_id, attempt, error):
+        print(f"{self.worker_id}: job {job_id} failed (attempt {attempt}): {error}")
+        delay = backoff_delay(attempt, UNIT_RETRY_BASE_SECONDS, UNIT_RETRY_MAX_SECONDS)
+        await asyncio.to_thread(self.queue.fail, job_id, self.worker_id, error, delay)
+
+    # ======================================
+    #  Meta
+    # ======================================
+    async def run_meta(self, jobs):
+        groups = {}
+        for job_id, _, payload, attempt in jobs:
+            token = BUSINESS_MANAGERS.get(payload['business_manager'])
+            if not token:
+                await self.fail(job_id, attempt, f"no token for {payload['business_manager']} on this worker")
+                continue
+            mode = 'async' if META_FETCH_MODE == 'async' or attempt > 1 else 'batch'
+            key = (mode, token, json.dumps(payload['fields']), json.dumps(payload['params'], sort_keys=True))
+            groups.setdefault(key, []).append((job_id, payload['account_id'], attempt))
+        await asyncio.gather(*(
+            self.meta_batch(token, json.loads(fields), json.loads(params), members) if mode == 'batch'
+            else self.meta_async(token, json.loads(fields), json.loads(params), members)
+            for (mode, token, fields, params), members in groups.items()
+        ))
+
+    async def meta_batch(self, token, fields, params, members):
+        """Fetch units through Graph batch requests, completing each at its last page."""
+        units = {account_id: (job_id, attempt) for job_id, account_id, attempt in members}
+        rows = {}
+        session = self.meta_sessions.get(token)
+        events = iterate_in_thread(
+            lambda: session.iter_insights_batch(list(units), fields, params, page_size=META_PAGE_SIZE)
+        )
+        error = "no result"
+        try:
+            async with aclosing(events):
+                async for kind, account_id, value in events:
+                    if kind == 'rows':
+                        rows.setdefault(account_id, []).extend(value)
+                    elif kind == 'done':
+                        await self.complete(units.pop(account_id)[0], rows.pop(account_id, []))
+                    else:
+                        rows.pop(account_id, None)
+                        job_id, attempt = units.pop(account_id)
+                        await self.fail(job_id, attempt, value)
+        except Exception as e:
+            error = str(e)
+        for job_id, attempt in units.values():
+            await self.fail(job_id, attempt, error)
+
+    async def meta_async(self, token, fields, params, members):
+        """Fetch units through async report jobs."""
+        # Deferred: only the async path needs the job machinery
+        from utils.meta_jobs import MetaJobScheduler
+
+        units = {account_id: (job_id, attempt) for job_id, account_id, attempt in members}
+        scheduler = MetaJobScheduler(
+            fields, params,
+            api_for_token=self.meta_sessions.api,
+            max_in_flight=META_MAX_JOBS_PER_TOKEN,
+            min_poll=META_POLL_MIN_SECONDS,
+            max_poll=META_POLL_MAX_SECONDS,
+            max_attempts=META_JOB_MAX_ATTEMPTS,
+        )
+        try:
+            finished = await scheduler.run([(account_id, token) for account_id in units])
+        except Exception as e:
+            finished = []
+            error = str(e)
+        else:
+            error = "no result"
+        for job in finished:
+            job_id, attempt = units.pop(job.account_id)
+            if job.results is not None:
+                await self.complete(job_id, job.results)
+            else:
+                await self.fail(job_id, attempt, job.error)
+        for job_id, attempt in units.values():
+            await self.fail(job_id, attempt, error)
+
+    # ======================================
+    #  Ringba
+    # ======================================
+    async def run_ringba(self, jobs):
+        await asyncio.gather(*(self.ringba_window(*job) for job in jobs))
+
+    async def ringba_window(self, job_id, kind, payload, attempt):
+        start = datetime.strptime(payload['start'], TIME_FORMAT)
+        end = datetime.strptime(payload['end'], TIME_FORMAT)
+        try:
+            data = await self.ringba.fetch_window(start, end)
+        except Exception as e:
+            await self.fail(job_id, attempt, e)
+            return
+        if not data.get('isSuccessful'):
+            await self.fail(job_id, attempt, "Ringba API request unsuccessful")
+            return
+        await self.complete(job_id, data)
+
+
+def run_process(idle_exit=None):
+    """One worker: its own queue connection, API sessions and event loop."""
+    queue = JobQueue(JOB_QUEUE_PATH)
+    worker = FetchWorker(queue, f"{socket.gethostname()}:{os.getpid()}")
+    try:
+        asyncio.run(worker.run(idle_exit))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch Meta and Ringba units queued by the bot.")
+    parser.add_argument('--processes', type=int, default=WORKER_PROCESSES)
+    parser.add_argument('--idle-exit', type=float, default=None,
+                        help="exit once no unit was ready for this many seconds")
+    args = parser.parse_args()
+    print(f"Starting {args.processes} fetch workers on {JOB_QUEUE_PATH}")
+    if args.processes <= 1:
+        run_process(args.idle_exit)
+        return
+    processes = [
+        multiprocessing.Process(target=run_process, args=(args.idle_exit,))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Ctrl+C reaches every worker; wait for them to release their connections
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    main()
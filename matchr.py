@@ -1,29 +1,84 @@
+import time
+startup_began = time.perf_counter()
+
 import discord
 from discord.ext import commands
 import config
+import hashlib
+import json
 import os
 
+imports_done = time.perf_counter()
+
+# Hash of the last command tree pushed to Discord; the tree is only synced when it changes
+COMMAND_HASH_FILE = os.getenv("COMMAND_HASH_FILE", ".command_tree_hash")
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "") == "1"
+
 intents = discord.Intents.all()
 client = commands.Bot(command_prefix=config.PREFIX, intents=intents)
 
-async def load_cogs_and_sync_commands():
-    print(f'Logged in as {client.user.name}')
-    loaded_cogs = 0
-    for filename in os.listdir('./cogs'):
+def command_tree_hash():
+    """Stable hash of every registered slash command definition."""
+    definitions = sorted(
+        (command.to_dict(client.tree) for command in client.tree.get_commands()),
+        key=lambda d: (d.get('type', 1), d['name'])
+    )
+    payload = json.dumps([client.application_id, definitions], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def last_synced_hash():
+    try:
+        with open(COMMAND_HASH_FILE, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+async def load_cogs():
+    """Load every cog; returns [(cog name, seconds)]."""
+    timings = []
+    for filename in sorted(os.listdir('./cogs')):
         if filename.endswith('.py') and not filename.startswith('__'):
             cog_name = filename[:-3]  # Quita la extensión .py para obtener el nombre del cog
+            started = time.perf_counter()
             try:
                 await client.load_extension(f'cogs.{cog_name}')
                 print(f'Cog loaded: {cog_name}')
-                loaded_cogs += 1
+                timings.append((cog_name, time.perf_counter() - started))
             except Exception as e:
                 print(f'Failed to load cog: {cog_name}\n{e}')
-    print(f'{loaded_cogs} cogs loaded.')
-    await client.tree.sync()  # Sincroniza los comandos slash con Discord
+    print(f'{len(timings)} cogs loaded.')
+    return timings
+
+async def sync_commands():
+    """Sync slash commands with Discord only if their definitions changed; returns the outcome."""
+    current = command_tree_hash()
+    if not FORCE_COMMAND_SYNC and current == last_synced_hash():
+        print('Slash commands unchanged, sync skipped.')
+        return 'skipped, unchanged'
+    try:
+        await client.tree.sync()  # Sincroniza los comandos slash con Discord
+    except discord.HTTPException as e:
+        print(f'Slash command sync failed: {e}')
+        return 'failed'
+    with open(COMMAND_HASH_FILE, 'w', encoding='utf-8') as f:
+        f.write(current)
     print('Slash commands synced.')
+    return 'synced'
 
 async def setup_hook():
-    await load_cogs_and_sync_commands()
+    print(f'Logged in as {client.user.name}')
+    cogs_started = time.perf_counter()
+    timings = await load_cogs()
+    sync_started = time.perf_counter()
+    outcome = await sync_commands()
+    done = time.perf_counter()
+
+    per_cog = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in timings)
+    print('Startup timing:')
+    print(f'  imports      {imports_done - startup_began:6.2f}s')
+    print(f'  login        {cogs_started - imports_done:6.2f}s')
+    print(f'  cog load     {sync_started - cogs_started:6.2f}s ({per_cog})')
+    print(f'  command sync {done - sync_started:6.2f}s ({outcome})')
 
 client.setup_hook = setup_hook
 
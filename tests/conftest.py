@@ -0,0 +1,101 @@
+import pytest
+
+from benchmarks.fakes import CELL_RE, column_index, parse_range
+
+
+class Request:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result()
+
+
+class FakeSheetsService:
+    """
+    In-memory stand-in for the Sheets v4 service object: the spreadsheets()
+    and values() calls the row index, upserter and intraday writer make.
+    Every request is logged in `requests` as (method, body or ranges).
+    """
+
+    def __init__(self, sheets=None):
+        self.sheets = {title: [list(r) for r in rows] for title, rows in (sheets or {}).items()}
+        self.sheet_ids = {title: i + 1 for i, title in enumerate(self.sheets)}
+        self.requests = []
+
+    def add_sheet(self, title, rows=()):
+        self.sheets[title] = [list(r) for r in rows]
+        self.sheet_ids[title] = len(self.sheet_ids) + 1
+
+    def read(self, a1):
+        sheet, first, last, column_a = parse_range(a1)
+        rows = self.sheets.get(sheet, [])
+        last = len(rows) if last is None else min(last, len(rows))
+        selected = rows[first - 1:last]
+        return [[r[0]] if column_a else list(r) for r in selected]
+
+    # Chained call surface
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range=None, fields=None):
+        if range is None:
+            self.requests.append(('get', fields))
+            return Request(lambda: {'sheets': [
+                {'properties': {'sheetId': sid, 'title': title}} for title, sid in self.sheet_ids.items()
+            ]})
+        self.requests.append(('values.get', range))
+        return Request(lambda: {'values': self.read(range)})
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.requests.append(('values.batchGet', list(ranges)))
+        return Request(lambda: {'valueRanges': [{'values': self.read(r)} for r in ranges]})
+
+    def append(self, spreadsheetId, range, body, **options):
+        self.requests.append(('values.append', body))
+        sheet = parse_range(range)[0]
+        return Request(lambda: self.sheets[sheet].extend(list(r) for r in body['values']) or {})
+
+    def batchUpdate(self, spreadsheetId, body):
+        if 'requests' in body:
+            self.requests.append(('batchUpdate', body))
+            return Request(lambda: self._batch_update(body['requests']))
+        self.requests.append(('values.batchUpdate', body))
+        return Request(lambda: self._values_update(body['data']))
+
+    def _batch_update(self, requests):
+        titles = {sid: title for title, sid in self.sheet_ids.items()}
+        for req in requests:
+            if 'deleteDimension' in req:
+                rng = req['deleteDimension']['range']
+                del self.sheets[titles[rng['sheetId']]][rng['startIndex']:rng['endIndex']]
+            elif 'appendCells' in req:
+                cells = req['appendCells']
+                self.sheets[titles[cells['sheetId']]].extend(
+                    [c.get('userEnteredValue', {}).get('stringValue', '') for c in row['values']]
+                    for row in cells['rows']
+                )
+        return {'replies': []}
+
+    def _values_update(self, data):
+        for value_range in data:
+            sheet, first, _, _ = parse_range(value_range['range'])
+            column = CELL_RE.match(value_range['range'].rpartition('!')[2].partition(':')[0]).group(1)
+            start = column_index(column)
+            rows = self.sheets[sheet]
+            for offset, values in enumerate(value_range['values']):
+                cells = rows[first - 1 + offset]
+                cells.extend([''] * (start + len(values) - len(cells)))
+                cells[start:start + len(values)] = [str(v) for v in values]
+        return {}
+
+    def count(self, method):
+        return sum(1 for m, _ in self.requests if m == method)
+
+
+@pytest.fixture
+def sheets():
+    return FakeSheetsService()
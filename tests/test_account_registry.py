@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+
+import pytest
+from aiohttp import web
+
+from benchmarks.bench_report import free_port
+from utils.account_registry import AccountRegistry
+
+
+class FakeGraph:
+    """The two Graph endpoints discovery uses, over per-token account lists."""
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self.calls = []
+
+    async def listing(self, request):
+        fields = request.query['fields'].split(',')
+        self.calls.append(('list', request.query['fields']))
+        token = request.query['access_token']
+        if token not in self.accounts:
+            return web.json_response({'error': {'message': 'Invalid OAuth access token'}})
+        return web.json_response({'data': [
+            {k: v for k, v in a.items() if k in fields} for a in self.accounts[token]
+        ]})
+
+    async def lookup(self, request):
+        self.calls.append(('ids', request.query['ids']))
+        by_id = {a['id']: a for a in self.accounts[request.query['access_token']]}
+        return web.json_response({i: by_id[i] for i in request.query['ids'].split(',')})
+
+
+def account(account_id, name, status=1):
+    return {'id': account_id, 'name': name, 'account_status': status}
+
+
+@pytest.fixture
+def graph():
+    return FakeGraph({'token-1': [account('act_1', 'One'), account('act_2', 'Two')],
+                      'token-3': [account('act_2', 'Two'), account('act_9', 'Nine')]})
+
+
+def refresh_all(graph, steps):
+    """Serve `graph` and run each step(url) in turn, returning their results."""
+    port = free_port()
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/v16.0/me/adaccounts', graph.listing)
+        app.router.add_get('/v16.0/', graph.lookup)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        try:
+            return [await step(f"http://127.0.0.1:{port}") for step in steps]
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_index_groups_and_publishers(tmp_path):
+    registry = AccountRegistry(str(tmp_path / 'accounts.json'), {'BM1': 't1', 'BM2': None, 'BM3': 't3'},
+                               exclude=['act_x'])
+    registry.load(seed={'BM3': ['act_3', 'act_1'], 'BM1': ['act_1', 'act_x', 'act_2']})
+    # An account shared by two business managers stays with the first token
+    assert registry.groups() == [(['act_1', 'act_2'], 't1'), (['act_3'], 't3')]
+    assert registry.publisher('act_3') == 'BM3'
+    assert registry.publisher('act_x') == ''
+
+
+def test_refresh_discovers_then_only_looks_up_new_accounts(tmp_path, graph):
+    path = str(tmp_path / 'accounts.json')
+    registry = AccountRegistry(path, {'BM1': 'token-1', 'BM3': 'token-3'}, exclude=['act_9'])
+    registry.load()
+
+    async def first(url):
+        summary = await registry.refresh(url)
+        return summary, registry.groups()
+
+    async def unchanged(url):
+        graph.calls.clear()
+        mtime = os.path.getmtime(path)
+        summary = await registry.refresh(url)
+        return summary, list(graph.calls), os.path.getmtime(path) == mtime
+
+    async def grown(url):
+        graph.calls.clear()
+        graph.accounts['token-1'].append(account('act_3', 'Three', status=2))
+        return await registry.refresh(url), list(graph.calls)
+
+    (summary, groups), (again, calls, untouched), (after, grown_calls) = refresh_all(
+        graph, [first, unchanged, grown]
+    )
+    assert summary == {'BM1': 2, 'BM3': 1}
+    # act_2 is shared, so BM3 is left with no account of its own
+    assert groups == [(['act_1', 'act_2'], 'token-1')]
+
+    # Nothing changed: only the id listings, and the file is left alone
+    assert again == summary
+    assert calls == [('list', 'id,account_status')] * 2
+    assert untouched
+
+    # Only the new account's name is looked up
+    assert after == {'BM1': 3, 'BM3': 1}
+    assert ('ids', 'act_3') in grown_calls and len(grown_calls) == 3
+    with open(path, 'r', encoding='utf-8') as f:
+        saved = json.load(f)['business_managers']['BM1']['accounts']
+    assert saved[-1] == {'id': 'act_3', 'name': 'Three', 'status': 2}
+    assert registry.publisher('act_3') == 'BM1'
+    assert 'token-1' not in json.dumps(saved)
+
+
+def test_a_failing_token_keeps_its_accounts(tmp_path, graph):
+    registry = AccountRegistry(str(tmp_path / 'accounts.json'), {'BM1': 'token-1', 'BM4': 'revoked'})
+    registry.load(seed={'BM4': ['act_4']})
+
+    async def refresh(url):
+        return await registry.refresh(url)
+
+    summary, = refresh_all(graph, [refresh])
+    assert summary['BM1'] == 2
+    assert summary['BM4'].startswith('error: Invalid OAuth')
+    assert registry.publisher('act_4') == 'BM4'
+
+
+def test_registry_reloads_when_the_file_changes(tmp_path):
+    path = str(tmp_path / 'accounts.json')
+    writer = AccountRegistry(path, {'BM1': 't1'})
+    writer.load(seed={'BM1': ['act_1']})
+    writer.save()
+    reader = AccountRegistry(path, {'BM1': 't1'})
+    reader.load()
+    assert not reader.reload_if_changed()
+
+    writer.data['business_managers']['BM1']['accounts'].append({'id': 'act_2'})
+    writer.save()
+    os.utime(path, (reader.mtime + 5, reader.mtime + 5))
+    assert reader.reload_if_changed()
+    assert reader.groups() == [(['act_1', 'act_2'], 't1')]
@@ -0,0 +1,82 @@
+import asyncio
+import math
+
+from utils.history_store import INT_NULL, SCHEMAS, HistorySink, HistoryStore
+
+
+def test_rewriting_a_day_deletes_the_replaced_segments(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    rows = [{'date_start': '2024-01-01', 'adset_name': 'a', 'spend': '1.5'}]
+    for _ in range(3):
+        store.write('meta', '2024-01-01', rows)
+    part = tmp_path / 'meta' / '2024-01-01'
+    assert sorted(p.name for p in part.iterdir() if p.name.startswith('seg-')) == store.active_segments('meta', '2024-01-01')
+    assert len(list(store.iter_rows('meta', '2024-01-01', '2024-01-01'))) == 1
+
+    store.write('meta', '2024-01-01', rows, replace=False)
+    assert len(store.active_segments('meta', '2024-01-01')) == 2
+    assert len(list(store.iter_rows('meta', '2024-01-01', '2024-01-01'))) == 2
+
+
+def ringba_row(day, sub5, calls, revenue='12.50', percent='37.43%'):
+    return {
+        'date_start': day, 'date_stop': day, 'callCount': calls, 'liveCallCount': '-no value-',
+        'endedCalls': '', 'connectedCallCount': 3, 'earningsPerCallGross': 1.234,
+        'conversionAmount': revenue, 'payoutAmount': 200, 'profitMarginGross': '',
+        'convertedPercent': percent, 'callLengthInSeconds': 125, 'avgHandleTime': '',
+        'publisherName': 'Publisher 0', 'tag:User:sub5': sub5, 'campaignName': 'C',
+    }
+
+
+def as_text(row):
+    return {c: str(v) for c, v in row.items()}
+
+
+def test_rows_read_back_as_written(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    rows = [ringba_row('2024-01-01', 'Cafe_Ole_1', 5), ringba_row('2024-01-01', '', '', revenue='-no value-')]
+    store.write('ringba', '2024-01-01', rows)
+    read = list(store.iter_rows('ringba', '2024-01-01', '2024-01-01'))
+    expected = [dict(dict.fromkeys(SCHEMAS['ringba'], ''), **row) for row in rows]
+    assert [as_text(r) for r in read] == [as_text(r) for r in expected]
+    assert read[0]['callCount'] == 5
+    assert read[0]['convertedPercent'] == '37.43%'
+    assert read[0]['tag:User:sub5'] == 'Cafe_Ole_1'
+    assert read[1]['liveCallCount'] == '-no value-'
+
+    # Missing numbers are nulls, not zeros
+    arrays = store.read('ringba', '2024-01-01', '2024-01-01', ['callCount', 'conversionAmount'])
+    assert arrays['callCount'].tolist() == [5, INT_NULL]
+    assert arrays['conversionAmount'][0] == 12.5 and math.isnan(arrays['conversionAmount'][1])
+
+
+def test_range_queries_span_days(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    for day in ('2024-01-01', '2024-01-02', '2024-01-03', '2024-01-05'):
+        store.write('ringba', day, [ringba_row(day, 'S', int(day[-1])), ringba_row(day, 'T', 1)])
+    assert store.days('ringba', '2024-01-02', '2024-01-05') == ['2024-01-02', '2024-01-03', '2024-01-05']
+    rows = list(store.iter_rows('ringba', '2024-01-02', '2024-01-04'))
+    assert [(r['date_start'], r['tag:User:sub5'], r['callCount']) for r in rows] == [
+        ('2024-01-02', 'S', 2), ('2024-01-02', 'T', 1), ('2024-01-03', 'S', 3), ('2024-01-03', 'T', 1),
+    ]
+    assert store.read('ringba', '2024-01-01', '2024-01-05', ['callCount'])['callCount'].sum() == 15
+
+
+def test_history_sink_stores_the_stream(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    header = list(SCHEMAS['meta'])
+    sink = HistorySink('history', store, 'meta', '2024-01-01')
+    batches = [[['2024-01-01', '2024-01-01', 'Acct', 'BM1', 'a', '0.5', '1.50', '3', '12.345', '7', None]],
+               [['2024-01-01', '2024-01-01', 'Acct', 'BM1', 'b', '', '', '-no value-', '', '1.25', '']]]
+
+    async def run():
+        await sink.open(header)
+        for batch in batches:
+            await sink.write(batch)
+        return await sink.close()
+
+    assert asyncio.run(run()) == 2
+    read = list(store.iter_rows('meta', '2024-01-01', '2024-01-01'))
+    assert [[str(v) for v in r.values()] for r in read] == [
+        ['' if v is None else v for v in row] for batch in batches for row in batch
+    ]
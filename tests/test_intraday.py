@@ -0,0 +1,102 @@
+import pytest
+
+from utils.intraday import (
+    RINGBA_KEY_COLUMNS, IntradayWriter, SnapshotStore, as_cells, cell_ranges, col_letter, diff_rows, row_keys
+)
+from utils.row_index import RowIndex
+from utils.sheet_upsert import SheetUpserter
+
+HEADER = ['date_start', 'campaignName', 'tag:User:sub5', 'publisherName', 'callCount', 'conversionAmount']
+DAY = '2024-01-02'
+
+
+def row(sub5, calls, revenue, campaign='C', publisher='P', day=DAY):
+    return [day, campaign, sub5, publisher, str(calls), str(revenue)]
+
+
+@pytest.fixture
+def writer(tmp_path):
+    index = RowIndex(str(tmp_path / 'index.sqlite3'))
+    yield IntradayWriter(index, SheetUpserter(index))
+    index.close()
+
+
+def test_cells_and_letters():
+    assert as_cells([None, 1, 2.5, 'x']) == ['', '1', '2.5', 'x']
+    assert [col_letter(i) for i in (0, 25, 26, 51, 702)] == ['A', 'Z', 'AA', 'AZ', 'AAA']
+
+
+def test_row_keys_number_repeated_keys():
+    rows = [row('a', 1, 0), row('a', 2, 0), row('b', 3, 0)]
+    assert row_keys(HEADER, rows, RINGBA_KEY_COLUMNS) == [('C', 'a', 'P', 0), ('C', 'a', 'P', 1), ('C', 'b', 'P', 0)]
+
+
+def test_diff_finds_changed_cells_new_and_removed_rows():
+    old = [row('a', 1, 0), row('b', 2, 10), row('c', 1, 0)]
+    new = [row('b', 3, 10), row('a', 1, 0), row('d', 1, 5)]
+    changed, appended, removed = diff_rows(HEADER, old, new, RINGBA_KEY_COLUMNS)
+    assert changed == [(1, old[1], new[0], [4])]
+    assert appended == [new[2]]
+    assert removed == [('C', 'c', 'P', 0)]
+
+
+def test_cell_ranges_merge_adjacent_columns():
+    old, new = row('a', 1, 0), row('a', 2, 9)
+    data = cell_ranges('My sheet', 5, [(0, old, new, [4, 5]), (2, old, new, [1, 5])])
+    assert data == [
+        {'range': "'My sheet'!E5:F5", 'values': [['2', '9']]},
+        {'range': "'My sheet'!B7:B7", 'values': [['C']]},
+        {'range': "'My sheet'!F7:F7", 'values': [['9']]},
+    ]
+
+
+def test_refresh_writes_only_changed_cells_and_new_rows(writer, sheets):
+    earlier = [HEADER, row('x', 1, 0, day='2024-01-01')]
+    sheets.add_sheet('S', earlier)
+    first = [row('a', 1, 0), row('b', 2, 10)]
+    previous, stats = writer.apply(sheets, 'id', 'S', HEADER, None, first, RINGBA_KEY_COLUMNS)
+    assert stats['mode'] == 'replace'
+
+    sheets.requests.clear()
+    fresh = [row('a', 1, 0), row('b', 3, 15), row('c', 1, 0)]
+    ordered, stats = writer.apply(sheets, 'id', 'S', HEADER, previous, fresh, RINGBA_KEY_COLUMNS)
+    assert stats == {'mode': 'diff', 'changed_rows': 1, 'changed_cells': 2, 'new_rows': 1}
+    assert [m for m, _ in sheets.requests if m not in ('values.get',)] == ['values.batchUpdate', 'values.append']
+    update = [body for m, body in sheets.requests if m == 'values.batchUpdate'][0]
+    assert update['data'] == [{'range': "'S'!E4:F4", 'values': [['3', '15']]}]
+    assert sheets.sheets['S'] == earlier + fresh
+    assert ordered == fresh
+
+    # Nothing changed: no writes at all
+    sheets.requests.clear()
+    _, stats = writer.apply(sheets, 'id', 'S', HEADER, ordered, fresh, RINGBA_KEY_COLUMNS)
+    assert stats['changed_rows'] == stats['new_rows'] == 0
+    assert all(m == 'values.get' for m, _ in sheets.requests)
+
+
+def test_refresh_replaces_the_day_when_rows_disappear(writer, sheets):
+    sheets.add_sheet('S', [HEADER])
+    previous, _ = writer.apply(sheets, 'id', 'S', HEADER, None, [row('a', 1, 0), row('b', 1, 0)],
+                               RINGBA_KEY_COLUMNS)
+    _, stats = writer.apply(sheets, 'id', 'S', HEADER, previous, [row('a', 2, 0)], RINGBA_KEY_COLUMNS)
+    assert stats['mode'] == 'replace'
+    assert sheets.sheets['S'] == [HEADER, row('a', 2, 0)]
+
+
+def test_refresh_replaces_the_day_when_the_sheet_moved_on(writer, sheets):
+    sheets.add_sheet('S', [HEADER])
+    previous, _ = writer.apply(sheets, 'id', 'S', HEADER, None, [row('a', 1, 0)], RINGBA_KEY_COLUMNS)
+    # Someone edited the day's row by hand, so the snapshot no longer matches the sheet
+    sheets.sheets['S'][1][4] = '7'
+    _, stats = writer.apply(sheets, 'id', 'S', HEADER, previous, [row('a', 2, 0)], RINGBA_KEY_COLUMNS)
+    assert stats['mode'] == 'replace'
+    assert sheets.sheets['S'] == [HEADER, row('a', 2, 0)]
+
+
+def test_snapshots_round_trip(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    assert store.get('My sheet', DAY) is None
+    store.put('My sheet', DAY, [row('a', 1, 0)], calls=1)
+    assert store.get('My sheet', DAY) == {'calls': 1, 'rows': [row('a', 1, 0)]}
+    store.invalidate('My sheet', DAY)
+    assert store.get('My sheet', DAY) is None
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+import utils.job_queue as job_queue
+from utils.job_queue import JobQueue, job_key, wait_for_jobs
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue.time, 'time', clock.time)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    yield queue
+    queue.close()
+
+
+def test_job_key_ignores_payload_order():
+    assert job_key('k', {'a': 1, 'b': 2}) == job_key('k', {'b': 2, 'a': 1})
+    assert job_key('k', {'a': 1}) != job_key('other', {'a': 1})
+
+
+def test_enqueue_joins_pending_and_reuses_recent_results(queue, clock):
+    first = queue.enqueue_many('k', [{'n': 1}, {'n': 2}])
+    assert queue.enqueue_many('k', [{'n': 2}, {'n': 1}]) == first[::-1]
+
+    (job_id, _, _, _), = queue.claim('w', ['k'], limit=1)
+    assert queue.complete(job_id, 'w', {'rows': [1]})
+    clock.advance(30)
+    assert queue.enqueue_many('k', [{'n': 1}], reuse_seconds=60) == [job_id]
+    assert queue.enqueue_many('k', [{'n': 1}], reuse_seconds=10) != [job_id]
+
+
+def test_claim_leases_oldest_first(queue):
+    ids = queue.enqueue_many('k', [{'n': i} for i in range(3)])
+    queue.enqueue_many('other', [{'n': 9}])
+    claimed = queue.claim('w1', ['k'], limit=2)
+    assert [(job_id, payload, attempt) for job_id, _, payload, attempt in claimed] == [
+        (ids[0], {'n': 0}, 1), (ids[1], {'n': 1}, 1),
+    ]
+    # Leased jobs are not handed to another worker
+    assert [job[0] for job in queue.claim('w2', ['k'], limit=5)] == [ids[2]]
+    assert queue.counts() == {'leased': 3, 'queued': 1}
+
+
+def test_expired_lease_is_claimed_again_and_old_owner_loses_it(queue, clock):
+    job_id, = queue.enqueue_many('k', [{'n': 1}])
+    queue.claim('w1', ['k'], lease_seconds=10)
+    clock.advance(5)
+    queue.extend([job_id], 'w1', lease_seconds=10)
+    clock.advance(9)
+    assert queue.claim('w2', ['k']) == []
+
+    clock.advance(2)
+    (_, _, _, attempt), = queue.claim('w2', ['k'])
+    assert attempt == 2
+    assert not queue.complete(job_id, 'w1', 'late')
+    assert queue.complete(job_id, 'w2', 'fresh')
+    assert queue.result(job_id) == 'fresh'
+
+
+def test_lease_expiring_on_the_last_attempt_fails_the_job(queue, clock):
+    job_id, = queue.enqueue_many('k', [{'n': 1}], max_attempts=1)
+    queue.claim('w1', ['k'], lease_seconds=10)
+    clock.advance(11)
+    assert queue.claim('w2', ['k']) == []
+    assert queue.finished([job_id]) == [(job_id, 'failed', 'lease expired')]
+
+
+def test_failed_attempts_retry_after_the_delay_then_fail(queue, clock):
+    job_id, = queue.enqueue_many('k', [{'n': 1}], max_attempts=2)
+    queue.claim('w', ['k'])
+    queue.fail(job_id, 'w', 'boom', retry_in=30)
+    assert queue.claim('w', ['k']) == []
+    clock.advance(31)
+    (_, _, _, attempt), = queue.claim('w', ['k'])
+    assert attempt == 2
+    queue.fail(job_id, 'w', RuntimeError('boom again'), retry_in=30)
+    assert queue.finished([job_id]) == [(job_id, 'failed', 'boom again')]
+    clock.advance(60)
+    assert queue.claim('w', ['k']) == []
+
+
+def test_purge_keeps_recent_and_unfinished_jobs(queue, clock):
+    done, pending = queue.enqueue_many('k', [{'n': 1}, {'n': 2}])
+    queue.claim('w', ['k'], limit=1)
+    queue.complete(done, 'w', None)
+    clock.advance(100)
+    assert queue.purge(200) == 0
+    assert queue.purge(50) == 1
+    assert queue.counts() == {'queued': 1}
+
+
+def test_wait_for_jobs_cancels_unclaimed_jobs_on_timeout(queue, clock):
+    done, waiting = queue.enqueue_many('k', [{'n': 1}, {'n': 2}])
+    queue.claim('w', ['k'], limit=1)
+    queue.complete(done, 'w', [])
+
+    async def collect():
+        return [item async for item in wait_for_jobs(queue, [done, waiting], poll=0.01, timeout=0.05)]
+
+    assert asyncio.run(collect()) == [
+        (done, 'done', None), (waiting, 'failed', 'timed out waiting for a fetch worker'),
+    ]
+    assert queue.finished([waiting]) == [(waiting, 'failed', 'cancelled')]
@@ -0,0 +1,49 @@
+from utils.matcher import MATCHED_COLUMNS, MatchEngine, match_key
+
+DAY = '2024-01-02'
+
+
+def meta_row(adset, spend, cpm='10', clicks='3', account='Account', day=DAY):
+    return {'date_start': day, 'adset_name': adset, 'account_name': account,
+            'spend': spend, 'cpm': cpm, 'inline_link_click': clicks}
+
+
+def ringba_row(sub5, revenue, calls=2, converted=1, publisher='Pub', day=DAY):
+    return {'date_start': day, 'tag:User:sub5': sub5, 'publisherName': publisher,
+            'callCount': calls, 'convertedCalls': converted, 'conversionAmount': revenue}
+
+
+def test_match_key_normalizes_names():
+    assert match_key('  Debt_SPA ') == match_key('debt_spa') == 'debt_spa'
+    assert match_key(None) == ''
+
+
+def test_adsets_join_sub5_tags_per_day():
+    engine = MatchEngine()
+    engine.add_meta([
+        meta_row('Debt_A', '6.00', account='One'), meta_row('debt_a ', '4.00', cpm='0', account='Two'),
+        meta_row('Only_Meta', '1.00'),
+    ])
+    engine.add_ringba([
+        ringba_row('DEBT_A', '30.00', publisher='P2'), ringba_row('debt_a', '10.00', converted=3, publisher='P1'),
+        ringba_row('Debt_A', '99.00', day='2024-01-03'),
+    ])
+    matched, unmatched_meta, unmatched_ringba = engine.results()
+    row, = matched
+    assert list(row) == MATCHED_COLUMNS
+    assert (row['adset_name'], row['accounts'], row['publishers']) == ('Debt_A', 'One|Two', 'P1|P2')
+    assert (row['spend'], row['inline_link_click'], row['calls'], row['conversions']) == (10.0, 6, 4, 4)
+    # Impressions only come from the row with a CPM
+    assert (row['impressions'], row['cpm']) == (600, 16.67)
+    assert (row['revenue'], row['cpa'], row['roas'], row['profit']) == (40.0, 2.5, 4.0, 30.0)
+    assert unmatched_meta == [(DAY, 'only_meta')]
+    assert unmatched_ringba == [('2024-01-03', 'debt_a')]
+
+
+def test_ratios_are_blank_without_a_denominator():
+    engine = MatchEngine()
+    engine.add_meta([meta_row('A', '0', cpm='')])
+    engine.add_ringba([ringba_row('a', '5.00', converted=0)])
+    row, = engine.results()[0]
+    assert row['cpm'] == row['cpa'] == row['roas'] == ''
+    assert row['profit'] == 5.0
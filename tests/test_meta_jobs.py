@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from utils import meta_jobs
+from utils.meta_jobs import JOB_COMPLETED, JOB_FAILED, MetaJobScheduler, ReportJob
+
+
+class Row(dict):
+    def export_all_data(self):
+        return dict(self)
+
+
+class Cursor:
+    """A result cursor over fixed pages, loaded one at a time."""
+
+    def __init__(self, pages):
+        self.pages = [list(map(Row, page)) for page in pages]
+        self.current = self.pages.pop(0) if self.pages else []
+
+    def __len__(self):
+        return len(self.current)
+
+    def __iter__(self):
+        for page in [self.current] + self.pages:
+            yield from page
+
+    def __next__(self):
+        return self.current.pop(0)
+
+    def load_next_page(self):
+        if not self.pages:
+            return False
+        self.current = self.pages.pop(0)
+        return True
+
+
+class Graph:
+    """Async jobs per account: each run walks through a list of statuses, one per poll."""
+
+    def __init__(self, statuses, pages):
+        self.statuses = statuses   # account id -> one status list per attempt
+        self.pages = pages
+        self.submitted = []
+        self.in_flight = 0
+        self.peak = 0
+
+    def account(self, account_id, api=None):
+        graph = self
+
+        class Account:
+            def get_insights_async(self, fields, params):
+                graph.submitted.append((account_id, api))
+                graph.in_flight += 1
+                graph.peak = max(graph.peak, graph.in_flight)
+                return Run(graph, account_id, list(graph.statuses[account_id].pop(0)))
+
+        return Account()
+
+
+class Run(dict):
+    def __init__(self, graph, account_id, statuses):
+        super().__init__()
+        self.graph = graph
+        self.account_id = account_id
+        self.statuses = statuses
+
+    def api_get(self):
+        status, percent = self.statuses.pop(0)
+        self['async_status'], self['async_percent_completion'] = status, percent
+        if status != 'Job Running':
+            self.graph.in_flight -= 1
+
+    def get_result(self, params):
+        return Cursor(self.graph.pages.get(self.account_id, []))
+
+
+def running(percent):
+    return ('Job Running', percent)
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    graph = Graph({}, {})
+    monkeypatch.setattr(meta_jobs, 'AdAccount', graph.account)
+    return graph
+
+
+def scheduler(**options):
+    options = dict(dict(api_for_token=lambda token: f"api-{token}", min_poll=0.001, max_poll=0.01), **options)
+    return MetaJobScheduler(['spend'], {'level': 'adset'}, **options)
+
+
+def test_jobs_complete_and_collect_results(graph):
+    graph.statuses = {
+        'act_1': [[running(40), (JOB_COMPLETED, 100)]],
+        'act_2': [[(JOB_COMPLETED, 100)]],
+    }
+    graph.pages = {'act_1': [[{'spend': '1'}, {'spend': '2'}], [{'spend': '3'}]], 'act_2': []}
+    jobs = asyncio.run(scheduler().run([('act_1', 't1'), ('act_2', 't2')]))
+
+    by_account = {job.account_id: job for job in jobs}
+    assert by_account['act_1'].results == [{'spend': '1'}, {'spend': '2'}, {'spend': '3'}]
+    assert by_account['act_1'].polls == 2 and by_account['act_1'].error is None
+    assert by_account['act_2'].results == [] and by_account['act_2'].row_count == 0
+    assert sorted(graph.submitted) == [('act_1', 'api-t1'), ('act_2', 'api-t2')]
+
+
+def test_in_flight_jobs_are_capped_per_token(graph):
+    graph.statuses = {f"act_{i}": [[running(50), (JOB_COMPLETED, 100)]] for i in range(5)}
+    jobs = asyncio.run(scheduler(max_in_flight=2).run([(f"act_{i}", 't1') for i in range(5)]))
+    assert len(jobs) == 5 and all(job.error is None for job in jobs)
+    assert graph.peak == 2
+
+
+def test_failed_jobs_are_resubmitted_until_out_of_attempts(graph):
+    graph.statuses = {
+        'act_1': [[(JOB_FAILED, 0)], [running(10), (JOB_COMPLETED, 100)]],
+        'act_2': [[(JOB_FAILED, 0)], [(JOB_FAILED, 0)]],
+    }
+    graph.pages = {'act_1': [[{'spend': '1'}]]}
+    jobs = asyncio.run(scheduler(max_attempts=2).run([('act_1', 't1'), ('act_2', 't1')]))
+
+    by_account = {job.account_id: job for job in jobs}
+    assert by_account['act_1'].attempts == 2
+    assert by_account['act_1'].results == [{'spend': '1'}]
+    assert by_account['act_2'].attempts == 2
+    assert by_account['act_2'].error == f"job ended with status {JOB_FAILED}"
+    assert by_account['act_2'].results is None
+
+
+def test_on_page_hands_over_results_one_page_at_a_time(graph):
+    graph.statuses = {'act_1': [[(JOB_COMPLETED, 100)]]}
+    graph.pages = {'act_1': [[{'spend': '1'}, {'spend': '2'}], [{'spend': '3'}]]}
+    pages = []
+
+    async def on_page(job, rows):
+        pages.append((job.account_id, rows))
+
+    job, = asyncio.run(scheduler(on_page=on_page).run([('act_1', 't1')]))
+    assert pages == [('act_1', [{'spend': '1'}, {'spend': '2'}]), ('act_1', [{'spend': '3'}])]
+    assert job.results is None and job.row_count == 3
+
+
+def test_poll_delay_stays_within_bounds(monkeypatch):
+    monkeypatch.setattr(meta_jobs.time, 'monotonic', lambda: 100.0)
+    sched = scheduler(min_poll=1.0, max_poll=30.0)
+    job = ReportJob('act_1', 't1')
+    job.submitted_at = 80.0
+
+    # 20s for 40% leaves ~30s, polled again halfway there
+    assert sched._poll_delay(job, 40) == 15.0
+    assert sched._poll_delay(job, 1) == 30.0
+    # No progress: exponential from min_poll
+    job.percent = 40
+    job.polls = 3
+    assert sched._poll_delay(job, 40) == 8.0
+    job.polls = 10
+    assert sched._poll_delay(job, 40) == 30.0
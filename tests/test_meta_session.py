@@ -0,0 +1,73 @@
+import asyncio
+
+from aiohttp import web
+
+from benchmarks.bench_report import free_port
+from benchmarks.fakes import FakeBackend
+from utils.meta_session import MetaSessionPool
+
+DAY = '2024-01-02'
+PARAMS = {'level': 'adset', 'time_range': {'since': DAY, 'until': DAY}}
+
+
+def with_graph(backend, fn):
+    """Serve `backend` and call fn(pool) in a worker thread, returning its result."""
+    port = free_port()
+
+    async def run():
+        runner = web.AppRunner(backend.app())
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        pool = MetaSessionPool(pool_size=4, timeout=10, graph_url=f"http://127.0.0.1:{port}",
+                               rate_options={'base_pause': 0.01, 'max_pause': 0.05},
+                               max_throttle_retries=2)
+        try:
+            return await asyncio.to_thread(fn, pool)
+        finally:
+            pool.close()
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_batch_first_pages_then_follow_cursors():
+    backend = FakeBackend(latency=0, jitter=0, rows_per_account=5, page_size=2)
+
+    def fetch(pool):
+        session = pool.get('token-1')
+        events = list(session.iter_insights_batch(['act_1', 'act_2'], ['spend', 'adset_name'], PARAMS))
+        return events, pool.rate_states()
+
+    events, states = with_graph(backend, fetch)
+    for account_id in ('act_1', 'act_2'):
+        mine = [(kind, value) for kind, a, value in events if a == account_id]
+        assert [kind for kind, _ in mine] == ['rows', 'rows', 'rows', 'done']
+        rows = [row for _, page in mine[:-1] for row in page]
+        assert [row['adset_name'] for row in rows] == [f"Adset {account_id[-4:]}-{i}" for i in range(5)]
+        assert all(row['date_start'] == DAY for row in rows)
+    # One batch for both first pages, two cursor pages per account
+    assert backend.calls['graph_batch'] == 1
+    assert backend.calls['graph_result'] == 4
+    assert list(states) == ['token-1']
+
+
+def test_fetch_collects_rows_per_account():
+    backend = FakeBackend(latency=0, jitter=0, rows_per_account=3)
+    results, errors = with_graph(backend, lambda pool: pool.get('token-1').fetch_insights_batch(
+        ['act_1', 'act_2'], ['spend'], PARAMS, page_size=2
+    ))
+    assert errors == {}
+    assert {a: len(rows) for a, rows in results.items()} == {'act_1': 3, 'act_2': 3}
+
+
+def test_throttled_accounts_are_retried_then_given_up():
+    # Two calls per token and minute: the third account is always throttled
+    backend = FakeBackend(latency=0, jitter=0, rows_per_account=1, rate_limit=2, rate_window=60)
+    results, errors = with_graph(backend, lambda pool: pool.get('token-1').fetch_insights_batch(
+        ['act_1', 'act_2', 'act_3'], ['spend'], PARAMS
+    ))
+    assert sorted(results) == ['act_1', 'act_2']
+    assert errors == {'act_3': 'rate limited'}
+    # The first batch plus max_throttle_retries retries of the throttled account
+    assert backend.calls['graph_batch'] == 3
+    assert backend.calls['graph_throttled'] == 3
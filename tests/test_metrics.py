@@ -0,0 +1,69 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from benchmarks.bench_report import free_port
+from utils.metrics import Metrics, MetricsServer, percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert [percentile(values, q) for q in (0, 0.2, 0.5, 0.95, 1)] == [1, 1, 3, 5, 5]
+    assert percentile([], 0.5) == 0.0
+
+
+def test_spans_keep_a_window_and_merge_labels():
+    metrics = Metrics(window=3)
+    for seconds in (1, 2, 3, 4):
+        metrics.observe('fetch', seconds, source='meta')
+    metrics.observe('fetch', 10, source='ringba')
+    # Quantiles see the last `window` spans per label set, totals see everything
+    assert metrics.stage_summary() == {'fetch': (4, [3, 10])}
+    assert metrics.stage_totals() == {'fetch': 20.0}
+
+    with pytest.raises(RuntimeError):
+        with metrics.span('publish'):
+            raise RuntimeError('boom')
+    # A failed block is still timed
+    assert metrics.stage_summary()['publish'][0] == 1
+
+
+def test_counters_and_render():
+    metrics = Metrics()
+    metrics.inc('api_calls', api='meta')
+    metrics.inc('api_calls', 2, api='meta')
+    metrics.inc('api_calls', api='ringba')
+    metrics.inc('rows', 7, source='x"y')
+    metrics.observe('fetch', 0.5, source='meta')
+    assert metrics.counter_totals() == {'api_calls': 4, 'rows': 7}
+
+    text = metrics.render()
+    assert 'admatchr_api_calls_total{api="meta"} 3' in text
+    assert 'admatchr_api_calls_total{api="ringba"} 1' in text
+    assert 'admatchr_rows_total{source="x\\"y"} 7' in text
+    assert 'admatchr_stage_seconds{stage="fetch",source="meta",quantile="0.5"} 0.500000' in text
+    assert 'admatchr_stage_seconds_count{stage="fetch",source="meta"} 1' in text
+
+    metrics.reset()
+    assert metrics.counter_totals() == {} and metrics.stage_totals() == {}
+
+
+def test_server_exposes_metrics():
+    port = free_port()
+    metrics = Metrics()
+    metrics.inc('retries', api='meta')
+
+    async def scrape():
+        server = MetricsServer(metrics, port=port)
+        await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                    return resp.headers['Content-Type'], await resp.text()
+        finally:
+            await server.stop()
+
+    content_type, text = asyncio.run(scrape())
+    assert content_type.startswith('text/plain')
+    assert 'admatchr_retries_total{api="meta"} 1' in text
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+from utils.rate_control import RateController, is_throttle_error, parse_usage
+
+
+def usage(pct, regain_minutes=0):
+    return {'X-Business-Use-Case-Usage': json.dumps({'123': [{
+        'type': 'ads_insights', 'call_count': pct, 'total_cputime': 1, 'total_time': 1,
+        'estimated_time_to_regain_access': regain_minutes,
+    }]})}
+
+
+class GraphError:
+    def __init__(self, code, subcode=None):
+        self.code, self.subcode = code, subcode
+
+    def api_error_code(self):
+        return self.code
+
+    def api_error_subcode(self):
+        return self.subcode
+
+
+def test_parse_usage_takes_the_highest_header():
+    headers = dict(usage(40), **{'x-ad-account-usage': json.dumps({'acc_id_util_pct': 55, 'reset_time_duration': 0})})
+    assert parse_usage(headers) == (55.0, 0)
+    assert parse_usage(usage(10, regain_minutes=2)) == (10.0, 120.0)
+    # Batch items carry headers as name/value pairs
+    assert parse_usage([{'name': 'x-app-usage', 'value': json.dumps({'call_count': 12})}]) == (12.0, 0)
+    assert parse_usage({'content-type': 'application/json'}) == (None, 0)
+    assert parse_usage({'x-app-usage': 'not json'}) == (None, 0)
+
+
+def test_throttle_errors():
+    assert is_throttle_error(GraphError(17))
+    assert is_throttle_error(GraphError(100, 2446079))
+    assert not is_throttle_error(GraphError(100, 33))
+
+
+def test_limit_grows_additively_below_target():
+    rate = RateController(target=75, max_limit=10)
+    rate.limit = 2.0
+    for _ in range(4):
+        rate.observe(usage(10))
+    # +1/limit per call: about one step per window of `limit` calls
+    assert 3.0 < rate.limit < 4.0
+    for _ in range(100):
+        rate.observe(usage(10))
+    assert rate.limit == 10
+    # Between 80% of the target and the target nothing changes
+    rate.observe(usage(70))
+    assert rate.limit == 10
+
+
+def test_limit_halves_at_target_once_per_cooldown():
+    rate = RateController(target=75, max_limit=8, cooldown=60)
+    rate.observe(usage(80))
+    assert rate.state()[:3] == (4, 0.1, 80.0)
+    rate.observe(usage(95))
+    assert rate.state()[0] == 4
+
+    fast = RateController(target=75, max_limit=8, min_limit=1, cooldown=0)
+    for _ in range(10):
+        fast.observe(usage(90))
+    assert fast.state()[0] == 1
+    # Spacing starts at 0.1s and stretches by half on each decrease
+    assert round(fast.interval, 6) == round(0.1 * 1.5 ** 9, 6)
+
+
+def test_throttle_pauses_with_exponential_backoff():
+    rate = RateController(max_limit=8, base_pause=5, max_pause=300, cooldown=60)
+    before = time.monotonic()
+    rate.throttled()
+    first = rate.paused_until - before
+    rate.throttled()
+    second = rate.paused_until - before
+    # Each throttle ignores the cooldown and halves again
+    assert rate.state()[0] == 2
+    assert 4.9 < first <= 5.1
+    assert 9.9 < second <= 10.1
+    # A regain-access time longer than the backoff wins
+    rate.throttled(usage(99, regain_minutes=10))
+    assert rate.paused_until - before >= 600
+
+
+def test_acquire_respects_the_concurrency_limit():
+    rate = RateController(max_limit=2)
+    rate.acquire()
+    rate.acquire()
+    started = threading.Event()
+
+    def third():
+        rate.acquire()
+        started.set()
+
+    thread = threading.Thread(target=third)
+    thread.start()
+    assert not started.wait(0.1)
+    rate.release()
+    assert started.wait(1)
+    thread.join()
+    assert rate.state()[3] == 2
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import cogs.daily_general_report as report
+from utils import response_cache
+from utils.response_cache import ResponseCache, cache_key
+
+BODY = {'fields': ['spend'], 'params': {'level': 'adset'}}
+OLD = '2024-01-02'
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, 'time', SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'), ttl_today=60, ttl_recent=600, settled_days=3)
+    yield cache
+    cache.close()
+
+
+def test_hit_and_miss(cache):
+    assert cache.get('meta', 'act_1', OLD, OLD, BODY) is None
+    cache.put('meta', 'act_1', OLD, OLD, BODY, [{'spend': '1.00'}])
+    assert cache.get('meta', 'act_1', OLD, OLD, BODY) == [{'spend': '1.00'}]
+    # Another scope, range or body is another entry
+    assert cache.get('meta', 'act_2', OLD, OLD, BODY) is None
+    assert cache.get('meta', 'act_1', OLD, '2024-01-03', BODY) is None
+    assert cache.get('meta', 'act_1', OLD, OLD, dict(BODY, fields=['cpm'])) is None
+    assert cache_key('meta', 'a', OLD, OLD, {'x': 1, 'y': 2}) == cache_key('meta', 'a', OLD, OLD, {'y': 2, 'x': 1})
+
+
+def test_ttl_depends_on_the_age_of_the_last_day(cache, clock):
+    today = date.today()
+    recent = (today - timedelta(days=1)).isoformat()
+    assert cache.ttl_for(today.isoformat()) == 60
+    assert cache.ttl_for(recent) == 600
+    assert cache.ttl_for(OLD) is None
+
+    cache.put('meta', 'a', recent, today.isoformat(), BODY, 'today')
+    cache.put('meta', 'a', recent, recent, BODY, 'recent')
+    cache.put('meta', 'a', OLD, OLD, BODY, 'settled')
+    clock.now += 61
+    assert cache.get('meta', 'a', recent, today.isoformat(), BODY) is None
+    assert cache.get('meta', 'a', recent, recent, BODY) == 'recent'
+    clock.now += 600
+    assert cache.get('meta', 'a', recent, recent, BODY) is None
+    clock.now += 10 ** 9
+    assert cache.get('meta', 'a', OLD, OLD, BODY) == 'settled'
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'cache'), max_bytes=350)
+    try:
+        for i in range(3):
+            cache.put('meta', f"act_{i}", OLD, OLD, BODY, 'x' * 100)
+            clock.now += 1
+        # Reading act_0 makes act_1 the oldest entry
+        assert cache.get('meta', 'act_0', OLD, OLD, BODY)
+        clock.now += 1
+        cache.put('meta', 'act_3', OLD, OLD, BODY, 'x' * 100)
+        kept = [i for i in range(4) if cache.get('meta', f"act_{i}", OLD, OLD, BODY)]
+        assert kept == [0, 2, 3]
+    finally:
+        cache.close()
+
+
+class FakeSession:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def fetch_insights_batch(self, accounts, fields, params):
+        self.calls.append(list(accounts))
+        return {a: [{'account_id': a}] for a in accounts}, {}
+
+
+def test_batch_fetch_skips_cached_accounts(cache, monkeypatch):
+    monkeypatch.setattr(report, 'META_FETCH_MODE', 'batch')
+    calls = []
+    cog = report.DailyGeneralReport.__new__(report.DailyGeneralReport)
+    cog.cache, cog.jobs = cache, None
+    cog.meta_sessions = SimpleNamespace(get=lambda token: FakeSession(calls))
+
+    first = asyncio.run(cog.fetch_account_results(OLD, OLD, [(['act_1'], 't1')]))
+    assert first == {'act_1': [{'account_id': 'act_1'}]}
+    groups = [(['act_1', 'act_2'], 't1'), (['act_3'], 't2')]
+    results = asyncio.run(cog.fetch_account_results(OLD, OLD, groups))
+    assert set(results) == {'act_1', 'act_2', 'act_3'}
+    assert sorted(calls) == [['act_1'], ['act_2'], ['act_3']]
+
+    # Everything cached: no batch request at all
+    calls.clear()
+    asyncio.run(cog.fetch_account_results(OLD, OLD, groups))
+    assert calls == []
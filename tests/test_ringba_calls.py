@@ -0,0 +1,74 @@
+import csv
+
+from utils.matcher import match_key
+from utils.ringba_calls import CallColumns, Vocabulary
+
+HOUR = 3600 * 1000
+T0 = 1707162000000   # 2024-02-05T19:40Z
+
+
+def call(campaign='A', publisher='P', sub5='s', call_dt=T0, duration=0, revenue=0, converted=None):
+    return {'campaignName': campaign, 'publisherName': publisher, 'tag:User:sub5': sub5,
+            'callDt': call_dt, 'connectedCallLengthInSeconds': duration,
+            'conversionAmount': revenue, 'hasConverted': converted}
+
+
+def test_vocabulary_stores_each_normalized_value_once():
+    vocab = Vocabulary(match_key)
+    assert [vocab.encode(v) for v in ('Debt_A', ' debt_a', 'Other', None, 'DEBT_A')] == [0, 0, 1, 2, 0]
+    assert vocab.values == ['debt_a', 'other', '']
+
+
+def test_aggregate_by_campaign_and_publisher():
+    columns = CallColumns()
+    columns.extend_records([
+        call('A', 'P1', duration=60, revenue='10.5'),
+        call('A', 'P1', duration=0),
+        call('A', 'P2', duration=30, revenue=0, converted=True),
+        call('B', 'P1', duration='bad', revenue=''),
+    ])
+    assert len(columns) == 4
+    assert columns.aggregate(('campaign', 'publisher')) == [
+        {'campaign': 'A', 'publisher': 'P1', 'callCount': 2, 'connectedCallCount': 1,
+         'convertedCalls': 1, 'conversionAmount': 10.5, 'callLengthInSeconds': 60},
+        {'campaign': 'A', 'publisher': 'P2', 'callCount': 1, 'connectedCallCount': 1,
+         'convertedCalls': 1, 'conversionAmount': 0.0, 'callLengthInSeconds': 30},
+        {'campaign': 'B', 'publisher': 'P1', 'callCount': 1, 'connectedCallCount': 0,
+         'convertedCalls': 0, 'conversionAmount': 0.0, 'callLengthInSeconds': 0},
+    ]
+    # Calls under the threshold do not count as connected
+    assert columns.aggregate(('campaign',), min_duration=45)[0]['connectedCallCount'] == 1
+    assert CallColumns().aggregate() == []
+
+
+def test_hourly_rollups_are_chronological():
+    columns = CallColumns(normalize_sub5=match_key)
+    columns.extend_records([
+        call(sub5='X', call_dt=T0 + 2 * HOUR), call(sub5='x ', call_dt=T0),
+        call(sub5='X', call_dt=T0 + 2 * HOUR + 60000), call(sub5='y', call_dt=T0 + 10),
+    ])
+    assert [(r['hour'], r['sub5'], r['callCount']) for r in columns.aggregate(('hour', 'sub5'))] == [
+        ('2024-02-05T19:00Z', 'x', 1), ('2024-02-05T19:00Z', 'y', 1), ('2024-02-05T21:00Z', 'x', 2),
+    ]
+
+
+def test_csv_export_matches_api_records(tmp_path):
+    path = tmp_path / 'calls.csv'
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Campaign', 'Publisher', 'sub5', 'Call Date', 'Connected Call Length', 'Revenue',
+                         'Converted', 'Ignored'])
+        writer.writerow(['A', 'P', 's', T0, '60', '10', 'false', 'x'])
+        writer.writerow(['A', 'P', 's', T0, '0', '0', 'TRUE', 'x'])
+        writer.writerow(['A', 'P', 's', T0 + HOUR, '30', '5', ''])
+
+    from_csv = CallColumns()
+    from_csv.extend_csv(path)
+    from_api = CallColumns()
+    from_api.extend_records([
+        call(duration=60, revenue=10, converted=False), call(converted=True),
+        call(call_dt=T0 + HOUR, duration=30, revenue=5),
+    ])
+    for by in (('campaign', 'publisher', 'sub5'), ('hour',)):
+        assert from_csv.aggregate(by) == from_api.aggregate(by)
+    assert from_csv.aggregate()[0]['convertedCalls'] == 2
@@ -0,0 +1,107 @@
+import json
+import os
+
+from utils.ringba_client import RingbaClient, format_timespan, merge_records, timespan_to_seconds, to_number
+
+
+def record(campaign='C', sub5='S', publisher='P', **values):
+    return dict({'campaignName': campaign, 'tag:User:sub5': sub5, 'publisherName': publisher}, **values)
+
+
+def report(*records):
+    return {'isSuccessful': True, 'report': {'records': list(records)}}
+
+
+def test_to_number_parses_formatted_values():
+    assert to_number('1,234.5') == 1234.5
+    assert to_number('12.5%') == 12.5
+    assert to_number('$3') == 3.0
+    assert to_number('') == 0.0
+    assert to_number(None) == 0.0
+    assert to_number('n/a') == 0.0
+
+
+def test_timespans_round_trip():
+    assert timespan_to_seconds('26:01:05') == 26 * 3600 + 65
+    assert timespan_to_seconds(90) == 90.0
+    assert timespan_to_seconds('bad') == 0.0
+    assert format_timespan(26 * 3600 + 65) == '26:01:05'
+
+
+def test_merge_sums_counts_per_group():
+    merged = merge_records([
+        [record(callCount=2, connectedCallCount=1), record(campaign='D', callCount=1)],
+        [record(callCount=3, connectedCallCount=3)],
+    ])
+    assert [(r['campaignName'], r['callCount'], r.get('connectedCallCount')) for r in merged] == [
+        ('C', 5, 4), ('D', 1, None),
+    ]
+    assert isinstance(merged[0]['callCount'], int)
+
+
+def test_merge_rounds_money_to_cents():
+    merged = merge_records([
+        [record(callCount=1, conversionAmount=0.1, payoutAmount=0.1, totalCost=0.1, profitGross=0.1)],
+        [record(callCount=1, conversionAmount=0.2, payoutAmount=0.2, totalCost=0.2, profitGross=0.2)],
+    ])
+    for column in ('conversionAmount', 'payoutAmount', 'totalCost', 'profitGross'):
+        assert merged[0][column] == 0.3
+        assert str(merged[0][column]) == '0.3'
+
+
+def test_merge_reweights_ratios_and_timespans():
+    merged = merge_records([
+        [record(callCount=1, connectedCallCount=1, conversionAmount=10, earningsPerCallGross=10,
+                convertedPercent='100.00%', avgHandleTime='00:01:00', callLengthInSeconds='00:01:00')],
+        [record(callCount=3, connectedCallCount=3, conversionAmount=0, earningsPerCallGross=0,
+                convertedPercent='0.00%', avgHandleTime='00:03:00', callLengthInSeconds='00:09:00')],
+    ])
+    rec = merged[0]
+    assert rec['earningsPerCallGross'] == 2.5
+    assert rec['convertedPercent'] == '25.00%'
+    assert rec['avgHandleTime'] == '00:02:30'
+    assert rec['callLengthInSeconds'] == '00:10:00'
+
+
+def single_window():
+    with open(os.path.join(os.path.dirname(__file__), 'data', 'ringba_insights.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)['report']['records']
+
+
+def by_group(records):
+    return {tuple(r.get(c) for c in ('campaignName', 'tag:User:sub5', 'publisherName')): r for r in records}
+
+
+def test_merging_disjoint_windows_matches_the_single_window():
+    records = single_window()
+    merged = merge_records([records[::2], records[1::2]])
+    assert by_group(merged) == by_group(records)
+    # Absent columns stay absent and formatted cells keep their formatting
+    assert any('tag:User:sub5' not in r for r in merged)
+    assert ' 00:01:00' in [r.get('callLengthInSeconds') for r in merged]
+
+
+def test_merging_a_split_group_matches_the_single_window():
+    single = record(callCount=4, connectedCallCount=2, conversionAmount=30, convertedPercent='50.00%',
+                    callLengthInSeconds='00:03:00', avgHandleTime='00:01:30')
+    parts = [
+        [record(callCount=1, connectedCallCount=1, conversionAmount=10, convertedPercent='100.00%',
+                callLengthInSeconds='00:01:00', avgHandleTime='00:01:00')],
+        [record(callCount=3, connectedCallCount=1, conversionAmount=20, convertedPercent='33.33%',
+                callLengthInSeconds='00:02:00', avgHandleTime='00:02:00')],
+    ]
+    merged, = merge_records(parts)
+    assert merged == single
+    assert list(merged) == list(single)
+
+
+def test_truncation_is_checked_per_group():
+    client = RingbaClient('account', 'token', max_results=4)
+    # Six records in all, but no group holds four children
+    spread = report(*[record(campaign=f"C{i % 2}", sub5=f"S{i}") for i in range(4)],
+                    record(campaign='C2'), record(campaign='C2', sub5='T'))
+    assert not client.is_truncated(spread)
+    assert client.is_truncated(report(*[record(campaign=f"C{i}") for i in range(4)]))
+    assert client.is_truncated(report(*[record(sub5=f"S{i}") for i in range(4)]))
+    assert client.is_truncated(report(*[record(publisher=f"P{i}") for i in range(4)]))
+    assert not client.is_truncated(report())
@@ -0,0 +1,136 @@
+import json
+import os
+
+import pytest
+
+from utils.ringba_live import CallAggregator, normalize_event, parse_call_time, report_day
+
+# 2024-01-02 10:00:00Z, well inside the 2024-01-02 report day
+AT = 1704189600000
+
+
+def start(call_id, at=AT, sub5='S', **extra):
+    return dict({'callId': call_id, 'callDt': at, 'campaignName': 'C', 'tag:User:sub5': sub5,
+                 'publisherName': 'P'}, **extra)
+
+
+def end(call_id, connected=True, converted=False, seconds=60, revenue=0, payout=0, cost=0):
+    return {'callId': call_id, 'ended': True, 'connected': connected, 'converted': converted,
+            'callLengthInSeconds': seconds, 'conversionAmount': revenue,
+            'payoutAmount': payout, 'totalCost': cost}
+
+
+def by_group(records):
+    return {(r['campaignName'], r['tag:User:sub5'], r['publisherName']): r for r in records}
+
+
+@pytest.fixture
+def live(tmp_path):
+    return CallAggregator(str(tmp_path / 'live'))
+
+
+def test_call_times_and_report_days():
+    assert parse_call_time(AT) == parse_call_time(AT / 1000) == parse_call_time('2024-01-02T10:00:00Z')
+    # Report days run 05:00Z to 04:59:59Z
+    assert report_day(parse_call_time('2024-01-02T04:59:59Z')) == '2024-01-01'
+    assert report_day(parse_call_time('2024-01-02T05:00:00Z')) == '2024-01-02'
+    assert normalize_event({'inboundCallId': 'x', 'revenue': '', 'sub5': 'S'}) == {'callId': 'x', 'tag:User:sub5': 'S'}
+
+
+def test_events_of_a_call_merge_into_one_call(live):
+    assert live.add(start('a')) == '2024-01-02'
+    live.add(start('b'))
+    live.add(end('a', converted=True, seconds=125, revenue=37.04, payout=20, cost=20))
+    live.add(end('b', connected=False, seconds=0))
+    rec, = live.records('2024-01-02')
+    assert (rec['callCount'], rec['liveCallCount'], rec['endedCalls'], rec['connectedCallCount']) == (2, 0, 2, 1)
+    assert (rec['convertedCalls'], rec['payoutCount'], rec['nonConnectedCallCount']) == (1, 1, 1)
+    assert rec['conversionAmount'] == 37.04
+    assert rec['profitGross'] == 17.04
+    assert rec['callLengthInSeconds'] == '00:02:05'
+    assert rec['avgHandleTime'] == '00:02:05'
+    assert rec['convertedPercent'] == '50.00%'
+
+
+def test_redelivered_events_do_not_double_count(live):
+    for _ in range(3):
+        live.add(start('a'))
+        live.add(end('a', revenue=10))
+    rec, = live.records('2024-01-02')
+    assert rec['callCount'] == 1
+    assert rec['conversionAmount'] == 10
+
+
+def test_events_without_a_call_id_are_skipped(live):
+    live.add(start('a'))
+    event = start(None)
+    assert live.add(event) is None
+    assert live.add(event) is None
+    rec, = live.records('2024-01-02')
+    assert rec['callCount'] == 1
+
+
+def test_a_call_moving_groups_leaves_its_old_group(live):
+    live.add(start('a', sub5='old'))
+    live.add({'callId': 'a', 'tag:User:sub5': 'new'})
+    assert [r['tag:User:sub5'] for r in live.records('2024-01-02')] == ['new']
+
+
+def test_money_is_rounded_to_cents(live):
+    live.add(dict(start('a'), **end('a', revenue=0.1)))
+    live.add(dict(start('b'), **end('b', revenue=0.2)))
+    rec, = live.records('2024-01-02')
+    assert rec['conversionAmount'] == 0.3
+    assert str(rec['profitGross']) == '0.3'
+
+
+def test_restart_rebuilds_the_same_aggregates(live):
+    live.add(start('a'))
+    live.add(start('b', sub5='T'))
+    live.add(end('a', converted=True, revenue=12.5))
+    assert live.flush(today='2024-01-02') == 1
+    assert live.flush(today='2024-01-02') == 0
+
+    restarted = CallAggregator(live.folder)
+    restarted.load()
+    assert by_group(restarted.records('2024-01-02')) == by_group(live.records('2024-01-02'))
+    assert not restarted.dirty
+    # Events after the restart still merge with the calls from before it
+    restarted.add(end('b', revenue=5))
+    assert sum(r['callCount'] for r in restarted.records('2024-01-02')) == 2
+    assert sum(r['conversionAmount'] for r in restarted.records('2024-01-02')) == 17.5
+
+
+def test_a_call_keeps_the_day_of_its_first_event_across_a_restart(live):
+    # Starts 04:59Z, before the 05:00Z day boundary, and ends after it
+    live.add(start('a', at='2024-01-02T04:59:00Z'))
+    live.add(dict(end('a'), callDt='2024-01-02T05:02:00Z'))
+    assert live.days() == ['2024-01-01']
+    live.flush(today='2024-01-02')
+
+    restarted = CallAggregator(live.folder)
+    restarted.load()
+    restarted.add(dict(end('a', revenue=3), callDt='2024-01-02T05:03:00Z'))
+    assert restarted.days() == ['2024-01-01']
+    assert restarted.records('2024-01-01')[0]['conversionAmount'] == 3
+
+
+def test_flush_forgets_old_days(live):
+    live.add(start('old', at='2024-01-01T10:00:00Z'))
+    live.add(start('new', at='2024-01-05T10:00:00Z'))
+    live.flush(today='2024-01-05')
+    assert live.days() == ['2024-01-05']
+    assert sorted(os.listdir(live.folder)) == ['2024-01-05.json']
+    with open(os.path.join(live.folder, '2024-01-05.json'), 'r', encoding='utf-8') as f:
+        assert list(json.load(f)['calls']) == ['new']
+
+
+def test_reconcile_against_the_pull(live):
+    live.add(dict(start('a'), **end('a', revenue=10)))
+    pulled = [{'campaignName': 'C', 'tag:User:sub5': 'S', 'publisherName': 'P', 'callCount': 2,
+               'conversionAmount': '12.50'},
+              {'campaignName': 'C', 'tag:User:sub5': 'X', 'publisherName': 'P', 'callCount': 1}]
+    assert live.reconcile('2024-01-02', pulled) == {
+        'live_calls': 1, 'pulled_calls': 3, 'live_revenue': 10.0, 'pulled_revenue': 12.5,
+        'missing_groups': [('C', 'X', 'P')], 'extra_groups': [],
+    }
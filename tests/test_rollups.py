@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from utils.rollups import RollupSink, RollupStore, bucket_start, day_contributions
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RollupStore(str(tmp_path / 'rollups.sqlite3'))
+    yield store
+    store.close()
+
+
+def meta_row(adset, spend, publisher='BM1', cpm='10', clicks='3'):
+    return {'publisher': publisher, 'account_name': 'Account', 'adset_name': adset,
+            'spend': spend, 'cpm': cpm, 'inline_link_click': clicks}
+
+
+def ringba_row(sub5, revenue, calls=2, converted=1, campaign='Campaign'):
+    return {'publisherName': 'Pub', 'tag:User:sub5': sub5, 'campaignName': campaign,
+            'callCount': calls, 'convertedCalls': converted, 'conversionAmount': revenue,
+            'payoutAmount': 0, 'totalCost': 0}
+
+
+def by_key(rows):
+    # Adsets are keyed by match_key, lower-cased
+    return {r['key']: r for r in rows}
+
+
+def test_buckets():
+    assert bucket_start('week', '2024-01-03') == '2024-01-01'
+    assert bucket_start('week', '2024-01-07') == '2024-01-01'
+    assert bucket_start('month', '2024-02-29') == '2024-02-01'
+
+
+def test_contributions_recover_impressions():
+    totals = day_contributions('meta', [meta_row('A', '5'), meta_row('B', '15', cpm='0')])
+    publisher = totals[('meta_publisher', 'BM1')]
+    assert publisher[0] == 2            # rows
+    assert publisher[1] == 20.0         # spend
+    assert publisher[3] == 500.0        # impressions: only the row with a CPM
+
+
+def test_apply_adds_days_into_buckets(store):
+    store.apply('meta', '2024-01-01', [meta_row('A', '10')])
+    store.apply('meta', '2024-01-02', [meta_row('A', '5')])
+    store.apply('ringba', '2024-01-02', [ringba_row('A', 30)])
+    week = by_key(store.query('week', 'adset', '2024-01-01', '2024-01-07'))
+    assert week['a']['spend'] == 15.0
+    assert week['a']['revenue'] == 30.0
+    assert week['a']['profit'] == 15.0
+    assert week['a']['roas'] == 2.0
+    assert week['a']['cpa'] == 15.0
+    assert store.days('meta') == ['2024-01-01', '2024-01-02']
+
+
+def test_publishers_stay_per_source(store):
+    store.apply('meta', '2024-01-01', [meta_row('A', '10', publisher='Pub')])
+    store.apply('ringba', '2024-01-01', [ringba_row('A', 30)])
+    meta, = store.query('week', 'meta_publisher', '2024-01-01', '2024-01-01')
+    ringba, = store.query('week', 'ringba_publisher', '2024-01-01', '2024-01-01')
+    assert (meta['key'], meta['spend'], meta['revenue']) == ('Pub', 10.0, 0.0)
+    assert (ringba['key'], ringba['spend'], ringba['revenue']) == ('Pub', 0.0, 30.0)
+    # No profit or ROAS from one source's half of the numbers
+    assert meta['profit'] == meta['roas'] == meta['cpa'] == ringba['profit'] == ''
+    assert meta['cpm'] == 10.0
+    assert by_key(store.query('week', 'adset', '2024-01-01', '2024-01-01'))['a']['profit'] == 20.0
+
+
+def test_reapplying_a_day_swaps_its_contribution(store):
+    store.apply('meta', '2024-01-01', [meta_row('A', '10'), meta_row('B', '4')])
+    store.apply('meta', '2024-01-02', [meta_row('A', '1')])
+    moved = store.apply('meta', '2024-01-01', [meta_row('A', '7'), meta_row('C', '2')])
+    assert moved > 0
+    for grain in ('week', 'month'):
+        rows = by_key(store.query(grain, 'adset', '2024-01-01', '2024-01-02'))
+        assert rows['a']['spend'] == 8.0
+        assert rows['c']['spend'] == 2.0
+        # No row of the bucket mentions B any more
+        assert 'b' not in rows
+    # Applying the same rows again moves nothing
+    assert store.apply('meta', '2024-01-01', [meta_row('A', '7'), meta_row('C', '2')]) == 0
+
+
+def test_float_sums_do_not_drift(store):
+    for _ in range(20):
+        store.apply('meta', '2024-01-01', [meta_row('A', '0.1')])
+        store.apply('meta', '2024-01-01', [meta_row('A', '0.3')])
+    assert by_key(store.query('month', 'adset', '2024-01-01', '2024-01-31'))['a']['spend'] == 0.3
+
+
+def test_sink_swaps_on_close(store):
+    header = ['publisher', 'account_name', 'adset_name', 'spend', 'cpm', 'inline_link_click']
+
+    async def publish(rows):
+        sink = RollupSink('rollups', store, 'meta', '2024-01-01')
+        await sink.open(header)
+        await sink.write([[r[c] for c in header] for r in rows])
+        return await sink.close()
+
+    asyncio.run(publish([meta_row('A', '10')]))
+    asyncio.run(publish([meta_row('A', '3')]))
+    assert by_key(store.query('week', 'adset', '2024-01-01', '2024-01-01'))['a']['spend'] == 3.0
+    # An empty stream leaves the day alone
+    assert asyncio.run(publish([])) == 0
+    assert by_key(store.query('week', 'adset', '2024-01-01', '2024-01-01'))['a']['spend'] == 3.0
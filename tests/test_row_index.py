@@ -0,0 +1,74 @@
+import pytest
+
+from utils.row_index import RowIndex, contiguous_runs, fingerprint, normalize_row, partition_of
+
+HEADER = ['date_start', 'name', 'value']
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = RowIndex(str(tmp_path / 'index.sqlite3'))
+    yield index
+    index.close()
+
+
+def day_rows(day, n, prefix='r'):
+    return [[day, f"{prefix}{i}", str(i)] for i in range(n)]
+
+
+def test_fingerprint_ignores_trailing_blanks_and_cell_types():
+    assert normalize_row(['a', 1, '', '']) == ['a', '1']
+    assert fingerprint(['a', 1, '']) == fingerprint(['a', '1'])
+    assert fingerprint(['a', '1']) != fingerprint(['a', '', '1'])
+    assert fingerprint(['ab', 'c']) != fingerprint(['a', 'bc'])
+    assert -2 ** 63 <= fingerprint(['x']) < 2 ** 63
+
+
+def test_contiguous_runs_and_partitions():
+    assert contiguous_runs(['h', 'a', 'a', 'b', 'a'], start_row=1) == [
+        ('h', 1, 1), ('a', 2, 2), ('b', 4, 1), ('a', 5, 1),
+    ]
+    assert partition_of(['2024-01-01', 'x']) == '2024-01-01'
+    assert partition_of([]) == ''
+
+
+def test_filter_new_uses_recorded_appends(index):
+    rows = day_rows('2024-01-01', 3)
+    index.record_append('S', [HEADER] + rows)
+    assert index.filter_new('S', rows + [['2024-01-01', 'new', '9']]) == [['2024-01-01', 'new', '9']]
+    # Same cells under another date are another row
+    assert index.filter_new('S', [['2024-01-02', 'r0', '0']]) == [['2024-01-02', 'r0', '0']]
+    assert index.spans('S', '2024-01-01') == [(2, 3)]
+    assert index.sheet_state('S') == (4, fingerprint(rows[-1]))
+
+
+def test_appends_below_a_partition_extend_its_span(index):
+    index.record_append('S', [HEADER] + day_rows('2024-01-01', 2))
+    index.record_append('S', day_rows('2024-01-01', 1, prefix='more') + day_rows('2024-01-02', 1))
+    index.record_append('S', day_rows('2024-01-01', 1, prefix='late'))
+    assert index.spans('S', '2024-01-01') == [(2, 3), (6, 1)]
+    assert index.spans('S', '2024-01-02') == [(5, 1)]
+
+
+def test_drop_partition_shifts_later_spans(index):
+    index.record_append('S', [HEADER] + day_rows('2024-01-01', 2) + day_rows('2024-01-02', 3))
+    index.drop_partition('S', '2024-01-01')
+    assert index.spans('S', '2024-01-02') == [(2, 3)]
+    assert index.sheet_state('S') == (4, None)
+
+
+def test_sync_downloads_only_drifted_partitions(index, sheets):
+    rows = [HEADER] + day_rows('2024-01-01', 3) + day_rows('2024-01-02', 2)
+    sheets.add_sheet('S', rows)
+    assert index.sync(sheets, 'id', 'S')
+    assert index.partition_counts('S') == {'date_start': 1, '2024-01-01': 3, '2024-01-02': 2}
+    assert not index.sync(sheets, 'id', 'S')
+
+    # Someone else appended to the last day
+    sheets.sheets['S'].append(['2024-01-02', 'late', '7'])
+    sheets.requests.clear()
+    assert index.sync(sheets, 'id', 'S')
+    downloaded = [r for method, ranges in sheets.requests if method == 'values.batchGet' for r in ranges]
+    assert downloaded == ["'S'!A5:Z7"]
+    assert index.filter_new('S', [['2024-01-02', 'late', '7']]) == []
+    assert index.spans('S', '2024-01-02') == [(5, 3)]
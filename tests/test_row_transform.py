@@ -0,0 +1,143 @@
+import asyncio
+import copy
+import csv
+import json
+import os
+import unicodedata
+from datetime import datetime
+
+import pytest
+
+from utils.row_transform import META_SCHEMA, RINGBA_SCHEMA, clean_string, time_to_seconds, truncate_3
+from utils.sinks import CsvSink
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+
+# ======================================
+#  The report CSV writers as they were before row_transform
+# ======================================
+def legacy_clean_string(text):
+    return ''.join(c for c in unicodedata.normalize('NFD', text)
+                   if unicodedata.category(c) != 'Mn').replace(' ', '_')
+
+
+def legacy_time_to_seconds(time_str):
+    try:
+        t = datetime.strptime(time_str, '%H:%M:%S')
+        return t.hour * 3600 + t.minute * 60 + t.second
+    except ValueError:
+        return 0
+
+
+def legacy_truncate(number, decimals=0):
+    factor = 10 ** decimals
+    return int(number * factor) / factor
+
+
+def legacy_meta_csv(data, path):
+    cols = ['date_start','date_stop','account_name','publisher','adset_name',
+            'cpc_link','ctr_link','inline_link_click','cpm','spend','avg_playtime']
+    with open(path, 'w', newline='', encoding='utf-8') as csvf:
+        w = csv.writer(csvf)
+        w.writerow(cols)
+        for row in data:
+            row['adset_name'] = legacy_clean_string(row['adset_name'])
+            w.writerow([row.get(c, '-no value-') for c in cols])
+
+
+def legacy_ringba_csv(response_json, since, path):
+    records = response_json.get('report', {}).get('records', [])
+    cols = ["date_start","date_stop","callCount","liveCallCount","endedCalls","connectedCallCount",
+            "payoutCount","convertedCalls","nonConnectedCallCount","duplicateCalls",
+            "blockedCalls","incompleteCalls","earningsPerCallGross","conversionAmount",
+            "payoutAmount","profitGross","profitMarginGross","convertedPercent",
+            "callLengthInSeconds","avgHandleTime","totalCost","publisherName",
+            "tag:User:sub5","campaignName"]
+    with open(path, 'w', newline='', encoding='utf-8') as csvf:
+        w = csv.writer(csvf)
+        w.writerow(cols)
+        for rec in records:
+            rec['callLengthInSeconds'] = legacy_time_to_seconds(rec.get('callLengthInSeconds', '00:00:00'))
+            rec['avgHandleTime'] = legacy_time_to_seconds(rec.get('avgHandleTime', '00:00:00'))
+            rec['earningsPerCallGross'] = legacy_truncate(float(rec.get('earningsPerCallGross',0)),3)
+            rec['tag:User:sub5'] = legacy_clean_string(rec.get('tag:User:sub5',''))
+            rec['date_start'] = since
+            rec['date_stop'] = since
+            w.writerow([rec.get(col, '-no value-') for col in cols])
+
+
+def load(name):
+    with open(os.path.join(DATA, name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# ======================================
+#  Tests
+# ======================================
+def test_meta_csv_matches_legacy_writer(tmp_path):
+    records = load('meta_insights.json')
+    legacy_meta_csv(copy.deepcopy(records), tmp_path / 'legacy.csv')
+    META_SCHEMA.write_csv(tmp_path / 'new.csv', records)
+    assert read_bytes(tmp_path / 'new.csv') == read_bytes(tmp_path / 'legacy.csv')
+
+
+def test_ringba_csv_matches_legacy_writer(tmp_path):
+    response = load('ringba_insights.json')
+    legacy_ringba_csv(copy.deepcopy(response), '2024-02-05', tmp_path / 'legacy.csv')
+    RINGBA_SCHEMA.write_csv(tmp_path / 'new.csv', response['report']['records'], since='2024-02-05')
+    assert read_bytes(tmp_path / 'new.csv') == read_bytes(tmp_path / 'legacy.csv')
+
+
+@pytest.mark.parametrize('source, schema', [('meta', META_SCHEMA), ('ringba', RINGBA_SCHEMA)])
+def test_csv_sink_matches_legacy_writer(tmp_path, source, schema):
+    if source == 'meta':
+        records = load('meta_insights.json')
+        legacy_meta_csv(copy.deepcopy(records), tmp_path / 'legacy.csv')
+    else:
+        response = load('ringba_insights.json')
+        records = response['report']['records']
+        legacy_ringba_csv(copy.deepcopy(response), '2024-02-05', tmp_path / 'legacy.csv')
+
+    async def publish():
+        sink = CsvSink('csv', str(tmp_path / 'new.csv'))
+        await sink.open(schema.header)
+        rows = list(schema.rows(records, since='2024-02-05'))
+        # Batches as the fan-out hands them over
+        for i in range(0, len(rows), 7):
+            await sink.write(rows[i:i + 7])
+        return await sink.close()
+
+    assert asyncio.run(publish()) == str(tmp_path / 'new.csv')
+    assert read_bytes(tmp_path / 'new.csv') == read_bytes(tmp_path / 'legacy.csv')
+
+
+def test_rows_leave_records_unchanged():
+    response = load('ringba_insights.json')
+    records = response['report']['records']
+    before = copy.deepcopy(records)
+    list(RINGBA_SCHEMA.rows(records, since='2024-02-05'))
+    assert records == before
+
+
+@pytest.mark.parametrize('value', [
+    '00:04:10', '00:00:60', '00:00:61', '1:2:3', '24:00:00', '00:60:00', ' 00:01:00',
+    '00:01:00 ', '01:02:03.5', '001:02:03', '1:02:3', '23:59:59', '', '١٢:٠٠:٠٠',
+])
+def test_time_to_seconds_matches_strptime(value):
+    assert time_to_seconds(value) == legacy_time_to_seconds(value)
+
+
+@pytest.mark.parametrize('value', ['Café Olé', 'naïve adset', '  spaced  ', '日本語 テスト', ''])
+def test_clean_string_matches_legacy(value):
+    assert clean_string(value) == legacy_clean_string(value)
+
+
+@pytest.mark.parametrize('value', [0, 7, '12.3456', 12.3456, '0.1', 49.99999, -3.14159])
+def test_truncate_3_matches_legacy(value):
+    assert truncate_3(value) == legacy_truncate(float(value), 3)
@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import cogs.daily_general_report as report
+from utils import run_manifest
+from utils.run_manifest import RunManifest, backoff_delay, meta_unit
+
+DAY = '2024-01-02'
+
+
+def insight(account_id, adset='A', spend='1.00'):
+    return {'date_start': DAY, 'date_stop': DAY, 'account_name': account_id, 'adset_name': adset,
+            'spend': spend}
+
+
+def test_backoff_is_full_jitter_under_a_cap(monkeypatch):
+    monkeypatch.setattr(run_manifest.random, 'uniform', lambda low, high: high)
+    assert [backoff_delay(attempt, base=2, cap=20) for attempt in range(5)] == [2, 4, 8, 16, 20]
+    monkeypatch.undo()
+    assert all(0 <= backoff_delay(3, base=2, cap=60) <= 16 for _ in range(100))
+
+
+def test_units_and_payloads_persist(tmp_path):
+    manifest = RunManifest(str(tmp_path), DAY)
+    assert manifest.record_success(meta_unit('act_1'), [{'spend': 1}])
+    manifest.record_failure(meta_unit('act_2'), RuntimeError('boom'))
+    manifest.record_failure('ringba', 'unsuccessful')
+    manifest.save()
+
+    loaded = RunManifest(str(tmp_path), DAY)
+    assert loaded.succeeded('meta:') == ['meta:act_1']
+    assert loaded.failed('meta:') == ['meta:act_2']
+    assert loaded.failed() == ['meta:act_2', 'ringba']
+    assert loaded.units['meta:act_2']['error'] == 'boom'
+    assert loaded.summary() == {'meta': (1, 1), 'ringba': (0, 1)}
+    assert loaded.payload(meta_unit('act_1')) == [{'spend': 1}]
+    assert loaded.payload(meta_unit('act_2')) is None
+    # A fresh manifest starts over
+    assert RunManifest(str(tmp_path), DAY, fresh=True).units == {}
+
+
+def test_attempts_count_and_payload_changes(tmp_path):
+    manifest = RunManifest(str(tmp_path), DAY)
+    unit = meta_unit('act_1')
+    manifest.record_failure(unit, 'boom')
+    assert manifest.record_success(unit, [{'spend': 1}])
+    assert not manifest.record_success(unit, [{'spend': 1}])
+    assert manifest.record_success(unit, [{'spend': 2}])
+    assert manifest.units[unit]['attempts'] == 4
+
+    # A discarded writer leaves the last payload in place
+    writer = manifest.open_payload(unit)
+    writer.write([{'spend': 3}])
+    writer.discard()
+    assert manifest.payload(unit) == [{'spend': 2}]
+
+
+@pytest.fixture
+def cog(tmp_path, monkeypatch):
+    monkeypatch.setattr(report, 'RUNS_FOLDER', str(tmp_path / 'runs'))
+    monkeypatch.setattr(report, 'UNIT_RETRIES', 2)
+    monkeypatch.setattr(report, 'backoff_delay', lambda *args: 0)
+    cog = report.DailyGeneralReport.__new__(report.DailyGeneralReport)
+    cog.day_locks, cog.jobs = {}, None
+    cog.accounts = SimpleNamespace(publisher=lambda account_id: 'BM1')
+    cog.meta_groups = lambda: [(['act_1', 'act_2', 'act_3'], 'token')]
+    cog.failing = {}   # account id -> rounds it still fails
+    cog.fetched = []
+    cog.published = []
+
+    async def stream_meta_pages(day, groups, errors):
+        for accounts, _ in groups:
+            for account_id in accounts:
+                cog.fetched.append(account_id)
+                if cog.failing.get(account_id, 0):
+                    cog.failing[account_id] -= 1
+                    errors[account_id] = 'boom'
+                    continue
+                yield account_id, [insight(account_id)]
+
+    async def publish_report(source, day, records):
+        cog.published = [row async for page in records for row in page]
+        return {'csv': 'report.csv'}
+
+    cog.stream_meta_pages = stream_meta_pages
+    cog.publish_report = publish_report
+    return cog
+
+
+def test_failed_units_are_retried_with_backoff(cog):
+    cog.failing = {'act_2': 1, 'act_3': 5}
+
+    async def run():
+        manifest = RunManifest(report.RUNS_FOLDER, DAY, fresh=True)
+        outcome = {}
+        rows = [row async for page in cog.meta_unit_pages(manifest, DAY, cog.meta_groups(), outcome) for row in page]
+        return manifest, outcome, rows
+
+    manifest, outcome, rows = asyncio.run(run())
+    assert outcome['fetched'] == ['act_1', 'act_2']
+    assert outcome['failed'] == ['act_3']
+    assert [r['account_name'] for r in rows] == ['act_1', 'act_2']
+    # One first round plus UNIT_RETRIES retries of what still failed
+    assert cog.fetched == ['act_1', 'act_2', 'act_3', 'act_2', 'act_3', 'act_3']
+    assert manifest.failed('meta:') == ['meta:act_3']
+    assert manifest.units['meta:act_3']['error'] == 'boom'
+
+
+def test_retry_failed_refetches_only_failed_units(cog):
+    manifest = RunManifest(report.RUNS_FOLDER, DAY, fresh=True)
+    manifest.record_success(meta_unit('act_1'), [insight('act_1', spend='5.00')])
+    manifest.record_failure(meta_unit('act_2'), 'boom')
+    manifest.record_success('ringba', [])
+    manifest.save()
+
+    messages = asyncio.run(cog.retry_failed(DAY))
+    assert cog.fetched == ['act_2']
+    assert messages[0] == "Meta: 1 of 1 failed accounts recovered."
+    # The day is republished from every unit's payload
+    assert sorted((r['account_name'], r['spend']) for r in cog.published) == [('act_1', '5.00'), ('act_2', '1.00')]
+    assert RunManifest(report.RUNS_FOLDER, DAY).failed() == []
+
+    cog.fetched.clear()
+    assert asyncio.run(cog.retry_failed(DAY)) == ["Nothing failed on 2024-01-02 (3 units succeeded)."]
+    assert cog.fetched == []
+    assert asyncio.run(cog.retry_failed('2024-01-03'))[0].startswith("No run manifest for 2024-01-03")
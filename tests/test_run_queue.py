@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from utils.run_queue import RunQueue
+
+
+class Runner:
+    def __init__(self):
+        self.started = []
+        self.release = asyncio.Event()
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, run):
+        self.started.append(run.since)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await self.release.wait()
+            run.messages.append(f"done {run.since}")
+        finally:
+            self.running -= 1
+
+
+def test_requests_for_a_running_date_join_it():
+    async def scenario():
+        runner = Runner()
+        queue = RunQueue(runner)
+        first = asyncio.create_task(queue.submit('2024-01-01', 'alice'))
+        second = asyncio.create_task(queue.submit('2024-01-01', 'bob'))
+        await asyncio.sleep(0)
+        runner.release.set()
+        a, b = await asyncio.gather(first, second)
+        assert a is b
+        assert a.requesters == ['alice', 'bob']
+        assert a.messages == ['done 2024-01-01']
+        assert runner.started == ['2024-01-01']
+        assert queue.in_flight == {}
+
+        # Once finished, the same date runs again
+        await queue.submit('2024-01-01', 'carol')
+        assert runner.started == ['2024-01-01', '2024-01-01']
+
+    asyncio.run(scenario())
+
+
+def test_at_most_limit_dates_run_at_once():
+    async def scenario():
+        runner = Runner()
+        queue = RunQueue(runner, limit=2)
+        tasks = [asyncio.create_task(queue.submit(f"2024-01-0{i}", 'u')) for i in range(1, 5)]
+        await asyncio.sleep(0.01)
+        assert runner.started == ['2024-01-01', '2024-01-02']
+        runner.release.set()
+        runs = await asyncio.gather(*tasks)
+        assert runner.peak == 2
+        assert all(run.started <= run.finished for run in runs)
+
+    asyncio.run(scenario())
+
+
+def test_a_cancelled_requester_leaves_the_shared_run_going():
+    async def scenario():
+        runner = Runner()
+        queue = RunQueue(runner)
+        impatient = asyncio.create_task(queue.submit('2024-01-01', 'alice'))
+        patient = asyncio.create_task(queue.submit('2024-01-01', 'bob'))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        runner.release.set()
+        run = await patient
+        assert run.messages == ['done 2024-01-01']
+
+    asyncio.run(scenario())
+
+
+def test_a_failed_run_is_forgotten():
+    async def failing(run):
+        raise RuntimeError('boom')
+
+    async def scenario():
+        queue = RunQueue(failing)
+        with pytest.raises(RuntimeError):
+            await queue.submit('2024-01-01', 'alice')
+        assert queue.in_flight == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import pytest
+
+from utils.row_index import RowIndex
+from utils.sheet_upsert import SheetUpserter, to_cell
+
+HEADER = ['date_start', 'name', 'value']
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = RowIndex(str(tmp_path / 'index.sqlite3'))
+    yield index
+    index.close()
+
+
+def day_rows(day, n, prefix='r'):
+    return [[day, f"{prefix}{i}", str(i)] for i in range(n)]
+
+
+def test_to_cell_keeps_values_raw():
+    assert to_cell(12.5) == {'userEnteredValue': {'stringValue': '12.5'}}
+    assert to_cell('') == {}
+
+
+def test_upsert_builds_one_batch_update(index, sheets):
+    sheets.add_sheet('S', [HEADER] + day_rows('2024-01-01', 2) + day_rows('2024-01-02', 2)
+                     + day_rows('2024-01-01', 1, prefix='late'))
+    upserter = SheetUpserter(index)
+    fresh = day_rows('2024-01-01', 3, prefix='new')
+    assert upserter.upsert(sheets, 'id', 'S', HEADER, fresh) == 3
+
+    updates = [body for method, body in sheets.requests if method == 'batchUpdate']
+    assert len(updates) == 1
+    requests = updates[0]['requests']
+    # Both runs of the day are deleted bottom up, so earlier indexes stay valid
+    assert [r['deleteDimension']['range'] for r in requests[:2]] == [
+        {'sheetId': 1, 'dimension': 'ROWS', 'startIndex': 5, 'endIndex': 6},
+        {'sheetId': 1, 'dimension': 'ROWS', 'startIndex': 1, 'endIndex': 3},
+    ]
+    # The sheet has a header already, so only the data rows are appended
+    appended = requests[2]['appendCells']['rows']
+    assert [[c['userEnteredValue']['stringValue'] for c in row['values']] for row in appended] == fresh
+    assert sheets.sheets['S'] == [HEADER] + day_rows('2024-01-02', 2) + fresh
+    assert index.spans('S', '2024-01-01') == [(4, 3)]
+
+
+def test_upsert_without_replace_adds_to_the_day(index, sheets):
+    sheets.add_sheet('S', [HEADER] + day_rows('2024-01-01', 2))
+    upserter = SheetUpserter(index)
+    more = day_rows('2024-01-01', 2, prefix='more')
+    upserter.upsert(sheets, 'id', 'S', HEADER, more, replace=False)
+    requests = [body for method, body in sheets.requests if method == 'batchUpdate'][0]['requests']
+    assert [list(r) for r in requests] == [['appendCells']]
+    assert sheets.sheets['S'] == [HEADER] + day_rows('2024-01-01', 2) + more
+    assert index.partition_counts('S')['2024-01-01'] == 4
+
+
+def test_upsert_writes_the_header_to_an_empty_sheet(index, sheets):
+    sheets.add_sheet('S')
+    SheetUpserter(index).upsert(sheets, 'id', 'S', HEADER, day_rows('2024-01-01', 1))
+    assert sheets.sheets['S'] == [HEADER] + day_rows('2024-01-01', 1)
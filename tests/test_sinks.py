@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from utils.sinks import BufferedSink, Sink, SinkFanout
+
+
+def test_sink_requires_write():
+    class Incomplete(Sink):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_buffered_sink_flushes_in_batches():
+    flushed = []
+
+    async def flush(header, rows, first):
+        flushed.append((list(rows), first))
+        return rows
+
+    async def run():
+        sink = BufferedSink('sheets', flush, batch_size=3)
+        fanout = SinkFanout([sink], ['n'], batch_size=2)
+        fanout.start()
+        await fanout.publish([i] for i in range(7))
+        return await fanout.finish()
+
+    assert asyncio.run(run()) == {'sheets': 7}
+    # Only the first batch replaces the day; the rest add to it
+    assert flushed == [
+        ([[0], [1], [2]], True), ([[3], [4], [5]], False), ([[6]], False),
+    ]
+
+
+def test_buffered_sink_skips_empty_streams():
+    async def flush(header, rows, first):
+        raise AssertionError("flushed an empty stream")
+
+    async def run():
+        sink = BufferedSink('sheets', flush)
+        await sink.open(['n'])
+        return await sink.close()
+
+    assert asyncio.run(run()) == 0
@@ -0,0 +1,182 @@
+# account_registry.py
+import asyncio
+import json
+import os
+from datetime import datetime
+
+import aiohttp
+
+GRAPH_URL = "https://graph.facebook.com"
+
+# Ids per Graph multi-id lookup
+LOOKUP_SIZE = 50
+
+
+async def graph_get(session, url, params):
+    async with session.get(url, params=params) as resp:
+        data = await resp.json(content_type=None)
+    if 'error' in data:
+        raise RuntimeError(data['error'].get('message', 'Graph API error'))
+    return data
+
+
+async def fetch_ad_accounts(session, token, graph_url=GRAPH_URL, api_version="v16.0", page_size=500,
+                            fields='id,name,account_status'):
+    """All ad accounts visible to a token, following paging cursors."""
+    url = f"{graph_url.rstrip('/')}/{api_version}/me/adaccounts"
+    params = {'access_token': token, 'fields': fields, 'limit': str(page_size)}
+    accounts = []
+    while url:
+        data = await graph_get(session, url, params)
+        accounts.extend(data.get('data', []))
+        # The next URL already carries the token and cursor
+        url = data.get('paging', {}).get('next')
+        params = None
+    return accounts
+
+
+async def fetch_account_details(session, token, ids, graph_url=GRAPH_URL, api_version="v16.0"):
+    """Name and status of the given ad accounts, LOOKUP_SIZE ids per request."""
+    url = f"{graph_url.rstrip('/')}/{api_version}/"
+    details = []
+    for i in range(0, len(ids), LOOKUP_SIZE):
+        chunk = ids[i:i + LOOKUP_SIZE]
+        data = await graph_get(session, url, {
+            'access_token': token, 'ids': ','.join(chunk), 'fields': 'id,name,account_status',
+        })
+        details.extend(data[account_id] for account_id in chunk if account_id in data)
+    return details
+
+
+class AccountRegistry:
+    """
+    Ad accounts per business manager, persisted as JSON.
+
+    `index` maps account id -> (business manager, access token), so the
+    fetch path and publisher labels need no list scans. Tokens come from the
+    environment and are never written to disk. The file is reloaded whenever
+    it changes on disk, e.g. after running update_adaccounts.py.
+    """
+
+    def __init__(self, path, tokens, exclude=()):
+        self.path = path
+        self.tokens = {label: token for label, token in tokens.items() if token}
+        self.exclude = set(exclude)
+        self.data = {'updated_at': None, 'business_managers': {}}
+        self.index = {}
+        self.mtime = None
+
+    def load(self, seed=None):
+        """Load the registry file, or start from `seed` ({label: [ids]}) when there is none."""
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+            self.mtime = os.path.getmtime(self.path)
+        elif seed:
+            self.data['business_managers'] = {
+                label: {'updated_at': None, 'accounts': [{'id': i} for i in ids]}
+                for label, ids in seed.items()
+            }
+        self.build_index()
+
+    def reload_if_changed(self):
+        """Pick up a registry file rewritten by another process."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+        self.load()
+        print(f"Account registry reloaded: {len(self.index)} accounts.")
+        return True
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp, self.path)
+        self.mtime = os.path.getmtime(self.path)
+
+    def build_index(self):
+        index = {}
+        for label, token in self.tokens.items():
+            entry = self.data['business_managers'].get(label, {})
+            for account in entry.get('accounts', []):
+                if account['id'] not in self.exclude:
+                    # An account shared by two business managers keeps the first
+                    index.setdefault(account['id'], (label, token))
+        self.index = index
+
+    def publisher(self, account_id):
+        """Business manager label of an account, or '' if unknown."""
+        return self.index.get(account_id, ('', None))[0]
+
+    def groups(self):
+        """[(account ids, token)] per business manager, in token order."""
+        grouped = {}
+        for account_id, (label, token) in self.index.items():
+            grouped.setdefault(label, ([], token))[0].append(account_id)
+        return [grouped[label] for label in self.tokens if label in grouped]
+
+    async def refresh(self, graph_url=GRAPH_URL, api_version="v16.0", full=False):
+        """
+        Re-discover accounts for every token concurrently. A token that fails
+        keeps its previous accounts. Returns {label: account count or error}.
+
+        Unless `full`, each token first lists only account ids and statuses;
+        a business manager whose list is unchanged is left as it is, and
+        names are looked up only for accounts it did not have before. The
+        file is rewritten only when some business manager changed.
+        """
+        labels = list(self.tokens)
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as session:
+            results = await asyncio.gather(*(
+                self._discover(session, label, graph_url, api_version, full) for label in labels
+            ), return_exceptions=True)
+
+        summary = {}
+        changed = False
+        now = datetime.now().isoformat(timespec='seconds')
+        for label, result in zip(labels, results):
+            if isinstance(result, Exception):
+                print(f"Account discovery failed for {label}: {result}")
+                summary[label] = f"error: {result}"
+                continue
+            entry = self.data['business_managers'].get(label, {})
+            previous = {a['id'] for a in entry.get('accounts', [])}
+            current = {a['id'] for a in result}
+            summary[label] = len(result)
+            if result == entry.get('accounts'):
+                continue
+            changed = True
+            self.data['business_managers'][label] = {'updated_at': now, 'accounts': result}
+            print(f"{label}: {len(result)} accounts "
+                  f"(+{len(current - previous)}, -{len(previous - current)}).")
+        if changed:
+            self.data['updated_at'] = now
+            await asyncio.to_thread(self.save)
+            self.build_index()
+        return summary
+
+    async def _discover(self, session, label, graph_url, api_version, full):
+        """The accounts of one token, reusing the names already known unless `full`."""
+        token = self.tokens[label]
+        known = {
+            a['id']: a for a in self.data['business_managers'].get(label, {}).get('accounts', [])
+            if 'name' in a
+        }
+        fields = 'id,name,account_status' if full else 'id,account_status'
+        listed = [
+            a for a in await fetch_ad_accounts(session, token, graph_url, api_version, fields=fields)
+            if a.get('id') not in self.exclude
+        ]
+        if not full:
+            new = [a['id'] for a in listed if a['id'] not in known]
+            names = {
+                a['id']: a.get('name', '')
+                for a in await fetch_account_details(session, token, new, graph_url, api_version)
+            }
+            for a in listed:
+                a['name'] = names.get(a['id'], known[a['id']]['name'] if a['id'] in known else '')
+        return [{'id': a['id'], 'name': a.get('name', ''), 'status': a.get('account_status')} for a in listed]
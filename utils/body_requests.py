@@ -16,7 +16,9 @@ def generate_report(start_date, end_date):
             {"column": "inboundPhoneNumber"},
             {"column": "number"},
             {"column": "numberId"},
-            {"column": "conversionAmount"}
+            {"column": "conversionAmount"},
+            {"column": "hasConverted"},
+            {"column": "tag:User:sub5"}
         ]
     }
 
@@ -0,0 +1,102 @@
+# google_clients.py
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import METRICS
+
+# Discovery API name -> version
+SERVICES = {
+    'sheets': 'v4',
+    'script': 'v1',
+}
+
+
+class GoogleClientManager:
+    """
+    Single entry point for Sheets and Apps Script calls.
+
+    Credentials are loaded and refreshed once and shared. Every call runs on
+    a small dedicated thread pool. Each worker thread keeps its own built
+    discovery clients over a keep-alive HTTP connection, because httplib2
+    connections must not be shared between threads. The Google libraries
+    are imported on first use, so creating the manager costs nothing.
+    """
+
+    def __init__(self, token_file, credentials_file, scopes, max_workers=4, timeout=120,
+                 api_endpoint=None):
+        self.token_file = token_file
+        self.api_endpoint = api_endpoint
+        self.credentials_file = credentials_file
+        self.scopes = scopes
+        self.timeout = timeout
+        self.creds = None
+        self.creds_lock = asyncio.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='google')
+        self.local = threading.local()
+
+    def close(self):
+        """Stop the worker threads."""
+        self.executor.shutdown(wait=False)
+
+    async def get_credentials(self):
+        """Load, refresh or obtain OAuth credentials, without blocking the event loop."""
+        async with self.creds_lock:
+            if self.creds and self.creds.valid:
+                return self.creds
+            from google.auth.transport.requests import Request
+            from google.oauth2.credentials import Credentials
+            from google_auth_oauthlib.flow import InstalledAppFlow
+
+            creds = self.creds
+            if creds is None and os.path.exists(self.token_file):
+                creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    await asyncio.to_thread(creds.refresh, Request())
+                else:
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        self.credentials_file, self.scopes
+                    )
+                    creds = await asyncio.to_thread(flow.run_local_server, port=0)
+                with open(self.token_file, 'w') as f:
+                    f.write(creds.to_json())
+            self.creds = creds
+            return creds
+
+    def service(self, api):
+        """The calling worker thread's discovery client for an API."""
+        import google_auth_httplib2
+        import httplib2
+        from googleapiclient.discovery import build
+
+        services = getattr(self.local, 'services', None)
+        if services is None or self.local.creds is not self.creds:
+            http = google_auth_httplib2.AuthorizedHttp(
+                self.creds, http=httplib2.Http(timeout=self.timeout)
+            )
+            services = self.local.services = {}
+            self.local.http = http
+            self.local.creds = self.creds
+        if api not in services:
+            options = {'api_endpoint': self.api_endpoint} if self.api_endpoint else None
+            services[api] = build(
+                api, SERVICES[api], http=self.local.http, cache_discovery=False,
+                client_options=options
+            )
+        return services[api]
+
+    async def call(self, api, fn):
+        """
+        Run fn(service) on the Google worker pool and await its result.
+        fn may issue several requests with the service it is given.
+        """
+        await self.get_credentials()
+        METRICS.inc('api_calls', api=api)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: fn(self.service(api)))
+
+    async def execute(self, api, make_request):
+        """Build a single request from the service and execute it."""
+        return await self.call(api, lambda service: make_request(service).execute())
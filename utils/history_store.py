@@ -0,0 +1,265 @@
+# history_store.py
+import asyncio
+import csv
+import json
+import math
+import os
+import shutil
+
+from utils.sinks import Sink
+
+# Column -> storage type per source: 'str', 'int' or 'float'; formatted cells ("12.5%") stay 'str'
+SCHEMAS = {
+    'meta': {
+        'date_start': 'str', 'date_stop': 'str', 'account_name': 'str',
+        'publisher': 'str', 'adset_name': 'str', 'cpc_link': 'float',
+        'ctr_link': 'float', 'inline_link_click': 'int', 'cpm': 'float',
+        'spend': 'float', 'avg_playtime': 'float',
+    },
+    'ringba': {
+        'date_start': 'str', 'date_stop': 'str', 'callCount': 'int',
+        'liveCallCount': 'int', 'endedCalls': 'int', 'connectedCallCount': 'int',
+        'payoutCount': 'int', 'convertedCalls': 'int', 'nonConnectedCallCount': 'int',
+        'duplicateCalls': 'int', 'blockedCalls': 'int', 'incompleteCalls': 'int',
+        'earningsPerCallGross': 'float', 'conversionAmount': 'float',
+        'payoutAmount': 'float', 'profitGross': 'float', 'profitMarginGross': 'str',
+        'convertedPercent': 'str', 'callLengthInSeconds': 'int', 'avgHandleTime': 'int',
+        'totalCost': 'float', 'publisherName': 'str', 'tag:User:sub5': 'str',
+        'campaignName': 'str',
+    },
+}
+
+MANIFEST = '_active.json'
+
+# Stored for int cells with no number; float cells use NaN
+INT_NULL = -2 ** 63
+
+
+def _number(value, kind):
+    """
+    A numeric cell as (number, text): text is the cell as written whenever
+    the number alone would not give it back ('', '-no value-', '1.50'),
+    and the number is null when the text is not one.
+    """
+    text = value if isinstance(value, str) else str(value)
+    try:
+        number = int(text) if kind == 'int' else float(text)
+    except ValueError:
+        return (INT_NULL if kind == 'int' else math.nan), text
+    if (str(number) if kind == 'int' else repr(number)) == text:
+        return number, ''
+    return number, text
+
+
+def _column_file(name):
+    """Column names like tag:User:sub5 are not valid file names everywhere."""
+    return name.replace(':', '__') + '.npy'
+
+
+def _text_column(column):
+    """Key (and file stem) of the array holding a numeric column's cells as written."""
+    return column + '.text'
+
+
+def column_arrays(source, rows):
+    """
+    Typed array per schema column for rows (dicts); numeric columns also get
+    a string array with the cells their numbers would not reproduce.
+    """
+    import numpy as np
+
+    arrays = {}
+    for column, kind in SCHEMAS[source].items():
+        values = [row.get(column, '') for row in rows]
+        if kind == 'str':
+            arrays[column] = np.array([str(v) for v in values], dtype=str) if values else np.array([], dtype='U1')
+            continue
+        parsed = [_number(v, kind) for v in values]
+        dtype = np.int64 if kind == 'int' else np.float64
+        arrays[column] = np.array([number for number, _ in parsed], dtype=dtype)
+        arrays[_text_column(column)] = np.array([text for _, text in parsed], dtype=str) if values else np.array([], dtype='U1')
+    return arrays
+
+
+class HistoryStore:
+    """
+    Local report history, partitioned by source and date.
+
+    Each write adds an immutable segment directory holding one .npy file per
+    column (fixed-width unicode for strings, int64/float64 for numbers, plus
+    a '.text' file for numeric columns with blank or formatted cells, so
+    rows read back exactly as written).
+    A partition's manifest lists its active segments, so rewriting a day
+    appends a new segment and swaps the manifest instead of editing files;
+    the segments it replaced are deleted right after the swap. Reads
+    memory-map the column files, which stay readable until unmapped.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def partition_dir(self, source, day):
+        return os.path.join(self.root, source, day)
+
+    def active_segments(self, source, day):
+        path = os.path.join(self.partition_dir(source, day), MANIFEST)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def has_partition(self, source, day):
+        return bool(self.active_segments(source, day))
+
+    # ======================================
+    #  Writes
+    # ======================================
+    def write(self, source, day, rows, replace=True):
+        """Write rows (dicts) as a new segment of a day's partition."""
+        return self.write_columns(source, day, column_arrays(source, rows), replace)
+
+    def write_columns(self, source, day, arrays, replace=True):
+        """Write typed column arrays (see column_arrays) as a new segment of a day's partition."""
+        import numpy as np
+
+        part = self.partition_dir(source, day)
+        os.makedirs(part, exist_ok=True)
+        existing = [int(d[4:]) for d in os.listdir(part) if d.startswith('seg-')]
+        name = f"seg-{max(existing, default=0) + 1:06d}"
+        tmp = os.path.join(part, f".{name}.tmp")
+        os.makedirs(tmp, exist_ok=True)
+
+        for column, kind in SCHEMAS[source].items():
+            np.save(os.path.join(tmp, _column_file(column)), arrays[column])
+            # Only kept when some cell is not simply its number
+            text = arrays.get(_text_column(column))
+            if kind != 'str' and text is not None and text.any():
+                np.save(os.path.join(tmp, _column_file(_text_column(column))), text)
+        os.rename(tmp, os.path.join(part, name))
+
+        segments = [name] if replace else self.active_segments(source, day) + [name]
+        manifest = os.path.join(part, MANIFEST)
+        with open(manifest + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(segments, f)
+        os.replace(manifest + '.tmp', manifest)
+        if replace:
+            self._drop_inactive(part, segments)
+        return os.path.join(part, name)
+
+    def write_csv(self, source, day, path):
+        """Store a report CSV as the day's partition."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return self.write(source, day, list(csv.DictReader(f)))
+
+    def vacuum(self, source):
+        """Delete segments no manifest refers to any more."""
+        base = os.path.join(self.root, source)
+        if not os.path.isdir(base):
+            return
+        for day in os.listdir(base):
+            self._drop_inactive(os.path.join(base, day), self.active_segments(source, day))
+
+    def _drop_inactive(self, part, active):
+        for name in os.listdir(part):
+            if name.startswith('seg-') and name not in active:
+                shutil.rmtree(os.path.join(part, name), ignore_errors=True)
+
+    # ======================================
+    #  Queries
+    # ======================================
+    def days(self, source, since, until):
+        """Partition dates within [since, until], found from directory names only."""
+        base = os.path.join(self.root, source)
+        if not os.path.isdir(base):
+            return []
+        return sorted(d for d in os.listdir(base) if since <= d <= until)
+
+    def scan(self, source, since, until, columns=None, text=False):
+        """
+        Yield (day, {column: memory-mapped array}) per active segment in the
+        range. Missing numbers are NaN or INT_NULL; with `text`, numeric
+        columns that have cells kept as written add them under
+        '<column>.text'.
+        """
+        import numpy as np
+
+        columns = columns or list(SCHEMAS[source])
+        for day in self.days(source, since, until):
+            for segment in self.active_segments(source, day):
+                seg_dir = os.path.join(self.partition_dir(source, day), segment)
+                arrays = {
+                    c: np.load(os.path.join(seg_dir, _column_file(c)), mmap_mode='r')
+                    for c in columns
+                }
+                for c in columns if text else ():
+                    path = os.path.join(seg_dir, _column_file(_text_column(c)))
+                    if SCHEMAS[source][c] != 'str' and os.path.exists(path):
+                        arrays[_text_column(c)] = np.load(path, mmap_mode='r')
+                yield day, arrays
+
+    def read(self, source, since, until, columns=None):
+        """Concatenate a range into one array per column."""
+        import numpy as np
+
+        columns = columns or list(SCHEMAS[source])
+        chunks = {c: [] for c in columns}
+        for _, arrays in self.scan(source, since, until, columns):
+            for c in columns:
+                chunks[c].append(arrays[c])
+        return {c: np.concatenate(v) if v else np.array([]) for c, v in chunks.items()}
+
+    def iter_rows(self, source, since, until):
+        """Yield rows as dicts with every cell as it was written."""
+        columns = list(SCHEMAS[source])
+        for _, arrays in self.scan(source, since, until, text=True):
+            values = [arrays[c].tolist() for c in columns]
+            texts = [
+                arrays[_text_column(c)].tolist() if _text_column(c) in arrays else None
+                for c in columns
+            ]
+            for i in range(len(values[0]) if values else 0):
+                row = {}
+                for c, column_values, column_texts in zip(columns, values, texts):
+                    value = column_values[i]
+                    if column_texts is not None and column_texts[i]:
+                        value = column_texts[i]
+                    elif value == INT_NULL or isinstance(value, float) and math.isnan(value):
+                        value = ''
+                    row[c] = value
+                yield row
+
+
+class HistorySink(Sink):
+    """
+    Converts each batch of a report stream to typed column arrays as it
+    arrives and stores the day's partition on close, so the stream is
+    never held as rows.
+    """
+
+    def __init__(self, name, store, source, day):
+        self.name = name
+        self.store = store
+        self.source = source
+        self.day = day
+        self.chunks = {}
+        self.count = 0
+
+    async def write(self, rows):
+        records = [dict(zip(self.header, ('' if v is None else v for v in r))) for r in rows]
+        arrays = await asyncio.to_thread(column_arrays, self.source, records)
+        for column, array in arrays.items():
+            self.chunks.setdefault(column, []).append(array)
+        self.count += len(rows)
+
+    async def close(self):
+        """Number of rows stored; a stream without rows is not stored."""
+        if not self.count:
+            return 0
+        await asyncio.to_thread(self._store)
+        return self.count
+
+    def _store(self):
+        import numpy as np
+
+        arrays = {column: np.concatenate(chunks) for column, chunks in self.chunks.items()}
+        self.store.write_columns(self.source, self.day, arrays)
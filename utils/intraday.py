@@ -0,0 +1,171 @@
+# intraday.py
+import json
+import os
+
+from utils.row_index import quote_sheet
+
+# Columns that identify a row within a day, after the schema's normalizers ran
+META_KEY_COLUMNS = ('account_name', 'adset_name')
+RINGBA_KEY_COLUMNS = ('campaignName', 'tag:User:sub5', 'publisherName')
+
+
+def as_cells(row):
+    """Cell strings exactly as the CSV writer would produce them."""
+    return ['' if v is None else str(v) for v in row]
+
+
+def col_letter(index):
+    """0-based column index -> A1 column letters."""
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def row_keys(header, rows, key_columns):
+    """Key per row; repeated keys are numbered so every row stays addressable."""
+    positions = [header.index(c) for c in key_columns]
+    seen = {}
+    keys = []
+    for row in rows:
+        base = tuple(row[p] for p in positions)
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        keys.append(base + (n,))
+    return keys
+
+
+def diff_rows(header, old_rows, new_rows, key_columns):
+    """
+    Compare a day's previous rows (in sheet order) with fresh rows.
+    Returns (changed [(position, old, new, [columns])], appended rows, removed keys).
+    """
+    old_keys = row_keys(header, old_rows, key_columns)
+    new_keys = row_keys(header, new_rows, key_columns)
+    fresh = dict(zip(new_keys, new_rows))
+    changed = []
+    for position, (key, old) in enumerate(zip(old_keys, old_rows)):
+        new = fresh.get(key)
+        if new is None or new == old:
+            continue
+        columns = [i for i in range(max(len(old), len(new)))
+                   if (old[i] if i < len(old) else '') != (new[i] if i < len(new) else '')]
+        changed.append((position, old, new, columns))
+    known = set(old_keys)
+    appended = [row for key, row in zip(new_keys, new_rows) if key not in known]
+    removed = [key for key in old_keys if key not in fresh]
+    return changed, appended, removed
+
+
+def cell_ranges(sheet, start_row, changed):
+    """ValueRanges for changed cells, merging adjacent columns of a row."""
+    data = []
+    for position, _, new, columns in changed:
+        row_number = start_row + position
+        run = []
+        for col in columns + [None]:
+            if run and (col is None or col != run[-1] + 1):
+                data.append({
+                    'range': f"{quote_sheet(sheet)}!{col_letter(run[0])}{row_number}:"
+                             f"{col_letter(run[-1])}{row_number}",
+                    'values': [[new[c] if c < len(new) else '' for c in run]],
+                })
+                run = []
+            if col is not None:
+                run.append(col)
+    return data
+
+
+class SnapshotStore:
+    """Last rows written per sheet and day, in the order they sit in the sheet."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, sheet, day):
+        safe = ''.join(c if c.isalnum() else '_' for c in sheet)
+        return os.path.join(self.root, f"{safe}_{day}.json")
+
+    def get(self, sheet, day):
+        path = self._path(sheet, day)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put(self, sheet, day, rows, **extra):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(sheet, day)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(dict(extra, rows=rows), f)
+        os.replace(path + '.tmp', path)
+
+    def invalidate(self, sheet, day):
+        """Forget a day another writer replaced, so the next refresh starts over."""
+        try:
+            os.remove(self._path(sheet, day))
+        except OSError:
+            pass
+
+
+class IntradayWriter:
+    """
+    Moves only what changed since the previous refresh of a day: changed
+    cells go out in one values.batchUpdate and new rows in one append.
+    Falls back to replacing the day's rows when the sheet no longer looks
+    the way the snapshot says (first run, rows removed, partition moved,
+    or snapshot rows the row index no longer has).
+    """
+
+    def __init__(self, index, upserter):
+        self.index = index
+        self.upserter = upserter
+
+    def apply(self, service, spreadsheet_id, sheet, header, previous, rows, key_columns):
+        """Bring one day of a sheet to `rows`; returns (rows in sheet order, stats)."""
+        day = rows[0][0] if rows else None
+        resynced = self.index.sync(service, spreadsheet_id, sheet)
+        spans = self.index.spans(sheet, day)
+        state = self.index.sheet_state(sheet)
+        if (previous is None or resynced or len(spans) != 1 or spans[0][1] != len(previous)
+                or self.index.filter_new(sheet, previous)):
+            return self.replace(service, spreadsheet_id, sheet, header, rows, 'no usable snapshot')
+
+        changed, appended, removed = diff_rows(header, previous, rows, key_columns)
+        start_row, row_count = spans[0]
+        at_end = state is not None and start_row + row_count - 1 == state[0]
+        if removed or (appended and not at_end):
+            reason = 'rows removed' if removed else 'day is not at the end of the sheet'
+            return self.replace(service, spreadsheet_id, sheet, header, rows, reason)
+
+        data = cell_ranges(sheet, start_row, changed)
+        if data:
+            service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'valueInputOption': 'RAW', 'data': data}
+            ).execute()
+            self.index.replace_rows(sheet, [
+                (start_row + position, old, new) for position, old, new, _ in changed
+            ])
+        if appended:
+            service.spreadsheets().values().append(
+                spreadsheetId=spreadsheet_id, range=f"{quote_sheet(sheet)}!A1",
+                valueInputOption='RAW', insertDataOption='INSERT_ROWS', body={'values': appended}
+            ).execute()
+            self.index.record_append(sheet, appended)
+
+        ordered = list(previous)
+        for position, _, new, _ in changed:
+            ordered[position] = new
+        ordered.extend(appended)
+        return ordered, {
+            'mode': 'diff', 'changed_rows': len(changed),
+            'changed_cells': sum(len(c[3]) for c in changed), 'new_rows': len(appended),
+        }
+
+    def replace(self, service, spreadsheet_id, sheet, header, rows, reason):
+        print(f"Intraday refresh of '{sheet}' replaces the day ({reason}).")
+        self.upserter.upsert(service, spreadsheet_id, sheet, header, rows)
+        return list(rows), {'mode': 'replace', 'changed_rows': 0, 'changed_cells': 0, 'new_rows': len(rows)}
@@ -0,0 +1,235 @@
+# job_queue.py
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind          TEXT NOT NULL,
+    key           TEXT NOT NULL,
+    payload       TEXT NOT NULL,
+    status        TEXT NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    not_before    REAL NOT NULL,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    result        TEXT,
+    error         TEXT,
+    created       REAL NOT NULL,
+    finished      REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, not_before);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+"""
+
+# A job goes queued -> leased -> done | failed; a failed attempt is queued again until max_attempts
+
+
+def job_key(kind, payload):
+    """Identity of a unit of work, so the same unit asked for twice is fetched once."""
+    raw = json.dumps([kind, payload], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class JobQueue:
+    """
+    Durable queue of fetch units (one Meta account over a date range, one
+    Ringba window) in SQLite, shared by the bot and any number of fetch
+    worker processes on the same host. SQLite's file locking is not
+    reliable over network file systems, so the file must stay local.
+
+    Workers claim units with a lease and must complete, fail or extend it
+    before it expires; a unit whose worker died is claimed again once its
+    lease runs out. Failed attempts are retried after a delay up to the
+    unit's max_attempts. Results are stored as JSON until purged.
+
+    The queue does not share rate limits: each worker process has its own
+    RateController per token, so META_RATE_MAX_CALLS applies per process
+    and N workers may run N times as many calls against one token.
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.lock = threading.Lock()
+        # Autocommit; claims take the write lock up front with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction holding the database lock from its first statement."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    # ======================================
+    #  Producer side
+    # ======================================
+    def enqueue_many(self, kind, payloads, max_attempts=3, reuse_seconds=0):
+        """
+        Enqueue one job per payload and return their ids in order. A payload
+        already queued or leased joins that job, and one done within the last
+        `reuse_seconds` is answered by its stored result.
+        """
+        now = time.time()
+        ids = []
+        with self.lock, self._transaction() as conn:
+            for payload in payloads:
+                key = job_key(kind, payload)
+                found = conn.execute(
+                    "SELECT id FROM jobs WHERE key=? AND (status IN ('queued', 'leased') "
+                    "OR (status='done' AND finished>=?)) ORDER BY id DESC LIMIT 1",
+                    (key, now - reuse_seconds)
+                ).fetchone()
+                if found:
+                    ids.append(found[0])
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, key, payload, status, max_attempts, not_before, created) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                    (kind, key, json.dumps(payload, default=str), max_attempts, now, now)
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def finished(self, ids):
+        """(id, status, error) of the given jobs that are done or failed for good."""
+        found = []
+        with self.lock:
+            for i in range(0, len(ids), 500):
+                chunk = list(ids[i:i + 500])
+                found.extend(self.conn.execute(
+                    f"SELECT id, status, error FROM jobs WHERE status IN ('done', 'failed') "
+                    f"AND id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return found
+
+    def result(self, job_id):
+        """Decoded result of a done job, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result FROM jobs WHERE id=? AND status='done'", (job_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def cancel(self, ids, reason='cancelled'):
+        """Fail jobs nobody has claimed yet; leased ones finish normally."""
+        with self.lock, self._transaction() as conn:
+            conn.executemany(
+                "UPDATE jobs SET status='failed', error=?, finished=? WHERE id=? AND status='queued'",
+                [(reason, time.time(), job_id) for job_id in ids]
+            )
+
+    def counts(self):
+        """Number of jobs per status."""
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    # ======================================
+    #  Worker side
+    # ======================================
+    def claim(self, owner, kinds, limit=50, lease_seconds=120):
+        """
+        Lease up to `limit` ready jobs of the given kinds to `owner`, oldest
+        first, including jobs whose previous lease expired. Returns
+        [(id, kind, payload, attempt)], attempt counting from 1.
+        """
+        now = time.time()
+        marks = ', '.join('?' * len(kinds))
+        with self.lock, self._transaction() as conn:
+            # Units whose workers kept dying with them are given up on
+            conn.execute(
+                "UPDATE jobs SET status='failed', error='lease expired', finished=?, lease_owner=NULL "
+                "WHERE status='leased' AND lease_expires<? AND attempts>=max_attempts",
+                (now, now)
+            )
+            rows = conn.execute(
+                f"SELECT id, kind, payload, attempts FROM jobs WHERE kind IN ({marks}) AND "
+                "((status='queued' AND not_before<=?) OR (status='leased' AND lease_expires<?)) "
+                "ORDER BY id LIMIT ?",
+                (*kinds, now, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status='leased', lease_owner=?, lease_expires=?, attempts=attempts+1 WHERE id=?",
+                [(owner, now + lease_seconds, job_id) for job_id, *_ in rows]
+            )
+        return [(job_id, kind, json.loads(payload), attempts + 1) for job_id, kind, payload, attempts in rows]
+
+    def extend(self, ids, owner, lease_seconds=120):
+        """Renew the leases `owner` still holds."""
+        with self.lock, self._transaction() as conn:
+            conn.executemany(
+                "UPDATE jobs SET lease_expires=? WHERE id=? AND lease_owner=? AND status='leased'",
+                [(time.time() + lease_seconds, job_id, owner) for job_id in ids]
+            )
+
+    def complete(self, job_id, owner, result):
+        """Store a job's result; False when the lease was lost and the result dropped."""
+        with self.lock, self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status='done', result=?, error=NULL, finished=?, lease_owner=NULL "
+                "WHERE id=? AND lease_owner=? AND status='leased'",
+                (json.dumps(result, default=str), time.time(), job_id, owner)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, owner, error, retry_in=0.0):
+        """Record a failed attempt: queue the job again after `retry_in` seconds, or fail it for good."""
+        now = time.time()
+        with self.lock, self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET "
+                "status=CASE WHEN attempts<max_attempts THEN 'queued' ELSE 'failed' END, "
+                "finished=CASE WHEN attempts<max_attempts THEN NULL ELSE ? END, "
+                "not_before=?, error=?, lease_owner=NULL, lease_expires=NULL "
+                "WHERE id=? AND lease_owner=? AND status='leased'",
+                (now, now + retry_in, str(error), job_id, owner)
+            )
+
+    def purge(self, older_than):
+        """Delete finished jobs older than `older_than` seconds; returns how many."""
+        with self.lock, self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished<?",
+                (time.time() - older_than,)
+            )
+        return cursor.rowcount
+
+
+async def wait_for_jobs(queue, ids, poll=0.5, timeout=None):
+    """
+    Yield (id, status, error) for each job as it finishes, in completion
+    order. Jobs still unclaimed after `timeout` seconds, or when the caller
+    stops early, are cancelled; leased ones still past the timeout are
+    reported failed without waiting for them.
+    """
+    remaining = set(ids)
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        while remaining:
+            for job_id, status, error in await asyncio.to_thread(queue.finished, sorted(remaining)):
+                remaining.discard(job_id)
+                yield job_id, status, error
+            if not remaining:
+                break
+            if deadline and time.monotonic() >= deadline:
+                for job_id in sorted(remaining):
+                    yield job_id, 'failed', 'timed out waiting for a fetch worker'
+                break
+            await asyncio.sleep(poll)
+    finally:
+        if remaining:
+            await asyncio.to_thread(queue.cancel, sorted(remaining))
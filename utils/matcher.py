@@ -0,0 +1,90 @@
+# matcher.py
+from utils.ringba_client import to_number
+
+MATCHED_COLUMNS = [
+    'date_start', 'adset_name', 'accounts', 'publishers',
+    'spend', 'inline_link_click', 'impressions', 'cpm',
+    'calls', 'conversions', 'revenue', 'cpa', 'roas', 'profit',
+]
+
+
+def match_key(name):
+    """Join key shared by Meta adset names and Ringba sub5 tags."""
+    return (name or '').strip().lower()
+
+
+class MatchEngine:
+    """
+    Joins Meta adset rows to Ringba sub5 rows on (date, normalized name).
+
+    Each side is folded into a hash index as rows stream in, so the join is
+    a single pass over the smaller index rather than a nested loop.
+    """
+
+    def __init__(self):
+        self.meta = {}
+        self.ringba = {}
+
+    def add_meta(self, rows):
+        """Index Meta report rows (as written by save_insights_to_csv_meta)."""
+        for row in rows:
+            key = (row['date_start'], match_key(row['adset_name']))
+            spend = to_number(row.get('spend'))
+            cpm = to_number(row.get('cpm'))
+            entry = self.meta.get(key)
+            if entry is None:
+                entry = self.meta[key] = {
+                    'adset_name': row['adset_name'], 'accounts': set(),
+                    'spend': 0.0, 'inline_link_click': 0, 'impressions': 0.0,
+                }
+            entry['accounts'].add(row.get('account_name', ''))
+            entry['spend'] += spend
+            entry['inline_link_click'] += int(to_number(row.get('inline_link_click')))
+            # CPM is spend per thousand impressions, so impressions can be recovered
+            entry['impressions'] += spend / cpm * 1000 if cpm else 0.0
+
+    def add_ringba(self, rows):
+        """Index Ringba report rows (as written by save_insights_to_csv_ringba)."""
+        for row in rows:
+            key = (row['date_start'], match_key(row['tag:User:sub5']))
+            entry = self.ringba.get(key)
+            if entry is None:
+                entry = self.ringba[key] = {
+                    'publishers': set(), 'calls': 0, 'conversions': 0, 'revenue': 0.0,
+                }
+            entry['publishers'].add(row.get('publisherName', ''))
+            entry['calls'] += int(to_number(row.get('callCount')))
+            entry['conversions'] += int(to_number(row.get('convertedCalls')))
+            entry['revenue'] += to_number(row.get('conversionAmount'))
+
+    def results(self):
+        """
+        Return (matched rows, unmatched Meta keys, unmatched Ringba keys).
+        Matched rows carry CPA, ROAS and profit per adset and day.
+        """
+        matched = []
+        for key, meta in self.meta.items():
+            ringba = self.ringba.get(key)
+            if ringba is None:
+                continue
+            spend, revenue = meta['spend'], ringba['revenue']
+            matched.append({
+                'date_start': key[0],
+                'adset_name': meta['adset_name'],
+                'accounts': '|'.join(sorted(a for a in meta['accounts'] if a)),
+                'publishers': '|'.join(sorted(p for p in ringba['publishers'] if p)),
+                'spend': round(spend, 2),
+                'inline_link_click': meta['inline_link_click'],
+                'impressions': int(round(meta['impressions'])),
+                'cpm': round(spend / meta['impressions'] * 1000, 2) if meta['impressions'] else '',
+                'calls': ringba['calls'],
+                'conversions': ringba['conversions'],
+                'revenue': round(revenue, 2),
+                'cpa': round(spend / ringba['conversions'], 2) if ringba['conversions'] else '',
+                'roas': round(revenue / spend, 4) if spend else '',
+                'profit': round(revenue - spend, 2),
+            })
+        matched.sort(key=lambda r: (r['date_start'], r['adset_name']))
+        unmatched_meta = sorted(k for k in self.meta if k not in self.ringba)
+        unmatched_ringba = sorted(k for k in self.ringba if k not in self.meta)
+        return matched, unmatched_meta, unmatched_ringba
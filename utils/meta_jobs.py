@@ -0,0 +1,187 @@
+# meta_jobs.py
+import asyncio
+import time
+from collections import deque
+
+from facebook_business.adobjects.adaccount import AdAccount
+from facebook_business.adobjects.adreportrun import AdReportRun
+
+from utils.metrics import METRICS
+
+JOB_COMPLETED = 'Job Completed'
+JOB_FAILED    = 'Job Failed'
+JOB_SKIPPED   = 'Job Skipped'
+
+
+class ReportJob:
+    """State of one ad account's async insights job."""
+
+    def __init__(self, account_id, access_token):
+        self.account_id = account_id
+        self.access_token = access_token
+        self.report_run = None
+        self.attempts = 0
+        self.polls = 0
+        self.percent = 0
+        self.submitted_at = 0.0
+        self.next_poll = 0.0
+        self.not_before = 0.0
+        self.results = None
+        self.row_count = 0
+        self.error = None
+
+
+def next_page(cursor):
+    """The next page of a result cursor as plain dicts; [] once it is exhausted."""
+    if not len(cursor) and not cursor.load_next_page():
+        return []
+    return [next(cursor).export_all_data() for _ in range(len(cursor))]
+
+
+class MetaJobScheduler:
+    """
+    Submits every account's insights job up front and polls all
+    outstanding jobs together instead of spinning on each one.
+
+    With `on_page` (a coroutine function taking the job and a page of
+    rows), completed results are handed over one page at a time instead of
+    being collected in job.results.
+    """
+
+    def __init__(self, fields, params, api_for_token, max_in_flight=10,
+                 min_poll=1.0, max_poll=30.0, max_attempts=3, on_page=None, page_size=500):
+        self.fields = fields
+        self.params = params
+        self.api_for_token = api_for_token
+        self.max_in_flight = max_in_flight
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.max_attempts = max_attempts
+        self.on_page = on_page
+        self.page_size = page_size
+
+    async def run(self, accounts):
+        """Run jobs for (account_id, access_token) pairs; return the finished ReportJobs."""
+        queued = {}
+        for account_id, token in accounts:
+            queued.setdefault(token, deque()).append(ReportJob(account_id, token))
+        in_flight = {token: [] for token in queued}
+        finished = []
+
+        while any(queued.values()) or any(in_flight.values()):
+            # Top up every token to its in-flight cap
+            now = time.monotonic()
+            to_submit = []
+            for token, waiting in queued.items():
+                for job in list(waiting):
+                    if len(in_flight[token]) >= self.max_in_flight:
+                        break
+                    if job.not_before <= now:
+                        waiting.remove(job)
+                        in_flight[token].append(job)
+                        to_submit.append(job)
+            if to_submit:
+                await asyncio.gather(*(self._submit(job) for job in to_submit))
+                for job in to_submit:
+                    if job.report_run is None:
+                        self._retry_or_fail(job, queued, in_flight, finished)
+
+            now = time.monotonic()
+            active = [job for jobs in in_flight.values() for job in jobs]
+            due = [job for job in active if job.next_poll <= now]
+            if not due:
+                waits = [job.next_poll for job in active]
+                waits += [job.not_before for waiting in queued.values() for job in waiting]
+                if waits:
+                    await asyncio.sleep(max(0.0, min(waits) - now))
+                continue
+
+            await asyncio.gather(*(self._poll(job) for job in due))
+            for job in due:
+                status = None if job.error else job.report_run[AdReportRun.Field.async_status]
+                if job.error or status in (JOB_FAILED, JOB_SKIPPED):
+                    self._retry_or_fail(job, queued, in_flight, finished)
+                elif status == JOB_COMPLETED:
+                    in_flight[job.access_token].remove(job)
+                    finished.append(job)
+
+        return finished
+
+    def _retry_or_fail(self, job, queued, in_flight, finished):
+        """Resubmit a failed job while it has attempts left."""
+        in_flight[job.access_token].remove(job)
+        # Pages already handed over would be repeated by a new job
+        if job.attempts < self.max_attempts and not job.row_count:
+            METRICS.inc('retries', api='meta')
+            print(f"Resubmitting Meta job for {job.account_id} "
+                  f"(attempt {job.attempts + 1}/{self.max_attempts})")
+            job.report_run = None
+            job.error = None
+            job.polls = 0
+            job.percent = 0
+            job.not_before = time.monotonic() + self.min_poll * (2 ** job.attempts)
+            queued[job.access_token].append(job)
+        else:
+            if not job.error:
+                status = job.report_run[AdReportRun.Field.async_status]
+                job.error = f"job ended with status {status}"
+            print(f"Meta API error for {job.account_id}: {job.error}")
+            finished.append(job)
+
+    async def _submit(self, job):
+        """Create the async report run for a job."""
+        job.attempts += 1
+        try:
+            api = self.api_for_token(job.access_token)
+            METRICS.inc('api_calls', api='meta')
+            with METRICS.span('meta_job_submit', account=job.account_id):
+                job.report_run = await asyncio.to_thread(
+                    AdAccount(job.account_id, api=api).get_insights_async,
+                    fields=self.fields, params=dict(self.params)
+                )
+            job.submitted_at = time.monotonic()
+            job.next_poll = job.submitted_at + self.min_poll
+        except Exception as e:
+            job.report_run = None
+            job.error = str(e)
+
+    async def _poll(self, job):
+        """Refresh a job's status and download its results once completed."""
+        try:
+            METRICS.inc('api_calls', api='meta')
+            with METRICS.span('meta_job_poll', account=job.account_id):
+                await asyncio.to_thread(job.report_run.api_get)
+            job.polls += 1
+            status = job.report_run[AdReportRun.Field.async_status]
+            if status == JOB_COMPLETED:
+                with METRICS.span('meta_job_result', account=job.account_id):
+                    cursor = await asyncio.to_thread(
+                        job.report_run.get_result, params={'limit': self.page_size}
+                    )
+                    if self.on_page is None:
+                        job.results = await asyncio.to_thread(
+                            lambda: [item.export_all_data() for item in cursor]
+                        )
+                        job.row_count = len(job.results)
+                    else:
+                        while rows := await asyncio.to_thread(next_page, cursor):
+                            job.row_count += len(rows)
+                            await self.on_page(job, rows)
+                METRICS.inc('api_calls', api='meta')
+                METRICS.inc('rows', job.row_count, stage='meta_fetch')
+                return
+            percent = job.report_run[AdReportRun.Field.async_percent_completion] or 0
+            job.next_poll = time.monotonic() + self._poll_delay(job, percent)
+            job.percent = percent
+        except Exception as e:
+            job.error = str(e)
+
+    def _poll_delay(self, job, percent):
+        """Back off from the job's completion rate, or exponentially while it makes no progress."""
+        elapsed = time.monotonic() - job.submitted_at
+        if percent > job.percent and percent > 0:
+            remaining = elapsed * (100 - percent) / percent
+            delay = remaining / 2
+        else:
+            delay = self.min_poll * (2 ** min(job.polls, 6))
+        return max(self.min_poll, min(delay, self.max_poll))
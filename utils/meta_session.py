@@ -0,0 +1,188 @@
+# meta_session.py
+from collections import deque
+
+from utils.metrics import METRICS
+from utils.rate_control import RateController, is_throttle_error
+
+# Graph API accepts at most 50 requests per batch call
+MAX_BATCH_SIZE = 50
+
+
+class MetaApiSession:
+    """
+    Meta API bound to a single access token.
+
+    Unlike FacebookAdsApi.init, this never touches the process-wide default
+    API, so sessions for different tokens can be used from any thread.
+    Every call goes through the token's RateController. The Meta SDK is
+    imported when the first session is created.
+    """
+
+    def __init__(self, access_token, pool_size=20, timeout=120, graph_url=None,
+                 rate_options=None, max_throttle_retries=8):
+        from facebook_business.session import FacebookSession
+        from requests.adapters import HTTPAdapter
+
+        from utils.throttled_api import ThrottledAdsApi
+
+        self.session = FacebookSession(access_token=access_token, timeout=timeout)
+        if graph_url:
+            # Instance override of FacebookSession.GRAPH, e.g. for a local stand-in
+            self.session.GRAPH = graph_url.rstrip('/')
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.requests.mount('https://', adapter)
+        self.session.requests.mount('http://', adapter)
+        self.rate = RateController(**(rate_options or {}))
+        self.max_throttle_retries = max_throttle_retries
+        self.api = ThrottledAdsApi(self.session, self.rate, max_throttle_retries=max_throttle_retries)
+
+    def close(self):
+        """Release pooled HTTP connections."""
+        self.session.requests.close()
+
+    def fetch_insights_batch(self, account_ids, fields, params, page_size=500, max_retries=2):
+        """
+        Fetch synchronous insights for many accounts through Graph batch requests.
+        Returns ({account_id: [rows]}, {account_id: error}).
+        """
+        results = {}
+        errors = {}
+        for kind, account_id, value in self.iter_insights_batch(
+            account_ids, fields, params, page_size=page_size, max_retries=max_retries
+        ):
+            if kind == 'rows':
+                results.setdefault(account_id, []).extend(value)
+            elif kind == 'done':
+                results.setdefault(account_id, [])
+            else:
+                results.pop(account_id, None)
+                errors[account_id] = value
+        return results, errors
+
+    def iter_insights_batch(self, account_ids, fields, params, page_size=500, max_retries=2):
+        """
+        Yield insights result pages for many accounts as they arrive:
+        ('rows', account_id, [rows]) per page, then ('done', account_id, None)
+        after an account's last page, or ('error', account_id, message).
+        First pages come from Graph batch requests; accounts rejected for
+        rate limiting are queued again and retried once the rate controller
+        lets calls through.
+        """
+        from facebook_business.adobjects.adaccount import AdAccount
+
+        throttle_rounds = {}
+        pending = deque(account_ids)
+        while pending:
+            chunk = [pending.popleft() for _ in range(min(MAX_BATCH_SIZE, len(pending)))]
+            first_pages = {}
+            next_pages = {}
+            errors = {}
+            throttled = []
+            batch = self.api.new_batch()
+            for account_id in chunk:
+                AdAccount(account_id, api=self.api).get_insights(
+                    fields=fields, params=dict(params, limit=page_size), batch=batch,
+                    success=self._on_success(account_id, first_pages, next_pages),
+                    failure=self._on_failure(account_id, errors, throttled),
+                )
+            for attempt in range(max_retries + 1):
+                if attempt:
+                    METRICS.inc('retries', api='meta')
+                METRICS.inc('api_calls', api='meta')
+                with METRICS.span('meta_batch'):
+                    batch = batch.execute()
+                if not batch:
+                    break
+            if batch:
+                for account_id in chunk:
+                    if account_id not in first_pages and account_id not in errors and account_id not in throttled:
+                        errors[account_id] = "no response in batch"
+            if throttled:
+                self.rate.throttled()
+                METRICS.inc('throttled', len(throttled), api='meta')
+            for account_id in throttled:
+                throttle_rounds[account_id] = throttle_rounds.get(account_id, 0) + 1
+                if throttle_rounds[account_id] > self.max_throttle_retries:
+                    errors[account_id] = "rate limited"
+                else:
+                    pending.append(account_id)
+            for account_id, error in errors.items():
+                yield 'error', account_id, error
+
+            for account_id in chunk:
+                if account_id not in first_pages:
+                    continue
+                rows = first_pages.pop(account_id)
+                if rows:
+                    yield 'rows', account_id, rows
+                # Accounts with more rows than one page follow their cursors directly
+                url = next_pages.get(account_id)
+                try:
+                    while url:
+                        METRICS.inc('api_calls', api='meta')
+                        with METRICS.span('meta_page', account=account_id):
+                            page = self.api.call('GET', url).json()
+                        url = page.get('paging', {}).get('next')
+                        if page.get('data'):
+                            yield 'rows', account_id, page['data']
+                except Exception as e:
+                    yield 'error', account_id, str(e)
+                    continue
+                yield 'done', account_id, None
+
+    def _on_success(self, account_id, results, next_pages):
+        def callback(response):
+            self.rate.observe(response.headers())
+            body = response.json()
+            results[account_id] = list(body.get('data', []))
+            next_url = body.get('paging', {}).get('next')
+            if next_url:
+                next_pages[account_id] = next_url
+        return callback
+
+    def _on_failure(self, account_id, errors, throttled):
+        def callback(response):
+            error = response.error()
+            self.rate.observe(response.headers())
+            if is_throttle_error(error):
+                throttled.append(account_id)
+            else:
+                errors[account_id] = error.api_error_message()
+        return callback
+
+
+class MetaSessionPool:
+    """One MetaApiSession per access token, created on first use."""
+
+    def __init__(self, pool_size=20, timeout=120, graph_url=None, rate_options=None,
+                 max_throttle_retries=8):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.graph_url = graph_url
+        self.rate_options = rate_options
+        self.max_throttle_retries = max_throttle_retries
+        self.sessions = {}
+
+    def get(self, access_token):
+        """Return the session for an access token."""
+        if access_token not in self.sessions:
+            self.sessions[access_token] = MetaApiSession(
+                access_token, pool_size=self.pool_size, timeout=self.timeout,
+                graph_url=self.graph_url, rate_options=self.rate_options,
+                max_throttle_retries=self.max_throttle_retries
+            )
+        return self.sessions[access_token]
+
+    def api(self, access_token):
+        """Return the FacebookAdsApi for an access token."""
+        return self.get(access_token).api
+
+    def rate_states(self):
+        """RateController.state() per access token with a session."""
+        return {token: session.rate.state() for token, session in self.sessions.items()}
+
+    def close(self):
+        """Close every session's connection pool."""
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
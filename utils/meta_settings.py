@@ -0,0 +1,37 @@
+# meta_settings.py
+import os
+
+from dotenv import load_dotenv
+
+# Read here as well, so importing this module before the caller's load_dotenv() still sees .env
+load_dotenv()
+
+# Facebook Business API tokens (loaded from .env)
+LI1_TOKEN = os.getenv("LI1_TOKEN")
+LI2_TOKEN = os.getenv("LI2_TOKEN")
+LI3_TOKEN = os.getenv("LI3_TOKEN")
+LI4_TOKEN = os.getenv("LI4_TOKEN")
+
+# Business manager label -> token used to discover and fetch its ad accounts;
+# queued units name the label, so tokens never go into the job queue
+BUSINESS_MANAGERS = {"BM1": LI1_TOKEN, "BM3": LI3_TOKEN, "BM4": LI4_TOKEN}
+
+# Meta insights fetching, shared by the bot and the fetch workers
+META_INSIGHTS_FIELDS = [
+    'spend', 'cpm', 'cpc', 'adset_name',
+    'cost_per_inline_link_click', 'inline_link_click_ctr',
+    'inline_link_clicks', 'account_name',
+    'video_avg_time_watched_actions'
+]
+META_MAX_JOBS_PER_TOKEN = int(os.getenv("META_MAX_JOBS_PER_TOKEN", "10"))
+META_POLL_MIN_SECONDS   = float(os.getenv("META_POLL_MIN_SECONDS", "1"))
+META_POLL_MAX_SECONDS   = float(os.getenv("META_POLL_MAX_SECONDS", "30"))
+META_JOB_MAX_ATTEMPTS   = int(os.getenv("META_JOB_MAX_ATTEMPTS", "3"))
+META_FETCH_MODE         = os.getenv("META_FETCH_MODE", "batch")  # "batch" or "async"
+META_PAGE_SIZE          = int(os.getenv("META_PAGE_SIZE", "500"))  # rows per insights result page
+META_POOL_SIZE          = int(os.getenv("META_POOL_SIZE", "20"))
+META_GRAPH_URL          = os.getenv("META_GRAPH_URL")  # overrides https://graph.facebook.com
+# Per-token rate control: back off once Meta's usage headers report META_RATE_TARGET_PCT
+META_RATE_TARGET_PCT    = float(os.getenv("META_RATE_TARGET_PCT", "75"))
+META_RATE_MAX_CALLS     = int(os.getenv("META_RATE_MAX_CALLS", "10"))  # concurrent calls per token
+META_THROTTLE_RETRIES   = int(os.getenv("META_THROTTLE_RETRIES", "8"))
@@ -0,0 +1,168 @@
+# metrics.py
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from aiohttp import web
+
+PREFIX = 'admatchr'
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + body + '}'
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(q * len(ordered))
+    return ordered[min(len(ordered), max(rank, 1)) - 1]
+
+
+class Metrics:
+    """
+    Stage timings and counters for report runs.
+
+    Spans keep the last `window` durations per stage and label set, so
+    quantiles describe recent runs rather than the whole process lifetime.
+    Safe to use from the event loop and from worker threads.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self.lock = threading.Lock()
+        self.durations = {}  # (stage, labels) -> deque of seconds
+        self.totals = {}     # (stage, labels) -> [count, sum]
+        self.counters = {}   # (name, labels) -> value
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """Time the enclosed block as one observation of `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, _label_key(labels))
+        with self.lock:
+            self.durations.setdefault(key, deque(maxlen=self.window)).append(seconds)
+            total = self.totals.setdefault(key, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter such as api_calls, retries, rows or bytes."""
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.durations.clear()
+            self.totals.clear()
+            self.counters.clear()
+
+    def stage_totals(self):
+        """{stage: total seconds} over everything recorded, all labels merged."""
+        merged = {}
+        with self.lock:
+            for (stage, _), (_, total) in self.totals.items():
+                merged[stage] = merged.get(stage, 0.0) + total
+        return dict(sorted(merged.items()))
+
+    def stage_summary(self, quantiles=(0.5, 0.95)):
+        """{stage: (samples, [quantile values])} over recent spans, all labels merged."""
+        merged = {}
+        with self.lock:
+            for (stage, _), values in self.durations.items():
+                merged.setdefault(stage, []).extend(values)
+        return {
+            stage: (len(values), [percentile(values, q) for q in quantiles])
+            for stage, values in sorted(merged.items())
+        }
+
+    def counter_totals(self):
+        """{counter name: value} with all labels merged."""
+        totals = {}
+        with self.lock:
+            for (name, _), value in self.counters.items():
+                totals[name] = totals.get(name, 0) + value
+        return dict(sorted(totals.items()))
+
+    def render(self):
+        """Prometheus text exposition of every span summary and counter."""
+        lines = []
+        with self.lock:
+            durations = {k: list(v) for k, v in self.durations.items()}
+            totals = {k: list(v) for k, v in self.totals.items()}
+            counters = dict(self.counters)
+
+        name = f"{PREFIX}_stage_seconds"
+        lines.append(f"# HELP {name} Duration of report run stages.")
+        lines.append(f"# TYPE {name} summary")
+        for (stage, labels), values in sorted(durations.items()):
+            pairs = (('stage', stage),) + labels
+            for q in (0.5, 0.95, 0.99):
+                lines.append(
+                    f"{name}{_format_labels(pairs + (('quantile', str(q)),))} {percentile(values, q):.6f}"
+                )
+            count, total = totals[(stage, labels)]
+            lines.append(f"{name}_sum{_format_labels(pairs)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(pairs)} {count}")
+
+        for counter in sorted({n for n, _ in counters}):
+            metric = f"{PREFIX}_{counter}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (n, labels), value in sorted(counters.items()):
+                if n == counter:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves Metrics.render() at /metrics on a local port."""
+
+    def __init__(self, metrics, host='127.0.0.1', port=9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        print(f"Metrics served at http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request):
+        return web.Response(
+            body=self.metrics.render().encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
+
+
+# Process-wide registry shared by the cog and the API clients
+METRICS = Metrics()
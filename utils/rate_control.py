@@ -0,0 +1,159 @@
+# rate_control.py
+import json
+import threading
+import time
+
+# Graph error codes that mean "slow down" rather than "this request is wrong"
+THROTTLE_CODES = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+THROTTLE_SUBCODES = {2446079, 1487742, 1504022, 1504039}
+
+USAGE_HEADERS = (
+    'x-business-use-case-usage', 'x-ad-account-usage', 'x-fb-ads-insights-throttle', 'x-app-usage',
+)
+
+
+def _header_map(headers):
+    """Lower-cased header dict from a mapping or a batch item's [{'name', 'value'}] list."""
+    if not headers:
+        return {}
+    if isinstance(headers, list):
+        return {h.get('name', '').lower(): h.get('value') for h in headers if isinstance(h, dict)}
+    return {k.lower(): v for k, v in headers.items()}
+
+
+def parse_usage(headers):
+    """
+    Highest utilization (percent of the limit) reported by Meta's usage
+    headers, and the seconds until access is regained (0 when not blocked).
+    Returns (None, 0) when the response carried no usage header.
+    """
+    found = _header_map(headers)
+    usage = None
+    regain = 0
+    for name in USAGE_HEADERS:
+        raw = found.get(name)
+        if not raw:
+            continue
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        if name == 'x-business-use-case-usage':
+            entries = [e for values in data.values() for e in values]
+        else:
+            entries = [data]
+        for entry in entries:
+            pcts = [entry.get(k) for k in (
+                'call_count', 'total_cputime', 'total_time', 'acc_id_util_pct', 'app_id_util_pct'
+            )]
+            pcts = [float(p) for p in pcts if isinstance(p, (int, float))]
+            if pcts:
+                usage = max(pcts + ([usage] if usage is not None else []))
+            # Business use case reports minutes, ad account usage seconds
+            regain = max(regain, float(entry.get('estimated_time_to_regain_access') or 0) * 60,
+                         float(entry.get('reset_time_duration') or 0))
+    return usage, regain
+
+
+def is_throttle_error(error):
+    """True for Graph errors (FacebookRequestError or batch item error) caused by rate limits."""
+    code = getattr(error, 'api_error_code', None)
+    subcode = getattr(error, 'api_error_subcode', None)
+    code = code() if callable(code) else code
+    subcode = subcode() if callable(subcode) else subcode
+    return code in THROTTLE_CODES or subcode in THROTTLE_SUBCODES
+
+
+class RateController:
+    """
+    AIMD limiter for one access token's Graph calls, shared by every thread
+    calling through that token.
+
+    Each response's usage headers steer it: below `target` percent the
+    concurrency limit grows by one per window of calls and the spacing
+    between call starts shrinks; at or above it the limit is halved and the
+    spacing stretched, at most once per `cooldown`, so it backs off before
+    Meta starts rejecting calls. A throttled call or a regain-access time
+    pauses new calls until the block should be lifted.
+    """
+
+    def __init__(self, target=75.0, max_limit=10, min_limit=1, max_interval=10.0,
+                 cooldown=1.0, base_pause=5.0, max_pause=300.0):
+        self.target = target
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.max_interval = max_interval
+        self.cooldown = cooldown
+        self.base_pause = base_pause
+        self.max_pause = max_pause
+        self.limit = float(max_limit)
+        self.interval = 0.0
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.throttles = 0
+        self.usage = None
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a call may start under the current limit, spacing and pause."""
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                wait = max(self.paused_until - now, self.next_start - now)
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self.cond.wait(timeout=wait if wait > 0 else None)
+            self.in_flight += 1
+            self.next_start = now + self.interval
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def observe(self, headers):
+        """Adapt to the usage headers of a finished call."""
+        usage, regain = parse_usage(headers)
+        if usage is None and not regain:
+            return
+        with self.cond:
+            now = time.monotonic()
+            if regain:
+                self.paused_until = max(self.paused_until, now + regain)
+            if usage is None:
+                return
+            self.usage = usage
+            if usage >= self.target:
+                self._decrease(now)
+            else:
+                self.throttles = 0
+                if usage < self.target * 0.8:
+                    self.limit = min(self.max_limit, self.limit + 1 / max(1.0, self.limit))
+                    self.interval = self.interval * 0.8 if self.interval > 0.01 else 0.0
+            self.cond.notify_all()
+
+    def throttled(self, headers=None):
+        """A call was rejected for rate limiting: back off and pause new calls."""
+        _, regain = parse_usage(headers)
+        with self.cond:
+            now = time.monotonic()
+            self.throttles += 1
+            pause = min(self.max_pause, self.base_pause * 2 ** (self.throttles - 1))
+            self.paused_until = max(self.paused_until, now + max(regain, pause))
+            self.last_decrease = 0.0
+            self._decrease(now)
+            self.cond.notify_all()
+
+    def _decrease(self, now):
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.limit = max(self.min_limit, self.limit / 2)
+        self.interval = min(self.max_interval, max(self.interval * 1.5, 0.1))
+        self.last_decrease = now
+
+    def state(self):
+        """(concurrency limit, seconds between call starts, last usage percent, calls in flight)."""
+        with self.cond:
+            return int(self.limit), self.interval, self.usage, self.in_flight
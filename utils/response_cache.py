@@ -0,0 +1,132 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key         TEXT PRIMARY KEY,
+    source      TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created     REAL NOT NULL,
+    expires     REAL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+"""
+
+
+def cache_key(source, scope, since, until, body):
+    """Content address of a request: source, account/token scope, range and body."""
+    body_hash = hashlib.sha256(
+        json.dumps(body, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+    raw = json.dumps([source, scope, since, until, body_hash])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def token_scope(access_token):
+    """Stable, non-secret identifier for an access token."""
+    return hashlib.sha256((access_token or '').encode('utf-8')).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    On-disk cache of raw API payloads with age-based freshness and LRU eviction.
+
+    Freshness depends on how old the newest day in the request is: today's
+    data changes constantly, recent days still settle, and older days are
+    kept until evicted.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, ttl_today=15 * 60,
+                 ttl_recent=6 * 3600, settled_days=3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_today = ttl_today
+        self.ttl_recent = ttl_recent
+        self.settled_days = settled_days
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def ttl_for(self, until):
+        """Seconds a payload ending on `until` stays fresh; None means no expiry."""
+        age = (date.today() - datetime.strptime(until, "%Y-%m-%d").date()).days
+        if age <= 0:
+            return self.ttl_today
+        if age < self.settled_days:
+            return self.ttl_recent
+        return None
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.json')
+
+    def get(self, source, scope, since, until, body):
+        """Return the cached payload, or None if missing or stale."""
+        key = cache_key(source, scope, since, until, body)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT expires FROM entries WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] is not None and row[0] < now:
+                self._delete(key)
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    payload = json.load(f)
+            except (OSError, ValueError):
+                self._delete(key)
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE entries SET last_access=? WHERE key=?", (now, key))
+            return payload
+
+    def put(self, source, scope, since, until, body, payload):
+        """Store a payload and evict least-recently-used entries over the size bound."""
+        key = cache_key(source, scope, since, until, body)
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        path = self._path(key)
+        ttl = self.ttl_for(until)
+        now = time.time()
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, source, size, created, expires, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, source, len(data), now, now + ttl if ttl else None, now)
+                )
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            self._delete(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _delete(self, key):
+        with self.conn:
+            self.conn.execute("DELETE FROM entries WHERE key=?", (key,))
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
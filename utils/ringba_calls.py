@@ -0,0 +1,195 @@
+# ringba_calls.py
+import csv
+from array import array
+from datetime import datetime, timezone
+
+# Call-level CSV export headers -> column names used by the API
+EXPORT_HEADERS = {
+    "Campaign": "campaignName",
+    "Publisher": "publisherName",
+    "Connected Call Length": "connectedCallLengthInSeconds",
+    "Call Date": "callDt",
+    "Revenue": "conversionAmount",
+    "Converted": "hasConverted",
+    "Has Converted": "hasConverted",
+    "sub5": "tag:User:sub5",
+}
+
+DIMENSIONS = ("campaign", "publisher", "sub5")
+
+# Grouping by "hour" buckets calls by the UTC hour of their callDt
+HOUR_MS = 3600 * 1000
+
+
+class Vocabulary:
+    """Dictionary-encodes a string column: each distinct value is stored once."""
+
+    def __init__(self, normalize=None):
+        self.normalize = normalize
+        self.codes = {}       # raw value -> code
+        self.by_value = {}    # normalized value -> code
+        self.values = []
+
+    def encode(self, value):
+        value = value or ''
+        code = self.codes.get(value)
+        if code is None:
+            normalized = self.normalize(value) if self.normalize else value
+            code = self.by_value.get(normalized)
+            if code is None:
+                code = self.by_value[normalized] = len(self.values)
+                self.values.append(normalized)
+            self.codes[value] = code
+        return code
+
+
+def _int(value):
+    try:
+        return int(float(value)) if value not in (None, '') else 0
+    except ValueError:
+        return 0
+
+
+def _float(value):
+    try:
+        return float(value) if value not in (None, '') else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _converted(value, revenue):
+    """A conversion flag as given; without one, a call with revenue counts as converted."""
+    if value in (None, ''):
+        return revenue > 0
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+class CallColumns:
+    """
+    Call-level Ringba data held as compact typed columns.
+
+    Rows are appended straight into array buffers, so no per-call dict is
+    kept around; aggregation runs vectorized over NumPy views of them.
+    """
+
+    def __init__(self, normalize_sub5=None):
+        self.call_dt = array('q')     # epoch milliseconds
+        self.duration = array('i')    # connected seconds
+        self.revenue = array('d')
+        self.converted = array('b')
+        self.campaign = array('i')
+        self.publisher = array('i')
+        self.sub5 = array('i')
+        self.vocab = {
+            'campaign': Vocabulary(),
+            'publisher': Vocabulary(),
+            'sub5': Vocabulary(normalize_sub5),
+        }
+
+    def __len__(self):
+        return len(self.call_dt)
+
+    def append(self, campaign, publisher, sub5, call_dt, duration, revenue, converted=None):
+        revenue = _float(revenue)
+        self.call_dt.append(_int(call_dt))
+        self.duration.append(_int(duration))
+        self.revenue.append(revenue)
+        self.converted.append(_converted(converted, revenue))
+        self.campaign.append(self.vocab['campaign'].encode(campaign))
+        self.publisher.append(self.vocab['publisher'].encode(publisher))
+        self.sub5.append(self.vocab['sub5'].encode(sub5))
+
+    def extend_records(self, records):
+        """Append a page of API call-log records."""
+        for rec in records:
+            self.append(
+                rec.get('campaignName'), rec.get('publisherName'), rec.get('tag:User:sub5'),
+                rec.get('callDt'), rec.get('connectedCallLengthInSeconds'),
+                rec.get('conversionAmount'), rec.get('hasConverted'),
+            )
+
+    def extend_csv(self, path):
+        """Stream a call-level CSV export into the columns."""
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            header = [EXPORT_HEADERS.get(h, h) for h in next(reader, [])]
+            pos = {name: i for i, name in enumerate(header)}
+            cols = [pos.get(c) for c in (
+                'campaignName', 'publisherName', 'tag:User:sub5',
+                'callDt', 'connectedCallLengthInSeconds', 'conversionAmount', 'hasConverted',
+            )]
+            for row in reader:
+                self.append(*[
+                    row[i] if i is not None and i < len(row) else '' for i in cols
+                ])
+
+    def arrays(self):
+        """Zero-copy NumPy views of the column buffers."""
+        import numpy as np
+
+        return {
+            'call_dt': np.frombuffer(self.call_dt, dtype=np.int64),
+            'duration': np.frombuffer(self.duration, dtype=np.dtype(f'i{self.duration.itemsize}')),
+            'revenue': np.frombuffer(self.revenue, dtype=np.float64),
+            'converted': np.frombuffer(self.converted, dtype=np.int8),
+            'campaign': np.frombuffer(self.campaign, dtype=np.dtype(f'i{self.campaign.itemsize}')),
+            'publisher': np.frombuffer(self.publisher, dtype=np.dtype(f'i{self.publisher.itemsize}')),
+            'sub5': np.frombuffer(self.sub5, dtype=np.dtype(f'i{self.sub5.itemsize}')),
+        }
+
+    def aggregate(self, by=DIMENSIONS, min_duration=0):
+        """
+        Roll calls up by any combination of campaign, publisher, sub5 and
+        hour. Returns one dict per group with calls, connected calls,
+        converted calls, revenue and total connected seconds.
+        """
+        if not len(self):
+            return []
+        import numpy as np
+
+        cols = self.arrays()
+        codes, values = {}, {}
+        for dim in by:
+            if dim == 'hour':
+                hours, codes[dim] = np.unique(cols['call_dt'] // HOUR_MS, return_inverse=True)
+                values[dim] = [
+                    datetime.fromtimestamp(h * 3600, timezone.utc).strftime("%Y-%m-%dT%H:00Z")
+                    for h in hours.tolist()
+                ]
+            else:
+                codes[dim], values[dim] = cols[dim], self.vocab[dim].values
+        # Fold the group codes into one int64 key per call
+        key = np.zeros(len(self), dtype=np.int64)
+        for dim in by:
+            key = key * len(values[dim]) + codes[dim]
+        groups, inverse = np.unique(key, return_inverse=True)
+        n = len(groups)
+
+        calls = np.bincount(inverse, minlength=n)
+        connected = np.bincount(inverse, weights=cols['duration'] > min_duration, minlength=n)
+        converted = np.bincount(inverse, weights=cols['converted'], minlength=n)
+        revenue = np.bincount(inverse, weights=cols['revenue'], minlength=n)
+        seconds = np.bincount(inverse, weights=cols['duration'], minlength=n)
+
+        rows = []
+        for i, group in enumerate(groups.tolist()):
+            labels = {}
+            for dim in reversed(by):
+                size = len(values[dim])
+                labels[dim] = values[dim][group % size]
+                group //= size
+            row = {dim: labels[dim] for dim in by}
+            row.update({
+                'callCount': int(calls[i]),
+                'connectedCallCount': int(connected[i]),
+                'convertedCalls': int(converted[i]),
+                'conversionAmount': round(float(revenue[i]), 2),
+                'callLengthInSeconds': int(seconds[i]),
+            })
+            rows.append(row)
+        # Hourly rollups stay in key order, which is chronological
+        if 'hour' not in by:
+            rows.sort(key=lambda r: r['callCount'], reverse=True)
+        return rows
@@ -0,0 +1,245 @@
+# ringba_client.py
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import aiohttp
+
+from utils.body_requests import generate_report, generate_ringba_insights
+from utils.metrics import METRICS
+
+RINGBA_API_URL = "https://api.ringba.com/v2"
+
+GROUP_COLUMNS = ("campaignName", "tag:User:sub5", "publisherName")
+
+SUM_COLUMNS = (
+    "callCount", "liveCallCount", "endedCalls", "connectedCallCount",
+    "payoutCount", "convertedCalls", "nonConnectedCallCount", "duplicateCalls",
+    "blockedCalls", "incompleteCalls", "conversionAmount", "payoutAmount",
+    "profitGross", "totalCost",
+)
+TIMESPAN_SUM_COLUMNS = ("callLengthInSeconds",)
+# Summed as floats, so rounded back to cents after merging
+MONEY_COLUMNS = ("conversionAmount", "payoutAmount", "profitGross", "totalCost")
+
+# Averages are re-weighted by the column they are a ratio of
+WEIGHTED_COLUMNS = {
+    "earningsPerCallGross": "callCount",
+    "convertedPercent": "callCount",
+    "profitMarginGross": "conversionAmount",
+    "avgHandleTime": "connectedCallCount",
+}
+TIMESPAN_COLUMNS = ("callLengthInSeconds", "avgHandleTime")
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def to_number(value):
+    """Parse Ringba numbers, which may arrive formatted ("1,234.5", "12.5%")."""
+    if value is None or value == '':
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').replace('%', '').replace('$', ''))
+    except ValueError:
+        return 0.0
+
+
+def timespan_to_seconds(value):
+    """Parse an "HH:MM:SS" timespan (hours may exceed 24) into seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    parts = str(value or '0').split(':')
+    try:
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        return 0.0
+
+
+def format_timespan(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def merge_records(parts):
+    """
+    Merge per-window grouped records back into one record per group,
+    in the same shape the CSV writer reads from a single response. A group
+    seen in one window only is kept as it came; merged groups carry only
+    the columns their records had.
+    """
+    groups = {}
+    for records in parts:
+        for rec in records:
+            key = tuple(rec.get(c, '') for c in GROUP_COLUMNS)
+            groups.setdefault(key, []).append(rec)
+
+    records = []
+    for recs in groups.values():
+        records.append(dict(recs[0]) if len(recs) == 1 else merge_group(recs))
+    records.sort(key=lambda r: to_number(r.get("callCount")), reverse=True)
+    return records
+
+
+def merge_group(recs):
+    """One group's records from several windows as a single record."""
+    out = {}
+    for rec in recs:
+        for col, value in rec.items():
+            out.setdefault(col, value)
+    for col in SUM_COLUMNS:
+        if col in out:
+            total = sum(to_number(rec.get(col)) for rec in recs)
+            out[col] = round(total, 2) if col in MONEY_COLUMNS else total
+            if out[col].is_integer() and all(isinstance(rec.get(col, 0), int) for rec in recs):
+                out[col] = int(out[col])
+    for col in TIMESPAN_SUM_COLUMNS:
+        if col in out:
+            out[col] = format_timespan(sum(timespan_to_seconds(rec.get(col)) for rec in recs))
+    for col, weight_col in WEIGHTED_COLUMNS.items():
+        if col not in out:
+            continue
+        total = weight = 0.0
+        for rec in recs:
+            w = to_number(rec.get(weight_col))
+            value = (timespan_to_seconds(rec.get(col)) if col in TIMESPAN_COLUMNS
+                     else to_number(rec.get(col)))
+            total, weight = total + value * w, weight + w
+        value = total / weight if weight else 0.0
+        if col in TIMESPAN_COLUMNS:
+            out[col] = format_timespan(value)
+        elif any(isinstance(rec.get(col), str) and rec[col].endswith('%') for rec in recs):
+            out[col] = f"{value:.2f}%"
+        else:
+            out[col] = value
+    return out
+
+
+class RingbaClient:
+    """
+    Ringba insights client over one long-lived aiohttp session.
+
+    A day is split into sub-windows fetched concurrently; any window in
+    which a group hits maxResultsPerGroup is treated as truncated and split
+    again.
+    """
+
+    def __init__(self, account_id, api_token, windows=1, max_results=1000,
+                 min_window=timedelta(minutes=15), base_url=RINGBA_API_URL, pool_size=10):
+        self.account_id = account_id
+        self.api_token = api_token
+        self.windows = windows
+        self.max_results = max_results
+        self.min_window = min_window
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.session = None
+
+    def get_session(self):
+        """The shared session, created on first use inside the running loop."""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                headers={"Authorization": f"Token {self.api_token}"},
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def post_insights(self, body):
+        """POST one insights request and return the decoded JSON."""
+        url = f"{self.base_url}/{self.account_id}/insights"
+        METRICS.inc('api_calls', api='ringba')
+        with METRICS.span('ringba_request'):
+            async with self.get_session().post(url, json=body) as resp:
+                raw = await resp.read()
+        METRICS.inc('bytes', len(raw), api='ringba')
+        return json.loads(raw)
+
+    async def iter_call_logs(self, start, end, page_size=1000):
+        """Yield call-level records page by page for [start, end]."""
+        url = f"{self.base_url}/{self.account_id}/calllogs"
+        offset = 0
+        while True:
+            body = generate_report(start_date=start, end_date=end)
+            body.update({'offset': offset, 'size': page_size})
+            METRICS.inc('api_calls', api='ringba')
+            async with self.get_session().post(url, json=body) as resp:
+                raw = await resp.read()
+            METRICS.inc('bytes', len(raw), api='ringba')
+            data = json.loads(raw)
+            records = data.get('report', {}).get('records', [])
+            if records:
+                yield records
+            offset += len(records)
+            total = data.get('report', {}).get('totalCount')
+            if len(records) < page_size or (total is not None and offset >= total):
+                break
+
+    def is_truncated(self, data):
+        """
+        Whether any group reached maxResultsPerGroup: the campaigns, the sub5
+        tags of one campaign, or the publishers of one campaign and sub5.
+        """
+        children = {}
+        for rec in data.get('report', {}).get('records', []):
+            key = tuple(rec.get(c, '') for c in GROUP_COLUMNS)
+            for level in range(len(GROUP_COLUMNS)):
+                children.setdefault(key[:level], set()).add(key[level])
+        return any(len(values) >= self.max_results for values in children.values())
+
+    async def fetch_window(self, start, end):
+        """Fetch [start, end], re-splitting it while the result looks truncated."""
+        body = generate_ringba_insights(
+            start_date=start.strftime(TIME_FORMAT), end_date=end.strftime(TIME_FORMAT)
+        )
+        body['maxResultsPerGroup'] = self.max_results
+        data = await self.post_insights(body)
+        if not data.get('isSuccessful') or not self.is_truncated(data):
+            return data
+        if end - start <= self.min_window:
+            print(f"Ringba window {start} - {end} is still truncated; keeping partial rows.")
+            return data
+        METRICS.inc('retries', api='ringba')
+        middle = start + (end - start) / 2
+        halves = await asyncio.gather(
+            self.fetch_window(start, middle.replace(microsecond=0)),
+            self.fetch_window(middle.replace(microsecond=0) + timedelta(seconds=1), end),
+        )
+        return self.combine(halves)
+
+    def window_bounds(self, start, end):
+        """[start, end] ("...Z" strings) split into `windows` consecutive (start, end) datetimes."""
+        start = datetime.strptime(start, TIME_FORMAT)
+        end = datetime.strptime(end, TIME_FORMAT)
+        if self.windows <= 1:
+            return [(start, end)]
+        step = (end - start + timedelta(seconds=1)) / self.windows
+        bounds = []
+        for i in range(self.windows):
+            ws = start + step * i
+            we = end if i == self.windows - 1 else start + step * (i + 1) - timedelta(seconds=1)
+            bounds.append((ws.replace(microsecond=0), we.replace(microsecond=0)))
+        return bounds
+
+    async def fetch_insights(self, start, end):
+        """Fetch grouped insights for [start, end] as one merged response."""
+        bounds = self.window_bounds(start, end)
+        if len(bounds) == 1:
+            return await self.fetch_window(*bounds[0])
+        parts = await asyncio.gather(*(self.fetch_window(ws, we) for ws, we in bounds))
+        return self.combine(parts)
+
+    def combine(self, parts):
+        """Merge several window responses; any failed window fails the whole fetch."""
+        for data in parts:
+            if not data.get('isSuccessful'):
+                return data
+        records = merge_records([d.get('report', {}).get('records', []) for d in parts])
+        return {'isSuccessful': True, 'report': {'records': records}}
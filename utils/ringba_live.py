@@ -0,0 +1,307 @@
+# ringba_live.py
+import hmac
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+from utils.metrics import METRICS
+from utils.ringba_client import (
+    GROUP_COLUMNS, MONEY_COLUMNS, format_timespan, timespan_to_seconds, to_number
+)
+
+# Ringba days run 05:00Z to 04:59:59Z, as the daily pull requests them
+DAY_OFFSET = timedelta(hours=5)
+
+# Per-call measures summed per (campaignName, tag:User:sub5, publisherName)
+MEASURES = (
+    "callCount", "liveCallCount", "endedCalls", "connectedCallCount",
+    "payoutCount", "convertedCalls", "nonConnectedCallCount", "duplicateCalls",
+    "blockedCalls", "incompleteCalls", "conversionAmount", "payoutAmount",
+    "totalCost", "callLengthInSeconds",
+)
+
+# Event field -> accepted names, first found wins
+ALIASES = {
+    'callId': ('callId', 'inboundCallId', 'call_id'),
+    'callDt': ('callDt', 'callStart', 'timestamp'),
+    'campaignName': ('campaignName', 'campaign'),
+    'publisherName': ('publisherName', 'publisher'),
+    'tag:User:sub5': ('tag:User:sub5', 'sub5'),
+    'ended': ('ended', 'hasEnded', 'completed'),
+    'connected': ('connected', 'hasConnected'),
+    'converted': ('converted', 'hasConverted'),
+    'duplicate': ('duplicate', 'isDuplicate'),
+    'blocked': ('blocked', 'isBlocked'),
+    'incomplete': ('incomplete', 'isIncomplete'),
+    'callLengthInSeconds': ('callLengthInSeconds', 'duration'),
+    'conversionAmount': ('conversionAmount', 'revenue'),
+    'payoutAmount': ('payoutAmount', 'payout'),
+    'totalCost': ('totalCost', 'cost'),
+}
+
+
+def to_flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def parse_call_time(value):
+    """Call time from epoch seconds or milliseconds or an ISO timestamp, as naive UTC."""
+    if value in (None, ''):
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    if number > 1e11:
+        number /= 1000
+    return datetime.fromtimestamp(number, timezone.utc).replace(tzinfo=None)
+
+
+def report_day(call_time):
+    """Report day (YYYY-MM-DD) a call at `call_time` (naive UTC) belongs to."""
+    return (call_time - DAY_OFFSET).strftime("%Y-%m-%d")
+
+
+def normalize_event(raw):
+    """A webhook or pixel payload as the event fields above; absent fields are left out."""
+    event = {}
+    for field, names in ALIASES.items():
+        for name in names:
+            if raw.get(name) not in (None, ''):
+                event[field] = raw[name]
+                break
+    return event
+
+
+def call_measures(call):
+    """What one call, as merged from its events so far, adds to its group."""
+    ended, connected = to_flag(call.get('ended')), to_flag(call.get('connected'))
+    payout = to_number(call.get('payoutAmount'))
+    return [
+        1.0, 0.0 if ended else 1.0, float(ended), float(connected),
+        float(payout > 0), float(to_flag(call.get('converted'))),
+        float(ended and not connected), float(to_flag(call.get('duplicate'))),
+        float(to_flag(call.get('blocked'))), float(to_flag(call.get('incomplete'))),
+        to_number(call.get('conversionAmount')), payout, to_number(call.get('totalCost')),
+        timespan_to_seconds(call.get('callLengthInSeconds')),
+    ]
+
+
+class CallAggregator:
+    """
+    Running Ringba insights per report day, folded from per-call events.
+
+    A call may be reported several times as it progresses (incoming,
+    connected, converted, ended); events with the same callId are merged
+    and the call's old contribution to its group is swapped for the new
+    one, so redelivered or late events never double count. Only the merged
+    fields of each call are kept, and flush() writes them to one JSON file
+    per day, from which the aggregates are rebuilt after a restart.
+    """
+
+    def __init__(self, folder, keep_days=3):
+        self.folder = folder
+        self.keep_days = keep_days
+        self.lock = threading.Lock()
+        self.calls = {}     # day -> {call id: merged event}
+        self.groups = {}    # day -> {group key: [value per MEASURES]}
+        self.dirty = set()
+
+    def load(self):
+        """Rebuild the aggregates from the flushed days."""
+        if not os.path.isdir(self.folder):
+            return
+        for name in sorted(os.listdir(self.folder)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(self.folder, name), 'r', encoding='utf-8') as f:
+                flushed = json.load(f)
+            for call_id, call in flushed.get('calls', {}).items():
+                self.add(dict(call, callId=call_id), day=flushed['day'])
+        self.dirty.clear()
+
+    def add(self, raw, day=None):
+        """
+        Fold one call event in; returns its report day, or None for an event
+        without a call id, which could not be told apart from a redelivery.
+        """
+        event = normalize_event(raw)
+        call_id = event.pop('callId', None)
+        if not call_id:
+            METRICS.inc('ringba_events_skipped')
+            return None
+        call_id = str(call_id)
+        with self.lock:
+            day = day or self._day_of(call_id, event)
+            calls = self.calls.setdefault(day, {})
+            groups = self.groups.setdefault(day, {})
+            old = calls.get(call_id)
+            if old is not None:
+                self._fold(groups, old, -1)
+            call = dict(old or {}, **event)
+            # The call keeps the time of its first event, which decided its day
+            first = (old or event).get('callDt')
+            call['callDt'] = first or datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+            calls[call_id] = call
+            self._fold(groups, call, 1)
+            self.dirty.add(day)
+        METRICS.inc('ringba_events')
+        return day
+
+    def _day_of(self, call_id, event):
+        # A call stays on the day of its first event, even if later ones carry another time
+        for day, calls in self.calls.items():
+            if call_id in calls:
+                return day
+        return report_day(parse_call_time(event.get('callDt')))
+
+    def _fold(self, groups, call, sign):
+        key = tuple(str(call.get(c, '') or '') for c in GROUP_COLUMNS)
+        totals = groups.setdefault(key, [0.0] * len(MEASURES))
+        for i, value in enumerate(call_measures(call)):
+            totals[i] += sign * value
+        if totals[0] <= 0:
+            del groups[key]
+
+    def days(self):
+        with self.lock:
+            return sorted(self.calls)
+
+    def records(self, day):
+        """
+        The day's groups as insights records, shaped like the merged API
+        response: sums as numbers, timespans as HH:MM:SS, ratios re-derived.
+        """
+        with self.lock:
+            groups = {key: list(totals) for key, totals in self.groups.get(day, {}).items()}
+        records = []
+        for key, totals in groups.items():
+            rec = dict(zip(GROUP_COLUMNS, key))
+            rec.update(zip(MEASURES, totals))
+            calls, revenue, connected = rec['callCount'], rec['conversionAmount'], rec['connectedCallCount']
+            rec['profitGross'] = revenue - rec['totalCost']
+            rec['earningsPerCallGross'] = revenue / calls if calls else 0.0
+            rec['profitMarginGross'] = f"{rec['profitGross'] / revenue * 100 if revenue else 0.0:.2f}%"
+            rec['convertedPercent'] = f"{rec['convertedCalls'] / calls * 100 if calls else 0.0:.2f}%"
+            rec['avgHandleTime'] = format_timespan(rec['callLengthInSeconds'] / connected if connected else 0)
+            rec['callLengthInSeconds'] = format_timespan(rec['callLengthInSeconds'])
+            for column in MONEY_COLUMNS:
+                rec[column] = round(rec[column], 2)
+            for column in MEASURES:
+                if isinstance(rec[column], float) and rec[column].is_integer():
+                    rec[column] = int(rec[column])
+            records.append(rec)
+        records.sort(key=lambda r: r['callCount'], reverse=True)
+        return records
+
+    def reconcile(self, day, pulled):
+        """
+        Compare the day's live aggregates with the records of the daily pull,
+        which stays authoritative: call count and revenue on both sides, and
+        the groups only one side has.
+        """
+        live = {tuple(r.get(c, '') for c in GROUP_COLUMNS): r for r in self.records(day)}
+        pulled = {tuple(str(r.get(c, '') or '') for c in GROUP_COLUMNS): r for r in pulled}
+        return {
+            'live_calls': int(sum(to_number(r.get('callCount')) for r in live.values())),
+            'pulled_calls': int(sum(to_number(r.get('callCount')) for r in pulled.values())),
+            'live_revenue': round(sum(to_number(r.get('conversionAmount')) for r in live.values()), 2),
+            'pulled_revenue': round(sum(to_number(r.get('conversionAmount')) for r in pulled.values()), 2),
+            'missing_groups': sorted(set(pulled) - set(live)),
+            'extra_groups': sorted(set(live) - set(pulled)),
+        }
+
+    # ======================================
+    #  Persistence
+    # ======================================
+    def flush(self, today=None):
+        """Write the days that changed since the last flush and forget days past keep_days."""
+        os.makedirs(self.folder, exist_ok=True)
+        with self.lock:
+            pending = {day: dict(self.calls.get(day, {})) for day in self.dirty}
+        for day, calls in pending.items():
+            path = os.path.join(self.folder, f"{day}.json")
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'day': day, 'calls': calls}, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+            with self.lock:
+                # Events that arrived during the write keep the day dirty
+                if self.calls.get(day) == calls:
+                    self.dirty.discard(day)
+        today = today or report_day(datetime.now(timezone.utc).replace(tzinfo=None))
+        cutoff = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        for day in [d for d in self.days() if d < cutoff]:
+            self.drop(day)
+        return len(pending)
+
+    def drop(self, day):
+        """Forget a day, in memory and on disk."""
+        with self.lock:
+            self.calls.pop(day, None)
+            self.groups.pop(day, None)
+            self.dirty.discard(day)
+        path = os.path.join(self.folder, f"{day}.json")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class RingbaWebhookServer:
+    """
+    Receives Ringba call events at `path`: JSON (one event or a list) by
+    POST, or a pixel's query string by GET. With a token set, requests must
+    carry it as ?token= or an X-Webhook-Token header.
+    """
+
+    def __init__(self, aggregator, host='127.0.0.1', port=9109, path='/ringba/calls', token=None):
+        self.aggregator = aggregator
+        self.host = host
+        self.port = port
+        self.path = path
+        self.token = token
+        self.runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.router.add_get(self.path, self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        print(f"Ringba call events received at http://{self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def authorized(self, request):
+        if not self.token:
+            return True
+        given = request.headers.get('X-Webhook-Token') or request.query.get('token') or ''
+        return hmac.compare_digest(given.encode('utf-8'), self.token.encode('utf-8'))
+
+    async def handle(self, request):
+        if not self.authorized(request):
+            return web.Response(status=401)
+        if request.method == 'POST':
+            try:
+                body = await request.json()
+            except ValueError:
+                return web.Response(status=400, text="expected a JSON event or list of events")
+            events = body if isinstance(body, list) else [body]
+        else:
+            events = [{k: v for k, v in request.query.items() if k != 'token'}]
+        try:
+            for event in events:
+                self.aggregator.add(event)
+        except (AttributeError, TypeError, ValueError) as e:
+            return web.Response(status=400, text=f"bad event: {e}")
+        return web.Response(status=204)
@@ -0,0 +1,226 @@
+# rollups.py
+import asyncio
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+from utils.matcher import match_key
+from utils.ringba_client import to_number
+from utils.sinks import Sink
+
+GRAINS = ('week', 'month')
+# Meta publishers are business manager labels and Ringba publishers are
+# Ringba's own, so each source keeps its own publisher dimension
+DIMENSIONS = ('meta_publisher', 'ringba_publisher', 'account', 'adset', 'campaign')
+# Only these dimensions key both sources alike, so only they get profit, ROAS and CPA
+CROSS_SOURCE = ('adset',)
+MEASURES = (
+    'rows', 'spend', 'link_clicks', 'impressions',
+    'calls', 'conversions', 'revenue', 'payout', 'cost',
+)
+COUNTS = {'link_clicks', 'impressions', 'calls', 'conversions'}
+_POSITION = {m: i for i, m in enumerate(MEASURES)}
+
+_COLUMNS = ',\n    '.join(f"{m:<11} REAL NOT NULL DEFAULT 0" for m in MEASURES)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS contributions (
+    source      TEXT NOT NULL,
+    day         TEXT NOT NULL,
+    dimension   TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    {_COLUMNS},
+    PRIMARY KEY (source, day, dimension, key)
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    grain       TEXT NOT NULL,
+    bucket      TEXT NOT NULL,
+    dimension   TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    {_COLUMNS},
+    PRIMARY KEY (grain, dimension, bucket, key)
+);
+"""
+
+
+def bucket_start(grain, day):
+    """First day of the ISO week (Monday) or month holding `day`, as YYYY-MM-DD."""
+    d = date.fromisoformat(day)
+    if grain == 'week':
+        d -= timedelta(days=d.weekday())
+    else:
+        d = d.replace(day=1)
+    return d.isoformat()
+
+
+def day_contributions(source, rows, totals=None):
+    """
+    Measures one day of report rows (dicts) adds per (dimension, key), as
+    {(dimension, key): [value per MEASURES]}; pass the previous `totals` to
+    fold in more rows. Adsets are keyed like the matcher keys them, so a
+    Meta adset and the Ringba sub5 tag it drives land in the same adset rollup.
+    """
+    totals = {} if totals is None else totals
+
+    def add(dimension, key, **values):
+        measures = totals.setdefault((dimension, str(key or '')), [0.0] * len(MEASURES))
+        measures[0] += 1
+        for name, value in values.items():
+            measures[_POSITION[name]] += value
+
+    for row in rows:
+        if source == 'meta':
+            spend = to_number(row.get('spend'))
+            cpm = to_number(row.get('cpm'))
+            values = {
+                'spend': spend,
+                'link_clicks': to_number(row.get('inline_link_click')),
+                # CPM is spend per thousand impressions, so impressions can be recovered
+                'impressions': spend / cpm * 1000 if cpm else 0.0,
+            }
+            keys = (('meta_publisher', row.get('publisher')), ('account', row.get('account_name')),
+                    ('adset', match_key(row.get('adset_name'))))
+        else:
+            values = {
+                'calls': to_number(row.get('callCount')),
+                'conversions': to_number(row.get('convertedCalls')),
+                'revenue': to_number(row.get('conversionAmount')),
+                'payout': to_number(row.get('payoutAmount')),
+                'cost': to_number(row.get('totalCost')),
+            }
+            keys = (('ringba_publisher', row.get('publisherName')), ('adset', match_key(row.get('tag:User:sub5'))),
+                    ('campaign', row.get('campaignName')))
+        for dimension, key in keys:
+            add(dimension, key, **values)
+    return totals
+
+
+class RollupStore:
+    """
+    Week and month totals of the daily reports per Meta and Ringba
+    publisher, account, adset and campaign, kept in SQLite.
+
+    Each (source, day) remembers what it contributed per key, so reloading
+    a day only touches the week and month holding it: the old contribution
+    is subtracted from those buckets and the new one added, in one
+    transaction. Range queries read the materialized buckets directly.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def days(self, source):
+        """Days that have contributed to the rollups."""
+        with self.lock:
+            return [d for (d,) in self.conn.execute(
+                "SELECT DISTINCT day FROM contributions WHERE source=? ORDER BY day", (source,)
+            )]
+
+    # ======================================
+    #  Updates
+    # ======================================
+    def apply(self, source, day, rows):
+        """Replace one day's contribution from `source`; returns the number of keys that moved."""
+        return self.apply_totals(source, day, day_contributions(source, rows))
+
+    def apply_totals(self, source, day, totals):
+        """apply() for contributions already folded with day_contributions."""
+        columns = ', '.join(MEASURES)
+        with self.lock, self.conn:
+            old = {
+                (dimension, key): list(measures)
+                for dimension, key, *measures in self.conn.execute(
+                    f"SELECT dimension, key, {columns} FROM contributions WHERE source=? AND day=?",
+                    (source, day)
+                )
+            }
+            zero = [0.0] * len(MEASURES)
+            deltas = []
+            for dimension, key in set(old) | set(totals):
+                delta = [n - o for o, n in zip(old.get((dimension, key), zero), totals.get((dimension, key), zero))]
+                if any(delta):
+                    deltas.append((dimension, key, delta))
+
+            updates = ', '.join(f"{m}=ROUND({m} + excluded.{m}, 6)" for m in MEASURES)
+            for grain in GRAINS:
+                bucket = bucket_start(grain, day)
+                self.conn.executemany(
+                    f"INSERT INTO rollups (grain, bucket, dimension, key, {columns}) "
+                    f"VALUES (?, ?, ?, ?, {', '.join('?' * len(MEASURES))}) "
+                    f"ON CONFLICT (grain, dimension, bucket, key) DO UPDATE SET {updates}",
+                    [(grain, bucket, dimension, key, *delta) for dimension, key, delta in deltas]
+                )
+                # Keys no row of the bucket mentions any more
+                self.conn.execute(
+                    "DELETE FROM rollups WHERE grain=? AND bucket=? AND rows<=0", (grain, bucket)
+                )
+
+            self.conn.execute("DELETE FROM contributions WHERE source=? AND day=?", (source, day))
+            self.conn.executemany(
+                f"INSERT INTO contributions (source, day, dimension, key, {columns}) "
+                f"VALUES (?, ?, ?, ?, {', '.join('?' * len(MEASURES))})",
+                [(source, day, dimension, key, *measures) for (dimension, key), measures in totals.items()]
+            )
+        return len(deltas)
+
+    # ======================================
+    #  Queries
+    # ======================================
+    def query(self, grain, dimension, since, until, key=None):
+        """
+        Buckets of one grain and dimension overlapping [since, until], busiest
+        first within each bucket, with CPM derived, and profit, ROAS and CPA
+        for the CROSS_SOURCE dimensions ('' elsewhere).
+        """
+        sql = (f"SELECT bucket, key, {', '.join(MEASURES)} FROM rollups "
+               "WHERE grain=? AND dimension=? AND bucket BETWEEN ? AND ?")
+        params = [grain, dimension, bucket_start(grain, since), bucket_start(grain, until)]
+        if key is not None:
+            sql += " AND key=?"
+            params.append(match_key(key) if dimension == 'adset' else key)
+        sql += " ORDER BY bucket, spend + revenue DESC, key"
+        with self.lock:
+            found = self.conn.execute(sql, params).fetchall()
+
+        cross = dimension in CROSS_SOURCE
+        results = []
+        for bucket, key, *measures in found:
+            row = dict(zip(MEASURES, measures))
+            spend, revenue = row['spend'], row['revenue']
+            results.append({
+                'bucket': bucket, 'key': key,
+                **{m: int(round(v)) if m in COUNTS else round(v, 2) for m, v in row.items() if m != 'rows'},
+                'profit': round(revenue - spend, 2) if cross else '',
+                'roas': round(revenue / spend, 4) if cross and spend else '',
+                'cpa': round(spend / row['conversions'], 2) if cross and row['conversions'] else '',
+                'cpm': round(spend / row['impressions'] * 1000, 2) if row['impressions'] else '',
+            })
+        return results
+
+
+class RollupSink(Sink):
+    """Folds a report stream into its day's contributions, then swaps them in on close."""
+
+    def __init__(self, name, store, source, day):
+        self.name = name
+        self.store = store
+        self.source = source
+        self.day = day
+        self.totals = {}
+        self.count = 0
+
+    async def write(self, rows):
+        day_contributions(self.source, (dict(zip(self.header, r)) for r in rows), self.totals)
+        self.count += len(rows)
+
+    async def close(self):
+        """Number of keys that moved; a stream without rows leaves the rollups alone."""
+        if not self.count:
+            return 0
+        return await asyncio.to_thread(self.store.apply_totals, self.source, self.day, self.totals)
@@ -0,0 +1,322 @@
+# row_index.py
+import hashlib
+import sqlite3
+import threading
+from collections import Counter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    sheet     TEXT NOT NULL,
+    partition TEXT NOT NULL,
+    fp        INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rows_lookup ON rows (sheet, partition, fp);
+CREATE TABLE IF NOT EXISTS partitions (
+    sheet     TEXT NOT NULL,
+    partition TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    PRIMARY KEY (sheet, partition)
+);
+CREATE TABLE IF NOT EXISTS spans (
+    sheet     TEXT NOT NULL,
+    partition TEXT NOT NULL,
+    start_row INTEGER NOT NULL,
+    row_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spans_lookup ON spans (sheet, partition);
+CREATE TABLE IF NOT EXISTS sheets (
+    sheet     TEXT PRIMARY KEY,
+    row_count INTEGER NOT NULL,
+    last_fp   INTEGER
+);
+"""
+
+
+def normalize_row(row):
+    """Stringify cells and drop trailing blanks, which Sheets never returns."""
+    cells = [str(c) for c in row]
+    while cells and cells[-1] == '':
+        cells.pop()
+    return cells
+
+
+def fingerprint(row):
+    """64-bit signed fingerprint of a row's cell values."""
+    data = '\x1f'.join(normalize_row(row)).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+
+def contiguous_runs(keys, start_row=1):
+    """Split a column of partition keys into (partition, start_row, row_count) runs."""
+    runs = []
+    for i, key in enumerate(keys, start=start_row):
+        if runs and runs[-1][0] == key:
+            runs[-1][2] += 1
+        else:
+            runs.append([key, i, 1])
+    return [tuple(r) for r in runs]
+
+
+def partition_of(row):
+    """Rows are partitioned by their first cell (date_start, or the header)."""
+    return str(row[0]) if row else ''
+
+
+def quote_sheet(sheet):
+    """Quote a sheet name for use in A1 notation."""
+    return "'" + sheet.replace("'", "''") + "'"
+
+
+class RowIndex:
+    """
+    Persistent index of row fingerprints per sheet and date partition,
+    used to deduplicate appends without downloading the sheet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # ======================================
+    #  Lookups
+    # ======================================
+    def filter_new(self, sheet, rows):
+        """Return the rows whose fingerprint is not indexed for their partition."""
+        with self.lock:
+            new_rows = []
+            for row in rows:
+                found = self.conn.execute(
+                    "SELECT 1 FROM rows WHERE sheet=? AND partition=? AND fp=? LIMIT 1",
+                    (sheet, partition_of(row), fingerprint(row))
+                ).fetchone()
+                if not found:
+                    new_rows.append(row)
+            return new_rows
+
+    def partition_counts(self, sheet):
+        """Indexed row count per partition."""
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT partition, row_count FROM partitions WHERE sheet=?", (sheet,)
+            ).fetchall())
+
+    def spans(self, sheet, partition):
+        """Contiguous (start_row, row_count) ranges a partition occupies, 1-based."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT start_row, row_count FROM spans WHERE sheet=? AND partition=? "
+                "ORDER BY start_row", (sheet, partition)
+            ).fetchall()
+
+    def sheet_state(self, sheet):
+        """Return (row_count, last_fp), or None if the sheet was never indexed."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT row_count, last_fp FROM sheets WHERE sheet=?", (sheet,)
+            ).fetchone()
+
+    # ======================================
+    #  Updates
+    # ======================================
+    def record_append(self, sheet, rows):
+        """Index rows that were just appended to the end of a sheet."""
+        if not rows:
+            return
+        with self.lock, self.conn:
+            counts = Counter()
+            self.conn.executemany(
+                "INSERT INTO rows (sheet, partition, fp) VALUES (?, ?, ?)",
+                [(sheet, partition_of(r), fingerprint(r)) for r in rows]
+            )
+            counts.update(partition_of(r) for r in rows)
+            for partition, count in counts.items():
+                self._add_partition_count(sheet, partition, count)
+            state = self.conn.execute(
+                "SELECT row_count FROM sheets WHERE sheet=?", (sheet,)
+            ).fetchone()
+            row_count = state[0] if state else 0
+            runs = contiguous_runs([partition_of(r) for r in rows], start_row=row_count + 1)
+            # Rows appended right below their own partition extend its span
+            last = self.conn.execute(
+                "SELECT rowid, partition FROM spans WHERE sheet=? AND start_row+row_count=?",
+                (sheet, row_count + 1)
+            ).fetchone()
+            if last and last[1] == runs[0][0]:
+                self.conn.execute(
+                    "UPDATE spans SET row_count=row_count+? WHERE rowid=?", (runs[0][2], last[0])
+                )
+                runs = runs[1:]
+            self.conn.executemany(
+                "INSERT INTO spans (sheet, partition, start_row, row_count) VALUES (?, ?, ?, ?)",
+                [(sheet,) + run for run in runs]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sheets (sheet, row_count, last_fp) VALUES (?, ?, ?)",
+                (sheet, row_count + len(rows), fingerprint(rows[-1]))
+            )
+
+    def replace_rows(self, sheet, changes):
+        """Re-fingerprint rows overwritten in place: [(row_number, old_row, new_row)]."""
+        if not changes:
+            return
+        with self.lock, self.conn:
+            for _, old, new in changes:
+                self.conn.execute(
+                    "DELETE FROM rows WHERE rowid IN (SELECT rowid FROM rows "
+                    "WHERE sheet=? AND partition=? AND fp=? LIMIT 1)",
+                    (sheet, partition_of(old), fingerprint(old))
+                )
+                self.conn.execute(
+                    "INSERT INTO rows (sheet, partition, fp) VALUES (?, ?, ?)",
+                    (sheet, partition_of(new), fingerprint(new))
+                )
+            state = self.conn.execute(
+                "SELECT row_count FROM sheets WHERE sheet=?", (sheet,)
+            ).fetchone()
+            for row_number, _, new in changes:
+                if state and row_number == state[0]:
+                    self.conn.execute(
+                        "UPDATE sheets SET last_fp=? WHERE sheet=?", (fingerprint(new), sheet)
+                    )
+
+    def drop_partition(self, sheet, partition):
+        """Forget a partition whose rows were deleted from the sheet."""
+        with self.lock, self.conn:
+            count = self.conn.execute(
+                "SELECT row_count FROM partitions WHERE sheet=? AND partition=?",
+                (sheet, partition)
+            ).fetchone()
+            if not count:
+                return
+            self.conn.execute("DELETE FROM rows WHERE sheet=? AND partition=?", (sheet, partition))
+            self.conn.execute("DELETE FROM partitions WHERE sheet=? AND partition=?", (sheet, partition))
+            self._remove_spans(sheet, partition)
+            # The last row may have been deleted, so only the row count stays trustworthy
+            self.conn.execute(
+                "UPDATE sheets SET row_count=row_count-?, last_fp=NULL WHERE sheet=?",
+                (count[0], sheet)
+            )
+
+    def _remove_spans(self, sheet, partition):
+        """Drop a partition's spans and shift the rows below them up."""
+        removed = self.conn.execute(
+            "SELECT start_row, row_count FROM spans WHERE sheet=? AND partition=? "
+            "ORDER BY start_row DESC", (sheet, partition)
+        ).fetchall()
+        self.conn.execute("DELETE FROM spans WHERE sheet=? AND partition=?", (sheet, partition))
+        for start_row, row_count in removed:
+            self.conn.execute(
+                "UPDATE spans SET start_row=start_row-? WHERE sheet=? AND start_row>?",
+                (row_count, sheet, start_row)
+            )
+
+    def _add_partition_count(self, sheet, partition, count):
+        self.conn.execute(
+            "INSERT INTO partitions (sheet, partition, row_count) VALUES (?, ?, ?) "
+            "ON CONFLICT (sheet, partition) DO UPDATE SET row_count=row_count+excluded.row_count",
+            (sheet, partition, count)
+        )
+
+    # ======================================
+    #  Sheet synchronization
+    # ======================================
+    def has_drifted(self, service, spreadsheet_id, sheet):
+        """
+        Cheap drift check: the indexed last row must exist (and match, when
+        known) and the row after it must be empty. Reads at most two rows.
+        Row spans that do not add up to the sheet's row count also count as drift.
+        """
+        state = self.sheet_state(sheet)
+        if state is None:
+            return True
+        row_count, last_fp = state
+        with self.lock:
+            spanned = self.conn.execute(
+                "SELECT COALESCE(SUM(row_count), 0) FROM spans WHERE sheet=?", (sheet,)
+            ).fetchone()[0]
+        if spanned != row_count:
+            return True
+        if row_count == 0:
+            rng = f"{quote_sheet(sheet)}!A1:Z1"
+        else:
+            rng = f"{quote_sheet(sheet)}!A{row_count}:Z{row_count + 1}"
+        values = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=rng
+        ).execute().get('values', [])
+        if row_count == 0:
+            return bool(values)
+        if len(values) != 1 or not normalize_row(values[0]):
+            return True
+        return last_fp is not None and fingerprint(values[0]) != last_fp
+
+    def sync(self, service, spreadsheet_id, sheet):
+        """
+        Bring the index in line with the sheet if it drifted. Only column A
+        is read in full; rows are downloaded just for partitions whose row
+        counts disagree with the index. Returns True if a resync happened.
+        """
+        if not self.has_drifted(service, spreadsheet_id, sheet):
+            return False
+
+        column = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=f"{quote_sheet(sheet)}!A:A"
+        ).execute().get('values', [])
+        keys = [r[0] if r else '' for r in column]
+        sheet_counts = Counter(keys)
+        indexed_counts = self.partition_counts(sheet)
+        stale = {p for p, c in sheet_counts.items() if indexed_counts.get(p) != c}
+        removed = set(indexed_counts) - set(sheet_counts)
+
+        # Download only the rows of stale partitions, grouped into contiguous ranges
+        ranges = []
+        for i, key in enumerate(keys, start=1):
+            if key in stale:
+                if ranges and ranges[-1][1] == i - 1:
+                    ranges[-1][1] = i
+                else:
+                    ranges.append([i, i])
+        fetched = []
+        for start in range(0, len(ranges), 100):
+            chunk = ranges[start:start + 100]
+            res = service.spreadsheets().values().batchGet(
+                spreadsheetId=spreadsheet_id,
+                ranges=[f"{quote_sheet(sheet)}!A{a}:Z{b}" for a, b in chunk]
+            ).execute()
+            for value_range in res.get('valueRanges', []):
+                fetched.extend(value_range.get('values', []))
+
+        last_fp = None
+        if keys:
+            last = service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=f"{quote_sheet(sheet)}!A{len(keys)}:Z{len(keys)}"
+            ).execute().get('values', [])
+            last_fp = fingerprint(last[0]) if last else None
+
+        with self.lock, self.conn:
+            for partition in stale | removed:
+                self.conn.execute("DELETE FROM rows WHERE sheet=? AND partition=?", (sheet, partition))
+                self.conn.execute("DELETE FROM partitions WHERE sheet=? AND partition=?", (sheet, partition))
+            self.conn.executemany(
+                "INSERT INTO rows (sheet, partition, fp) VALUES (?, ?, ?)",
+                [(sheet, partition_of(r), fingerprint(r)) for r in fetched if r]
+            )
+            for partition in stale:
+                self._add_partition_count(sheet, partition, sheet_counts[partition])
+            self.conn.execute("DELETE FROM spans WHERE sheet=?", (sheet,))
+            self.conn.executemany(
+                "INSERT INTO spans (sheet, partition, start_row, row_count) VALUES (?, ?, ?, ?)",
+                [(sheet,) + run for run in contiguous_runs(keys)]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sheets (sheet, row_count, last_fp) VALUES (?, ?, ?)",
+                (sheet, len(keys), last_fp)
+            )
+        print(f"Row index resynced for '{sheet}': {len(stale)} partitions refreshed, "
+              f"{len(removed)} removed.")
+        return True
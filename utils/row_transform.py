@@ -0,0 +1,108 @@
+# row_transform.py
+import csv
+import re
+import unicodedata
+from functools import lru_cache
+
+# Placeholder the report writers have always used for absent columns
+NO_VALUE = '-no value-'
+
+# Same fields strptime('%H:%M:%S') accepts (ASCII digits, hours 0-23,
+# minutes 0-59); seconds 60-61 parse but fail datetime(), so they are excluded
+_DURATION = re.compile(r'([01]?[0-9]|2[0-3]):([0-5]?[0-9]):([0-5]?[0-9])')
+
+
+@lru_cache(maxsize=65536)
+def clean_string(text):
+    """Remove accents and replace spaces with underscores."""
+    return ''.join(c for c in unicodedata.normalize('NFD', text)
+                   if unicodedata.category(c) != 'Mn').replace(' ', '_')
+
+
+@lru_cache(maxsize=4096)
+def time_to_seconds(time_str):
+    """Convert HH:MM:SS to total seconds, or 0 if it is not a valid time of day."""
+    m = _DURATION.fullmatch(time_str)
+    if m is None:
+        return 0
+    return int(m.group(1)) * 3600 + int(m.group(2)) * 60 + int(m.group(3))
+
+
+def truncate(number, decimals=0):
+    """Truncate float to specified decimals."""
+    factor = 10 ** decimals
+    return int(number * factor) / factor
+
+
+@lru_cache(maxsize=65536)
+def truncate_3(value):
+    """Parse a number and truncate it to 3 decimals."""
+    return truncate(float(value), 3)
+
+
+class Field:
+    """
+    One output column: read `name` (or `default` when absent) from the
+    record and pass it through `transform`, or take `context` from the run.
+    """
+
+    def __init__(self, name, transform=None, default=NO_VALUE, context=None):
+        self.name = name
+        self.transform = transform
+        self.default = default
+        self.context = context
+
+
+class RowSchema:
+    """Ordered output columns of one report, compiled into a streaming transform."""
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.header = [f.name for f in self.fields]
+
+    def rows(self, records, **context):
+        """Yield one output row (list) per record; records are never modified."""
+        plan = [
+            (f.name, f.default, f.transform, f.context is not None, context.get(f.context))
+            for f in self.fields
+        ]
+        for rec in records:
+            get = rec.get
+            yield [
+                value if from_context
+                else transform(get(name, default)) if transform
+                else get(name, default)
+                for name, default, transform, from_context, value in plan
+            ]
+
+    def write_csv(self, path, records, **context):
+        """Stream records into a CSV with a header row; returns the number of data rows."""
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as csvf:
+            w = csv.writer(csvf)
+            w.writerow(self.header)
+            for row in self.rows(records, **context):
+                w.writerow(row)
+                count += 1
+        return count
+
+
+META_SCHEMA = RowSchema([
+    Field('date_start'), Field('date_stop'), Field('account_name'), Field('publisher'),
+    Field('adset_name', clean_string), Field('cpc_link'), Field('ctr_link'),
+    Field('inline_link_click'), Field('cpm'), Field('spend'), Field('avg_playtime'),
+])
+
+RINGBA_SCHEMA = RowSchema([
+    Field('date_start', context='since'), Field('date_stop', context='since'),
+    Field('callCount'), Field('liveCallCount'), Field('endedCalls'), Field('connectedCallCount'),
+    Field('payoutCount'), Field('convertedCalls'), Field('nonConnectedCallCount'),
+    Field('duplicateCalls'), Field('blockedCalls'), Field('incompleteCalls'),
+    Field('earningsPerCallGross', truncate_3, default=0), Field('conversionAmount'),
+    Field('payoutAmount'), Field('profitGross'), Field('profitMarginGross'),
+    Field('convertedPercent'),
+    Field('callLengthInSeconds', time_to_seconds, default='00:00:00'),
+    Field('avgHandleTime', time_to_seconds, default='00:00:00'),
+    Field('totalCost'), Field('publisherName'),
+    Field('tag:User:sub5', clean_string, default=''), Field('campaignName'),
+])
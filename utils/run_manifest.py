@@ -0,0 +1,138 @@
+# run_manifest.py
+import hashlib
+import json
+import os
+import random
+import threading
+from datetime import datetime
+
+
+def backoff_delay(attempt, base=2.0, cap=60.0):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def payload_lines(rows):
+    """Rows as JSON lines with sorted keys, as payloads are stored and hashed."""
+    return ''.join(json.dumps(row, sort_keys=True, default=str, ensure_ascii=False) + '\n' for row in rows)
+
+
+def meta_unit(account_id):
+    return f"meta:{account_id}"
+
+
+class PayloadWriter:
+    """
+    Streams one unit's rows to its payload file page by page, hashing as it
+    goes; commit() makes the file the unit's payload and marks it done.
+    """
+
+    def __init__(self, manifest, unit):
+        self.manifest = manifest
+        self.unit = unit
+        self.path = manifest.payload_path(unit)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path + '.tmp', 'w', encoding='utf-8')
+        self.digest = hashlib.sha256()
+        self.count = 0
+
+    def write(self, rows):
+        lines = payload_lines(rows)
+        self.file.write(lines)
+        self.digest.update(lines.encode('utf-8'))
+        self.count += len(rows)
+
+    def commit(self):
+        """Returns whether the unit's payload changed since its last success."""
+        self.file.close()
+        os.replace(self.path + '.tmp', self.path)
+        return self.manifest.mark_success(self.unit, self.count, self.digest.hexdigest())
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path + '.tmp'):
+            os.remove(self.path + '.tmp')
+
+
+class RunManifest:
+    """
+    Status of every unit of one day's report: each ad account
+    ('meta:<account id>') and the Ringba report ('ringba').
+
+    A unit records its status, attempts, row count, payload hash and last
+    error; the rows of a unit that succeeded are kept beside the manifest,
+    so a retry can rebuild the day from them plus whatever it refetched.
+    """
+
+    def __init__(self, root, day, fresh=False):
+        self.root = root
+        self.day = day
+        self.path = os.path.join(root, f"run_{day}.json")
+        self.lock = threading.Lock()
+        self.units = {}
+        # A fresh manifest starts over; the old one is replaced on the first save
+        if not fresh and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.units = json.load(f).get('units', {})
+
+    def payload_path(self, unit):
+        return os.path.join(self.root, self.day, unit.replace(':', '_') + '.jsonl')
+
+    def payload(self, unit):
+        """Rows stored for a unit that succeeded, or None."""
+        path = self.payload_path(unit)
+        if self.units.get(unit, {}).get('status') != 'ok' or not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def failed(self, prefix=''):
+        return sorted(u for u, s in self.units.items() if u.startswith(prefix) and s['status'] == 'failed')
+
+    def succeeded(self, prefix=''):
+        return sorted(u for u, s in self.units.items() if u.startswith(prefix) and s['status'] == 'ok')
+
+    def summary(self):
+        """(ok, failed) unit counts per source."""
+        counts = {}
+        for unit, state in self.units.items():
+            ok, failed = counts.get(unit.split(':')[0], (0, 0))
+            counts[unit.split(':')[0]] = (ok + 1, failed) if state['status'] == 'ok' else (ok, failed + 1)
+        return counts
+
+    # ======================================
+    #  Updates
+    # ======================================
+    def open_payload(self, unit):
+        return PayloadWriter(self, unit)
+
+    def record_success(self, unit, rows):
+        """Keep a unit's rows and mark it done; returns whether its payload changed."""
+        writer = self.open_payload(unit)
+        writer.write(rows)
+        return writer.commit()
+
+    def mark_success(self, unit, count, digest):
+        with self.lock:
+            state = self.units.get(unit, {})
+            changed = state.get('hash') != digest
+            self.units[unit] = {
+                'status': 'ok', 'attempts': state.get('attempts', 0) + 1, 'rows': count,
+                'hash': digest, 'error': None, 'updated': datetime.now().isoformat(timespec='seconds'),
+            }
+        return changed
+
+    def record_failure(self, unit, error):
+        with self.lock:
+            state = self.units.get(unit, {})
+            self.units[unit] = dict(
+                state, status='failed', attempts=state.get('attempts', 0) + 1, error=str(error),
+                updated=datetime.now().isoformat(timespec='seconds')
+            )
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        with self.lock:
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'day': self.day, 'units': self.units}, f, indent=2)
+            os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,55 @@
+# run_queue.py
+import asyncio
+from datetime import datetime
+
+
+class ReportRun:
+    """Everything one report run produces, kept off the cog instance."""
+
+    def __init__(self, since, requester):
+        self.since = since
+        self.requesters = [requester]
+        self.messages = []
+        self.sheet_rows_meta = 0
+        self.sheet_rows_ringba = 0
+        self.meta_path = None
+        self.ringba_path = None
+        self.manifest = None
+        self.started = None
+        self.finished = None
+        self.task = None
+
+
+class RunQueue:
+    """
+    Runs report pipelines with at most `limit` dates in flight.
+    A request for a date that is already running joins that run instead
+    of starting another one.
+    """
+
+    def __init__(self, runner, limit=2):
+        self.runner = runner
+        self.slots = asyncio.Semaphore(limit)
+        self.in_flight = {}
+
+    async def submit(self, since, requester):
+        """Queue (or join) the run for a date and wait for its ReportRun."""
+        run = self.in_flight.get(since)
+        if run is not None:
+            run.requesters.append(requester)
+        else:
+            run = ReportRun(since, requester)
+            self.in_flight[since] = run
+            run.task = asyncio.create_task(self._run(run))
+        # Shielded so one requester's cancellation does not cancel the shared run
+        return await asyncio.shield(run.task)
+
+    async def _run(self, run):
+        try:
+            async with self.slots:
+                run.started = datetime.now()
+                await self.runner(run)
+                return run
+        finally:
+            run.finished = datetime.now()
+            self.in_flight.pop(run.since, None)
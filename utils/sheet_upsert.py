@@ -0,0 +1,74 @@
+# sheet_upsert.py
+from utils.row_index import partition_of
+
+
+def to_cell(value):
+    """Sheets cell payload for a raw (unparsed) value, like valueInputOption=RAW."""
+    value = str(value)
+    return {'userEnteredValue': {'stringValue': value}} if value != '' else {}
+
+
+class SheetUpserter:
+    """
+    Replaces whole date partitions of a sheet in one spreadsheets.batchUpdate:
+    range deletes for the rows the partition occupies, then the new rows.
+    Row positions come from the RowIndex, so the sheet itself is not read.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.sheet_ids = {}
+
+    def get_sheet_id(self, service, spreadsheet_id, sheet):
+        """Numeric sheetId for a sheet title, looked up once."""
+        if sheet not in self.sheet_ids:
+            res = service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id, fields='sheets.properties(sheetId,title)'
+            ).execute()
+            for item in res.get('sheets', []):
+                props = item['properties']
+                self.sheet_ids[props['title']] = props['sheetId']
+        return self.sheet_ids[sheet]
+
+    def upsert(self, service, spreadsheet_id, sheet, header, rows, replace=True):
+        """
+        Replace every partition present in rows, or with replace=False add
+        the rows to them, as for the later batches of one partition. The
+        header is written only when the sheet has none. Returns the number
+        of data rows written.
+        """
+        self.index.sync(service, spreadsheet_id, sheet)
+        sheet_id = self.get_sheet_id(service, spreadsheet_id, sheet)
+
+        partitions = list(dict.fromkeys(partition_of(r) for r in rows)) if replace else []
+        spans = [span for p in partitions for span in self.index.spans(sheet, p)]
+        requests = [
+            {'deleteDimension': {'range': {
+                'sheetId': sheet_id, 'dimension': 'ROWS',
+                'startIndex': start_row - 1, 'endIndex': start_row - 1 + row_count,
+            }}}
+            for start_row, row_count in sorted(spans, reverse=True)
+        ]
+
+        to_append = list(rows)
+        if header and not self.index.spans(sheet, partition_of(header)):
+            to_append.insert(0, header)
+        if to_append:
+            requests.append({'appendCells': {
+                'sheetId': sheet_id,
+                'rows': [{'values': [to_cell(v) for v in r]} for r in to_append],
+                'fields': 'userEnteredValue',
+            }})
+        if not requests:
+            return 0
+
+        service.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id, body={'requests': requests}
+        ).execute()
+
+        for partition in partitions:
+            self.index.drop_partition(sheet, partition)
+        self.index.record_append(sheet, to_append)
+        print(f"Upserted {len(rows)} rows into '{sheet}' "
+              f"({len(spans)} ranges replaced in one batchUpdate).")
+        return len(rows)
@@ -0,0 +1,263 @@
+# sinks.py
+import abc
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+from itertools import islice
+
+from utils.metrics import METRICS
+
+
+def quote_identifier(name):
+    """Quote a column or table name for SQLite."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class Sink(abc.ABC):
+    """
+    Destination for one report stream (a source and day). The fan-out calls
+    open(header), then write(rows) per batch, then close(), whose return
+    value is the sink's result; abort() runs instead of close() on failure.
+    """
+
+    name = 'sink'
+
+    async def open(self, header):
+        self.header = header
+
+    @abc.abstractmethod
+    async def write(self, rows):
+        """Store one batch of rows."""
+
+    async def close(self):
+        return None
+
+    async def abort(self):
+        pass
+
+
+class CsvSink(Sink):
+    """Report CSV with a header row; the file appears only once it is complete."""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.count = 0
+
+    async def open(self, header):
+        await super().open(header)
+        await asyncio.to_thread(self._open)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path + '.tmp', 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.header)
+
+    async def write(self, rows):
+        await asyncio.to_thread(self.writer.writerows, rows)
+        self.count += len(rows)
+
+    async def close(self):
+        """Path of the CSV, or None when the stream had no rows."""
+        return await asyncio.to_thread(self._close)
+
+    def _close(self):
+        self.file.close()
+        if not self.count:
+            os.remove(self.path + '.tmp')
+            return None
+        os.replace(self.path + '.tmp', self.path)
+        return self.path
+
+    async def abort(self):
+        await asyncio.to_thread(self._abort)
+
+    def _abort(self):
+        if getattr(self, 'file', None):
+            self.file.close()
+        if os.path.exists(self.path + '.tmp'):
+            os.remove(self.path + '.tmp')
+
+
+class JsonlSink(CsvSink):
+    """One JSON object per row, keyed by column name."""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path + '.tmp', 'w', encoding='utf-8')
+
+    async def write(self, rows):
+        await asyncio.to_thread(self.file.writelines, [
+            json.dumps(dict(zip(self.header, row)), ensure_ascii=False) + '\n' for row in rows
+        ])
+        self.count += len(rows)
+
+
+class SqliteSink(Sink):
+    """
+    Rows of one day in a table named after the source. The day is cleared
+    when the stream opens, so a rerun replaces it; values keep their types.
+    """
+
+    def __init__(self, name, path, table, day):
+        self.name = name
+        self.path = path
+        self.table = table
+        self.day = day
+        self.count = 0
+
+    async def open(self, header):
+        await super().open(header)
+        await asyncio.to_thread(self._open)
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        columns = ', '.join(quote_identifier(c) for c in self.header)
+        table = quote_identifier(self.table)
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_identifier(self.table + '_day')} "
+                f"ON {table} ({quote_identifier(self.header[0])})"
+            )
+            self.conn.execute(f"DELETE FROM {table} WHERE {quote_identifier(self.header[0])}=?", (self.day,))
+        self.insert = (f"INSERT INTO {table} ({columns}) "
+                       f"VALUES ({', '.join('?' * len(self.header))})")
+
+    async def write(self, rows):
+        await asyncio.to_thread(self._write, rows)
+        self.count += len(rows)
+
+    def _write(self, rows):
+        with self.conn:
+            self.conn.executemany(self.insert, rows)
+
+    async def close(self):
+        """Number of rows stored."""
+        await asyncio.to_thread(self.conn.close)
+        return self.count
+
+    async def abort(self):
+        if getattr(self, 'conn', None):
+            await asyncio.to_thread(self.conn.close)
+
+
+class BufferedSink(Sink):
+    """
+    Hands the stream to `flush` (a coroutine function) in batches of
+    `batch_size` rows, as flush(header, rows, first), so at most one batch
+    is held. The first batch replaces the day at the destination and later
+    ones add to it; for destinations written in large requests, like Sheets.
+    A stream that fails midway leaves the batches already flushed, until a
+    rerun replaces the day.
+    """
+
+    def __init__(self, name, flush, batch_size=5000):
+        self.name = name
+        self.flush = flush
+        self.batch_size = batch_size
+        self.rows = []
+        self.batches = 0
+        self.written = 0
+
+    async def write(self, rows):
+        self.rows.extend(rows)
+        while len(self.rows) >= self.batch_size:
+            batch, self.rows = self.rows[:self.batch_size], self.rows[self.batch_size:]
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        written = await self.flush(self.header, batch, not self.batches)
+        self.batches += 1
+        self.written += len(written)
+
+    async def close(self):
+        """Number of rows `flush` reports written; a stream without rows is not flushed."""
+        if self.rows:
+            batch, self.rows = self.rows, []
+            await self._flush(batch)
+        return self.written
+
+
+class SinkFanout:
+    """
+    Publishes one stream of rows to several sinks at once. Each sink drains
+    its own bounded queue of batches in a separate task, so sinks run
+    concurrently and the publisher only waits when a queue is full. A sink
+    that fails is aborted and its queue is drained without writing, so it
+    never holds up the publisher or the other sinks.
+    """
+
+    def __init__(self, sinks, header, batch_size=500, queue_size=8):
+        self.sinks = list(sinks)
+        self.header = header
+        self.batch_size = batch_size
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in self.sinks]
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [
+            asyncio.create_task(self.consume(sink, queue))
+            for sink, queue in zip(self.sinks, self.queues)
+        ]
+
+    async def publish(self, rows):
+        """Split rows (any iterable) into batches and queue each batch for every sink."""
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            await asyncio.gather(*(queue.put(batch) for queue in self.queues))
+
+    async def finish(self):
+        """Signal the end of the stream; returns {sink name: result or exception}."""
+        await asyncio.gather(*(queue.put(None) for queue in self.queues))
+        results = await asyncio.gather(*self.tasks)
+        return {sink.name: result for sink, result in zip(self.sinks, results)}
+
+    async def abort(self):
+        """Stop every sink without completing the stream."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for sink in self.sinks:
+            try:
+                await sink.abort()
+            except Exception as e:
+                print(f"Sink '{sink.name}' abort failed: {e}")
+
+    async def consume(self, sink, queue):
+        error = None
+        try:
+            await sink.open(self.header)
+        except Exception as e:
+            error = e
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            if error is not None:
+                continue
+            try:
+                with METRICS.span('sink_write', sink=sink.name):
+                    await sink.write(batch)
+                METRICS.inc('rows', len(batch), stage='sink_write', sink=sink.name)
+            except Exception as e:
+                error = e
+        if error is None:
+            try:
+                with METRICS.span('sink_close', sink=sink.name):
+                    return await sink.close()
+            except Exception as e:
+                error = e
+        METRICS.inc('sink_errors', sink=sink.name)
+        print(f"Sink '{sink.name}' failed: {error}")
+        try:
+            await sink.abort()
+        except Exception as e:
+            print(f"Sink '{sink.name}' abort failed: {e}")
+        return error
@@ -0,0 +1,48 @@
+# streaming.py
+import asyncio
+import threading
+
+_END = object()
+
+
+async def iterate_in_thread(make_iterator, queue_size=4):
+    """
+    Run a blocking iterator (built by `make_iterator`) in a worker thread and
+    yield its items here as they are produced. The thread waits while
+    `queue_size` items are unconsumed, so a slow consumer bounds memory;
+    closing the generator early stops the thread after its current item.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        error = None
+        try:
+            for item in make_iterator():
+                put((item, None))
+                if stop.is_set():
+                    break
+        except Exception as e:
+            error = e
+        put((_END, error))
+
+    worker = asyncio.ensure_future(asyncio.to_thread(produce))
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        # Make room for a put the worker may be blocked on, until it exits
+        while not worker.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
@@ -0,0 +1,46 @@
+# throttled_api.py
+from facebook_business.api import FacebookAdsApi
+from facebook_business.exceptions import FacebookRequestError
+
+from utils.metrics import METRICS
+from utils.rate_control import is_throttle_error
+
+
+class ThrottledAdsApi(FacebookAdsApi):
+    """
+    FacebookAdsApi whose calls all pass through a RateController: every
+    request waits for a slot, every response's usage headers feed the
+    controller, and rate-limited requests are retried once the controller's
+    pause is over instead of failing.
+    """
+
+    def __init__(self, session, rate, max_throttle_retries=8, **kwargs):
+        super().__init__(session, **kwargs)
+        self.rate = rate
+        self.max_throttle_retries = max_throttle_retries
+
+    def call(self, method, path, params=None, headers=None, files=None,
+             url_override=None, api_version=None):
+        retries = 0
+        while True:
+            self.rate.acquire()
+            try:
+                response = super().call(
+                    method, path, params=params, headers=headers, files=files,
+                    url_override=url_override, api_version=api_version
+                )
+            except FacebookRequestError as e:
+                self.rate.release()
+                if not is_throttle_error(e) or retries >= self.max_throttle_retries:
+                    self.rate.observe(e.http_headers())
+                    raise
+                retries += 1
+                self.rate.throttled(e.http_headers())
+                METRICS.inc('throttled', api='meta')
+                continue
+            except BaseException:
+                self.rate.release()
+                raise
+            self.rate.release()
+            self.rate.observe(response.headers())
+            return response